@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Song Index Benchmark for Mr. Sarcastic
+Compares the per-request filter-and-shuffle lookup with the precomputed
+per-mood index on a synthetic catalog
+"""
+
+import argparse
+import random
+import time
+
+import simple_ml_backend as backend
+
+SONG_MOODS = ['Happy', 'Sad', 'Angry', 'Chill', 'Relaxed', 'Energetic', 'Focus']
+
+
+def make_catalog(size):
+    """Generate a synthetic catalog shaped like backend/data/songs.json"""
+    rng = random.Random(42)
+    return [
+        {
+            'id': f"song_{i}",
+            'title': f"Synthetic Track {i}",
+            'artist': f"Artist {i % 5000}",
+            'mood': rng.choice(SONG_MOODS),
+            'duration': f"{rng.randint(2, 6)}:{rng.randint(0, 59):02d}",
+            'youtubeUrl': f"https://youtube.com/watch?v=synthetic{i}",
+            'thumbnail': f"https://i.ytimg.com/vi/synthetic{i}/hqdefault.jpg"
+        }
+        for i in range(size)
+    ]
+
+
+def legacy_get_songs_by_mood(songs, mood, limit=3):
+    """The original implementation: filter the whole catalog, then shuffle"""
+    target_moods = backend.MOOD_MAPPING.get(mood.lower(), backend.DEFAULT_SONG_MOODS)
+    matching_songs = [song for song in songs if song.get('mood') in target_moods]
+    random.shuffle(matching_songs)
+    return matching_songs[:limit]
+
+
+def run(size, requests):
+    catalog = make_catalog(size)
+    moods = list(backend.MOOD_MAPPING) + ['unknown']
+    queries = [moods[i % len(moods)] for i in range(requests)]
+
+    start = time.perf_counter()
+    for mood in queries:
+        legacy_get_songs_by_mood(catalog, mood)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    backend.SONG_DATA.current = backend.SongLibrary(catalog)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for mood in queries:
+        backend.get_songs_by_mood(mood)
+    indexed = time.perf_counter() - start
+
+    print(f"🎵 Catalog: {size} songs, {requests} requests")
+    print(f"   Filter + shuffle: {legacy / requests * 1e6:10.1f} µs/request")
+    print(f"   Indexed sample:   {indexed / requests * 1e6:10.1f} µs/request")
+    print(f"   Index build:      {build * 1000:10.1f} ms (once per catalog load)")
+    print(f"   Speedup:          {legacy / indexed:10.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark mood-to-song lookups")
+    parser.add_argument("--songs", type=int, default=100000, help="Synthetic catalog size")
+    parser.add_argument("--requests", type=int, default=200, help="Number of lookups to time")
+    args = parser.parse_args()
+
+    run(args.songs, args.requests)
@@ -6,6 +6,7 @@ Integrates with fine-tuned Mistral/Falcon models for superior sarcasm
 
 import os
 import sys
+import asyncio
 import logging
 import json
 import time
@@ -13,16 +14,22 @@ from typing import Optional, Dict, List, Any
 from contextlib import asynccontextmanager
 
 # Add ml directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml'))
+ML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ml')
+sys.path.append(ML_DIR)
+
+from keyword_classifier import KeywordClassifier
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 import uvicorn
 
 # Import our enhanced model service
 try:
     from enhanced_model_service import EnhancedSarcasticModel
+    from adapter_serving import AdapterPool, MicroBatcher
+    from lora_adapters import is_adapter_dir
     MODEL_SERVICE_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: Enhanced model service not available: {e}")
@@ -39,6 +46,10 @@ logger = logging.getLogger(__name__)
 model_service = None
 current_model_path = None
 model_info = {}
+# LoRA adapters served on top of the resident base model
+adapter_pool = None
+batcher = None
+default_adapter = None
 
 # Pydantic models
 class ChatRequest(BaseModel):
@@ -47,6 +58,7 @@ class ChatRequest(BaseModel):
     conversation_history: Optional[List[Dict[str, str]]] = []
     temperature: Optional[float] = Field(default=0.8, ge=0.1, le=2.0)
     max_length: Optional[int] = Field(default=150, ge=50, le=500)
+    adapter: Optional[str] = Field(default=None, max_length=100)  # persona / sarcasm level adapter name
 
 class ChatResponse(BaseModel):
     response: str
@@ -81,9 +93,13 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting ML Backend Service...")
     await initialize_model()
+    if batcher:
+        batcher.start()
     yield
     # Shutdown
     logger.info("Shutting down ML Backend Service...")
+    if batcher:
+        await batcher.stop()
 
 # Create FastAPI app
 app = FastAPI(
@@ -107,7 +123,7 @@ SERVICE_START_TIME = time.time()
 
 async def initialize_model():
     """Initialize the model service"""
-    global model_service, model_info
+    global model_service, model_info, adapter_pool, batcher
     
     if not MODEL_SERVICE_AVAILABLE:
         logger.warning("Model service not available - using fallback responses")
@@ -120,15 +136,22 @@ async def initialize_model():
         logger.info(f"Initializing model service with {default_model}")
         model_service = EnhancedSarcasticModel(default_model)
         
-        # Check for fine-tuned models in the ml directory
-        ml_dir = os.path.join(os.path.dirname(__file__), '..', 'ml')
-        fine_tuned_dirs = [d for d in os.listdir(ml_dir) 
-                          if d.startswith('fine_tuned_') and os.path.isdir(os.path.join(ml_dir, d))]
+        # Adapters (ml/adapters/<name>, adapter fine_tuned_* dirs) share the base model
+        adapter_pool = AdapterPool(model_service)
+        batcher = MicroBatcher(adapter_pool)
+        adapters = adapter_pool.discover()
+        if adapters:
+            logger.info(f"Found adapters: {adapters}")
+        
+        # Check for fully fine-tuned models in the ml directory
+        fine_tuned_dirs = [d for d in os.listdir(ML_DIR) 
+                          if d.startswith('fine_tuned_') and os.path.isdir(os.path.join(ML_DIR, d))
+                          and not is_adapter_dir(os.path.join(ML_DIR, d))]
         
         if fine_tuned_dirs:
             # Use the most recent fine-tuned model
-            fine_tuned_dirs.sort(key=lambda x: os.path.getctime(os.path.join(ml_dir, x)), reverse=True)
-            latest_model = os.path.join(ml_dir, fine_tuned_dirs[0])
+            fine_tuned_dirs.sort(key=lambda x: os.path.getctime(os.path.join(ML_DIR, x)), reverse=True)
+            latest_model = os.path.join(ML_DIR, fine_tuned_dirs[0])
             
             logger.info(f"Found fine-tuned model: {latest_model}")
             global current_model_path
@@ -143,25 +166,19 @@ async def initialize_model():
         logger.error(f"Failed to initialize model service: {e}")
         model_service = None
 
+MOOD_CLASSIFIER = KeywordClassifier({
+    'sad': ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset', 'feel bad', 'lonely', 'hurt*'],
+    'happy': ['happy', 'excited', 'joy', 'great', 'awesome', 'fantastic', 'good', 'amazing', 'wonderful'],
+    'angry': ['angry', 'mad', 'furious', 'hate*', 'annoyed', 'pissed', 'damn*', 'frustrated', 'irritated'],
+    'bored': ['bored', 'boring', 'dull', 'nothing to do', 'tired', 'meh', 'whatever', 'blah'],
+    'curious': ['what*', 'how', 'why', 'when', 'where', 'explain', 'tell me', 'curious', 'wonder*'],
+    'confused': ['confused', 'don\'t understand', 'what do you mean', 'huh', 'unclear', 'lost'],
+    'stressed': ['stressed', 'overwhelmed', 'pressure', 'anxious', 'worried', 'panic*', 'tension']
+}, default='neutral')
+
 def detect_mood(message: str) -> str:
     """Enhanced mood detection"""
-    message_lower = message.lower()
-    
-    mood_keywords = {
-        'sad': ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset', 'feel bad', 'lonely', 'hurt'],
-        'happy': ['happy', 'excited', 'joy', 'great', 'awesome', 'fantastic', 'good', 'amazing', 'wonderful'],
-        'angry': ['angry', 'mad', 'furious', 'hate', 'annoyed', 'pissed', 'damn', 'frustrated', 'irritated'],
-        'bored': ['bored', 'boring', 'dull', 'nothing to do', 'tired', 'meh', 'whatever', 'blah'],
-        'curious': ['what', 'how', 'why', 'when', 'where', 'explain', 'tell me', 'curious', 'wonder'],
-        'confused': ['confused', 'don\'t understand', 'what do you mean', 'huh', 'unclear', 'lost'],
-        'stressed': ['stressed', 'overwhelmed', 'pressure', 'anxious', 'worried', 'panic', 'tension']
-    }
-    
-    for mood, keywords in mood_keywords.items():
-        if any(keyword in message_lower for keyword in keywords):
-            return mood
-    
-    return 'neutral'
+    return MOOD_CLASSIFIER.classify(message)
 
 def generate_fallback_response(message: str, mood: str) -> str:
     """Generate fallback responses when ML model is not available"""
@@ -225,6 +242,15 @@ async def chat(request: ChatRequest):
     """Generate sarcastic response to user message"""
     start_time = time.time()
     
+    adapter = request.adapter or default_adapter
+    if request.adapter and (adapter_pool is None or request.adapter not in adapter_pool.adapters):
+        raise HTTPException(status_code=404, detail=f"Unknown adapter: {request.adapter}")
+    if adapter and current_model_path:
+        # Adapters need the base model; swapping it with the full model per request
+        # would reload weights on every switch
+        raise HTTPException(status_code=409, detail=f"Adapters are not served while the fully fine-tuned model "
+                                                    f"{current_model_path} is selected; load an adapter or a base model first")
+    
     try:
         # Detect mood
         mood = detect_mood(request.message)
@@ -232,21 +258,26 @@ async def chat(request: ChatRequest):
         # Generate response
         if model_service and MODEL_SERVICE_AVAILABLE:
             try:
-                # Load model if not loaded
-                if not model_service.is_loaded:
-                    logger.info("Loading model for first use...")
-                    model_service.load_model()
-                
-                # Generate response using fine-tuned model if available
-                response_text = model_service.generate_sarcastic_response(
-                    user_message=request.message,
-                    model_path=current_model_path,
-                    max_length=request.max_length,
-                    temperature=request.temperature
-                )
+                if adapter or not current_model_path:
+                    # Batched with concurrent requests for the same adapter (or the plain
+                    # base model) on the shared resident base model
+                    response_text = await batcher.submit(
+                        request.message,
+                        adapter=adapter,
+                        max_length=request.max_length,
+                        temperature=request.temperature
+                    )
+                    source = "ml_adapter" if adapter else "ml_base"
+                else:
+                    # Generate response using the fully fine-tuned model (loaded once),
+                    # in a worker thread so the event loop keeps serving
+                    response_text = await asyncio.get_running_loop().run_in_executor(
+                        None, generate_fine_tuned, request.message, current_model_path,
+                        request.max_length, request.temperature
+                    )
+                    source = "ml_fine_tuned"
                 
                 confidence = 0.9
-                source = "ml_fine_tuned" if current_model_path else "ml_base"
                 
             except Exception as e:
                 logger.error(f"ML generation failed: {e}")
@@ -264,7 +295,8 @@ async def chat(request: ChatRequest):
         current_model_info = {
             "model_available": model_service is not None,
             "using_fine_tuned": current_model_path is not None,
-            "model_path": current_model_path
+            "model_path": current_model_path,
+            "adapter": adapter
         }
         
         if model_service:
@@ -283,10 +315,20 @@ async def chat(request: ChatRequest):
         logger.error(f"Chat endpoint error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def generate_fine_tuned(message: str, model_path: str, max_length: int = 150, temperature: float = 0.8) -> str:
+    """Generate with a fully fine-tuned model; the pool lock keeps batched adapter generation out meanwhile"""
+    with adapter_pool.lock:
+        return model_service.generate_sarcastic_response(
+            user_message=message,
+            model_path=model_path,
+            max_length=max_length,
+            temperature=temperature
+        )
+
 @app.post("/load-model")
 async def load_model(model_key: str = "mistral-7b"):
-    """Load a different base model"""
-    global model_service, model_info
+    """Load a different base model (and serve it instead of any fine-tuned model)"""
+    global model_service, model_info, adapter_pool, batcher, current_model_path
     
     if not MODEL_SERVICE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Model service not available")
@@ -296,6 +338,14 @@ async def load_model(model_key: str = "mistral-7b"):
         model_service = EnhancedSarcasticModel(model_key)
         model_service.load_model()
         model_info = model_service.get_model_info()
+        current_model_path = None
+        if adapter_pool:
+            # Registered adapters stay available; they must match the new base model
+            adapter_pool.attach(model_service)
+        else:
+            adapter_pool = AdapterPool(model_service)
+            adapter_pool.discover()
+            batcher = MicroBatcher(adapter_pool)
         
         return {"status": "success", "model_info": model_info}
         
@@ -305,8 +355,8 @@ async def load_model(model_key: str = "mistral-7b"):
 
 @app.post("/load-fine-tuned-model")
 async def load_fine_tuned_model(model_path: str):
-    """Load a specific fine-tuned model"""
-    global current_model_path
+    """Load a specific fine-tuned model, or register an adapter and make it the default"""
+    global current_model_path, default_adapter
     
     if not MODEL_SERVICE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Model service not available")
@@ -314,16 +364,28 @@ async def load_fine_tuned_model(model_path: str):
     if not os.path.exists(model_path):
         raise HTTPException(status_code=404, detail=f"Model path not found: {model_path}")
     
+    if adapter_pool and is_adapter_dir(model_path):
+        # No model load: the adapter is attached on first use and switching is cheap
+        name = os.path.basename(os.path.normpath(model_path))
+        try:
+            adapter_pool.register(name, model_path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Serving adapters means serving the base model again
+        current_model_path = None
+        default_adapter = name
+        logger.info(f"Adapter registered as default: {name} ({model_path})")
+        return {"status": "success", "model_path": model_path, "adapter": name}
+    
     try:
-        # Test loading the model
+        # Test loading the model (off the event loop)
         if model_service:
-            model_service.generate_sarcastic_response(
-                "test", 
-                model_path=model_path, 
-                max_length=50
+            await asyncio.get_running_loop().run_in_executor(
+                None, generate_fine_tuned, "test", model_path, 50
             )
         
         current_model_path = model_path
+        default_adapter = None
         logger.info(f"Fine-tuned model loaded: {model_path}")
         
         return {"status": "success", "model_path": model_path}
@@ -343,11 +405,11 @@ async def list_models():
     # Find fine-tuned models
     fine_tuned_models = []
     try:
-        ml_dir = os.path.join(os.path.dirname(__file__), '..', 'ml')
-        if os.path.exists(ml_dir):
-            for item in os.listdir(ml_dir):
-                item_path = os.path.join(ml_dir, item)
-                if item.startswith('fine_tuned_') and os.path.isdir(item_path):
+        if os.path.exists(ML_DIR):
+            for item in os.listdir(ML_DIR):
+                item_path = os.path.join(ML_DIR, item)
+                is_adapter = MODEL_SERVICE_AVAILABLE and is_adapter_dir(item_path)
+                if item.startswith('fine_tuned_') and os.path.isdir(item_path) and not is_adapter:
                     # Check if it has the required model files
                     if any(f.endswith('.bin') or f.endswith('.safetensors') 
                           for f in os.listdir(item_path)):
@@ -362,19 +424,32 @@ async def list_models():
     return {
         "base_models": available_models,
         "fine_tuned_models": fine_tuned_models,
+        "adapters": adapter_pool.info()["adapters"] if adapter_pool else {},
+        "default_adapter": default_adapter,
         "current_model": current_model_path,
         "service_available": MODEL_SERVICE_AVAILABLE
     }
 
+@app.get("/adapters")
+async def list_adapters():
+    """Registered adapters, the ones currently loaded and serving stats"""
+    if not adapter_pool:
+        raise HTTPException(status_code=503, detail="Model service not available")
+    
+    if adapter_pool.discover():
+        logger.info(f"Registered new adapters: {list(adapter_pool.adapters)}")
+    return {**adapter_pool.info(), "default_adapter": default_adapter}
+
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {"error": "Endpoint not found", "detail": str(exc)}
+    detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+    return JSONResponse(status_code=404, content={"error": "Endpoint not found", "detail": detail})
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
     logger.error(f"Internal server error: {exc}")
-    return {"error": "Internal server error", "detail": "Something went wrong on our end"}
+    return JSONResponse(status_code=500, content={"error": "Internal server error", "detail": "Something went wrong on our end"})
 
 if __name__ == "__main__":
     import argparse
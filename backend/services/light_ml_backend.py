@@ -6,7 +6,6 @@ Simple FastAPI service with basic sarcastic response generation
 
 import os
 import sys
-import json
 import random
 import time
 from typing import Dict, List, Optional, Any
@@ -22,10 +21,30 @@ except ImportError as e:
     print("💡 Install with: pip install fastapi uvicorn")
     sys.exit(1)
 
+# Shared classifiers live in the repository's ml directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ml'))
+from keyword_classifier import KeywordClassifier
+from data_reloader import DataReloader
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keyword tables compiled once; categories are checked in priority order
+INTENT_CLASSIFIER = KeywordClassifier({
+    'greeting': ['hi', 'hello', 'hey', 'greetings'],
+    'identity': ['who are you', 'what are you', 'who is', 'what is bot', 'favorite color', 'about you'],
+    'confusion': ['what are you talking about', 'confused', 'makes no sense', 'understand*'],
+    'questions': ['?']
+}, default='general')
+
+MOOD_CLASSIFIER = KeywordClassifier({
+    'angry': ['angry', 'mad', 'furious', 'hate*', 'annoyed'],
+    'happy': ['happy', 'excited', 'joy', 'great', 'awesome'],
+    'sad': ['sad', 'depressed', 'down', 'unhappy'],
+    'bored': ['bored', 'boring', 'meh', 'whatever']
+}, default='neutral')
+
 app = FastAPI(title="Mr. Sarcastic Light ML Backend", version="1.0.0")
 
 # Add CORS middleware
@@ -59,28 +78,41 @@ class LightSarcasticBot:
     def __init__(self):
         self.start_time = time.time()
         self.responses_loaded = False
-        self.sarcastic_responses = {}
+        responses_file = os.path.join(os.path.dirname(__file__), "sarcastic_responses.json")
+        self.responses_data = DataReloader(responses_file, self._validate_responses,
+                                           default=self._builtin_responses())
         self.load_responses()
     
+    @property
+    def sarcastic_responses(self) -> Dict[str, List[str]]:
+        """The live response bank (swapped atomically on reload)"""
+        return self.responses_data.current
+    
     def load_responses(self):
         """Load sarcastic responses from JSON file"""
-        try:
-            responses_file = os.path.join(os.path.dirname(__file__), "sarcastic_responses.json")
-            if os.path.exists(responses_file):
-                with open(responses_file, 'r', encoding='utf-8') as f:
-                    self.sarcastic_responses = json.load(f)
-                self.responses_loaded = True
-                logger.info(f"✅ Loaded {len(self.sarcastic_responses)} response categories")
-            else:
-                logger.warning("⚠️  No sarcastic_responses.json found, using built-in responses")
-                self._load_builtin_responses()
-        except Exception as e:
-            logger.error(f"❌ Error loading responses: {e}")
-            self._load_builtin_responses()
+        if self.responses_data.check():
+            logger.info(f"✅ Loaded {len(self.sarcastic_responses)} response categories")
+        elif self.responses_data.last_error:
+            logger.error(f"❌ Error loading responses: {self.responses_data.last_error}")
+            logger.info("✅ Loaded built-in responses")
+        else:
+            logger.warning("⚠️  No sarcastic_responses.json found, using built-in responses")
+            logger.info("✅ Loaded built-in responses")
+        self.responses_loaded = True
+    
+    @staticmethod
+    def _validate_responses(data: Any) -> Dict[str, List[str]]:
+        """Reject response banks that would break generate_response"""
+        if not isinstance(data, dict) or not data.get("general"):
+            raise ValueError("responses must be an object with a non-empty 'general' category")
+        if not all(isinstance(responses, list) and responses for responses in data.values()):
+            raise ValueError("every response category must be a non-empty list")
+        return data
     
-    def _load_builtin_responses(self):
-        """Load built-in sarcastic responses"""
-        self.sarcastic_responses = {
+    @staticmethod
+    def _builtin_responses() -> Dict[str, List[str]]:
+        """Built-in sarcastic responses"""
+        return {
             "greeting": [
                 "Oh, a greeting! How refreshingly original. Hi there, I'm Mr. Sarcastic, your AI companion with trust issues and a dark sense of humor.",
                 "Well, well, well... another human seeking digital validation. Hello! I'm Mr. Sarcastic, ready to chat and judge your life choices.",
@@ -107,45 +139,14 @@ class LightSarcasticBot:
                 "I understand you about as well as you understand yourself - which is to say, we're both winging it."
             ]
         }
-        self.responses_loaded = True
-        logger.info("✅ Loaded built-in responses")
     
     def detect_intent(self, message: str) -> str:
         """Detect user intent from message"""
-        message_lower = message.lower().strip()
-        
-        # Greeting patterns
-        if any(word in message_lower for word in ['hi', 'hello', 'hey', 'greetings']):
-            return "greeting"
-        
-        # Identity/who questions
-        if any(phrase in message_lower for phrase in ['who are you', 'what are you', 'who is', 'what is bot', 'favorite color', 'about you']):
-            return "identity"
-        
-        # Confusion patterns
-        if any(phrase in message_lower for phrase in ['what are you talking about', 'confused', 'makes no sense', 'understand']):
-            return "confusion"
-        
-        # Questions
-        if '?' in message:
-            return "questions"
-        
-        return "general"
+        return INTENT_CLASSIFIER.classify(message)
     
     def detect_mood(self, message: str) -> str:
         """Simple mood detection"""
-        message_lower = message.lower()
-        
-        if any(word in message_lower for word in ['angry', 'mad', 'furious', 'hate', 'annoyed']):
-            return "angry"
-        elif any(word in message_lower for word in ['happy', 'excited', 'joy', 'great', 'awesome']):
-            return "happy"
-        elif any(word in message_lower for word in ['sad', 'depressed', 'down', 'unhappy']):
-            return "sad"
-        elif any(word in message_lower for word in ['bored', 'boring', 'meh', 'whatever']):
-            return "bored"
-        else:
-            return "neutral"
+        return MOOD_CLASSIFIER.classify(message)
     
     def generate_response(self, message: str, user_id: str = None, conversation_history: List = None) -> Dict:
         """Generate a sarcastic response"""
@@ -154,8 +155,9 @@ class LightSarcasticBot:
         intent = self.detect_intent(message)
         mood = self.detect_mood(message)
         
-        # Get appropriate response category
-        response_category = self.sarcastic_responses.get(intent, self.sarcastic_responses["general"])
+        # Get appropriate response category (read the live bank once per request)
+        responses = self.sarcastic_responses
+        response_category = responses.get(intent, responses["general"])
         response_text = random.choice(response_category)
         
         generation_time = time.time() - start_time
@@ -176,6 +178,11 @@ class LightSarcasticBot:
 # Initialize the bot
 bot = LightSarcasticBot()
 
+@app.on_event("startup")
+async def start_data_reloader():
+    """Watch the response bank for changes while the service runs"""
+    bot.responses_data.start()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -191,7 +198,8 @@ async def health_check():
             "device": "cpu",
             "supports_fine_tuned": False,
             "response_categories": len(bot.sarcastic_responses)
-        }
+        },
+        "data_reload": bot.responses_data.stats()
     }
 
 @app.post("/chat")
@@ -5,6 +5,7 @@ HTTP server with context awareness and song suggestions
 """
 
 import json
+import math
 import random
 import time
 import os
@@ -13,28 +14,77 @@ from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import threading
 import logging
+import sys
+from collections import OrderedDict
+
+# Shared classifiers live in the repository's ml directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ml'))
+from keyword_classifier import KeywordClassifier, MOOD_KEYWORDS
+from data_reloader import DataReloader
+from song_catalog import SongCatalog, ChainedSequence
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load songs data
-SONGS = []
+# Songs data (hot-reloaded by SONG_DATA below)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+# Go up to backend directory, then to data folder
+songs_path = os.path.join(script_dir, '..', 'data', 'songs.json')
+# A compiled catalog (ml/song_catalog.py) next to songs.json takes precedence
+catalog_path = os.path.join(script_dir, '..', 'data', 'songs.cat')
+
+# Optional learned mood model, consulted when no mood keyword matches
+MOOD_MODEL = None
+MOOD_MODEL_MIN_CONFIDENCE = 0.6
 try:
-    # Get the directory of this script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    # Go up to backend directory, then to data folder
-    songs_path = os.path.join(script_dir, '..', 'data', 'songs.json')
-    with open(songs_path, 'r', encoding='utf-8') as f:
-        SONGS = json.load(f)
-    print(f"[OK] Loaded {len(SONGS)} songs from playlist")
+    from mood_model import MoodModel, DEFAULT_MODEL_PATH
+    if os.path.exists(DEFAULT_MODEL_PATH):
+        MOOD_MODEL = MoodModel.load(DEFAULT_MODEL_PATH)
+        print(f"[OK] Loaded mood model with labels {MOOD_MODEL.labels}")
 except Exception as e:
-    print(f"[ERROR] Error loading songs: {e}")
-    SONGS = []
+    print(f"[WARN] Mood model not available: {e}")
+
+# Optional content-based song search (needs numpy); mood buckets are the fallback
+RECOMMENDER_MIN_SCORE = 0.55
+try:
+    from song_recommender import SongRecommender
+except Exception as e:
+    SongRecommender = None
+    print(f"[WARN] Song recommender not available: {e}")
 
 # Conversation history storage (simple in-memory)
 CONVERSATION_HISTORY = {}
 
+# Keyword tables compiled once; categories are checked in priority order
+INTENT_CLASSIFIER = KeywordClassifier({
+    'song_request': [
+        'suggest*', 'recommend*', 'song*', 'music', 'playlist*', 'listen*', 'track*',
+        'what should i listen', 'what to listen', 'play something', 'any songs'
+    ],
+    'greeting': ['hi', 'hello', 'hey', 'greetings'],
+    'identity': ['who are you', 'what are you', 'who is', 'what is bot', 'favorite color', 'about you'],
+    'confusion': ['what are you talking about', 'confused', 'makes no sense', 'understand*'],
+    'questions': ['?']
+}, default='general')
+
+MOOD_CLASSIFIER = KeywordClassifier(MOOD_KEYWORDS, default='neutral')
+
+SONG_REQUEST_CLASSIFIER = KeywordClassifier({
+    'song_request': [
+        'suggest some songs', 'recommend songs', 'any songs', 'play something',
+        'what should i listen', 'music recommendation*', 'suggest music',
+        'recommend music', 'songs for', 'music for', 'playlist*', 'track*',
+        'i want to listen', 'what to listen'
+    ]
+})
+
+# A mood word together with a music word also counts as a song request
+MOOD_MUSIC_CLASSIFIER = KeywordClassifier({
+    'mood': ['sad', 'happy', 'angry', 'bored', 'energetic', 'chill'],
+    'music': ['song*', 'music']
+})
+
 # Response data
 RESPONSES = {
     "greeting": [
@@ -70,29 +120,196 @@ RESPONSES = {
     ]
 }
 
-def get_songs_by_mood(mood, limit=3):
+# Map detected moods to song moods
+MOOD_MAPPING = {
+    'sad': ['Sad'],
+    'happy': ['Happy'],
+    'angry': ['Angry'], 
+    'bored': ['Chill', 'Relaxed'],
+    'energetic': ['Energetic'],
+    'chill': ['Chill', 'Relaxed'],
+    'focus': ['Focus'],
+    'relaxed': ['Relaxed'],
+    'neutral': ['Happy', 'Energetic', 'Chill']
+}
+DEFAULT_SONG_MOODS = ['Happy', 'Energetic']
+
+def build_song_index(songs):
+    """Group songs into one bucket per detected mood so requests never scan the catalog"""
+    if isinstance(songs, SongCatalog):
+        # Catalog rows are already grouped by mood; buckets are lazy views
+        def bucket(target_moods):
+            return ChainedSequence([songs.by_mood(target) for target in target_moods])
+    else:
+        by_song_mood = {}
+        for song in songs:
+            by_song_mood.setdefault(song.get('mood'), []).append(song)
+        
+        def bucket(target_moods):
+            return [song for target in target_moods for song in by_song_mood.get(target, [])]
+    
+    index = {mood: bucket(target_moods) for mood, target_moods in MOOD_MAPPING.items()}
+    index[None] = bucket(DEFAULT_SONG_MOODS)
+    return index
+
+class SongRotation:
+    """
+    Per-user, per-mood no-repeat rotation over shuffled mood buckets
+    
+    Each mood bucket gets one shared shuffled permutation of its positions
+    (so catalog-backed buckets are never materialised). A cursor is just an
+    affine step ``(a * i + b) mod n`` over that permutation plus a count of
+    songs served: it starts at a random offset with step 1, so the next k
+    songs cost O(k). When a cursor has seen the whole bucket it draws a new
+    random step and offset (``a`` coprime to ``n``, so every song still
+    comes once per cycle) instead of materialising a reshuffled copy, which
+    keeps wrap-arounds O(1) and cursors a few integers each. Songs picked
+    earlier in the same call are skipped. Cursors live in a bounded LRU.
+    """
+    
+    def __init__(self, index, max_cursors=10000):
+        self.max_cursors = max_cursors
+        self.lock = threading.Lock()
+        self.cursors = OrderedDict()  # (user_id, mood) -> [step, offset, served]
+        self.reshuffles = 0
+        self.set_index(index)
+    
+    def set_index(self, index):
+        """Replace the catalog; existing cursors belong to the old one and are dropped"""
+        permutations = {}
+        for mood, bucket in index.items():
+            permutation = list(range(len(bucket)))
+            random.shuffle(permutation)
+            permutations[mood] = tuple(permutation)
+        
+        with self.lock:
+            self.buckets = index
+            self.permutations = permutations
+            self.cursors.clear()
+    
+    def next_songs(self, user_id, mood, limit=3):
+        """Return the user's next `limit` songs for a mood bucket"""
+        with self.lock:
+            shared = self.permutations.get(mood)
+            if not shared:
+                return []
+            
+            size = len(shared)
+            key = (user_id, mood)
+            cursor = self.cursors.pop(key, None) or [1, random.randrange(size), 0]
+            
+            picked = []
+            while len(picked) < min(limit, size):
+                if cursor[2] >= size:
+                    # Wrapped around: everything has been served once; walk the
+                    # bucket in a new order
+                    cursor = [self._random_step(size), random.randrange(size), 0]
+                    self.reshuffles += 1
+                step, offset, served = cursor
+                position = shared[(step * served + offset) % size]
+                cursor[2] += 1
+                if position not in picked:
+                    picked.append(position)
+            
+            self.cursors[key] = cursor
+            while len(self.cursors) > self.max_cursors:
+                self.cursors.popitem(last=False)
+            
+            bucket = self.buckets[mood]
+            return [bucket[position] for position in picked]
+    
+    @staticmethod
+    def _random_step(size):
+        """Random step coprime to size, so the affine walk visits every position once"""
+        if size <= 2:
+            return 1
+        while True:
+            step = random.randrange(1, size)
+            if math.gcd(step, size) == 1:
+                return step
+    
+    def stats(self):
+        with self.lock:
+            return {
+                "active_cursors": len(self.cursors),
+                "max_cursors": self.max_cursors,
+                "reshuffles": self.reshuffles
+            }
+
+class SongLibrary:
+    """
+    Snapshot of the catalog plus everything derived from it, swapped as one reference
+    
+    The song recommender's matrix takes a while on big catalogs, so it is
+    built on a background thread; until it is ready requests use the mood
+    rotation.
+    """
+    
+    def __init__(self, songs):
+        if not isinstance(songs, (list, SongCatalog)):
+            raise ValueError("songs.json must contain a list of songs")
+        self.songs = songs
+        self.index = build_song_index(songs)
+        self.rotation = SongRotation(self.index)
+        self.recommender = None
+        self.recommender_ready = threading.Event()
+        if SongRecommender is not None and len(songs):
+            threading.Thread(target=self._build_recommender, name='song-recommender', daemon=True).start()
+        else:
+            self.recommender_ready.set()
+    
+    def _build_recommender(self):
+        try:
+            self.recommender = SongRecommender(self.songs)
+        except Exception as e:
+            logger.error(f"Song recommender build failed: {e}")
+        finally:
+            self.recommender_ready.set()
+    
+    def recommender_stats(self):
+        if self.recommender is not None:
+            return self.recommender.stats()
+        return {"building": not self.recommender_ready.is_set()}
+
+if os.path.exists(catalog_path):
+    # Memory-mapped in place; write_catalog replaces it by rename and records a content digest
+    SONG_DATA = DataReloader(catalog_path, SongLibrary, default=SongLibrary([]), name='songs.cat',
+                             load=SongCatalog.open)
+else:
+    SONG_DATA = DataReloader(songs_path, SongLibrary, default=SongLibrary([]), name='songs.json')
+if SONG_DATA.check():
+    print(f"[OK] Loaded {len(SONG_DATA.current.songs)} songs from playlist")
+else:
+    print(f"[ERROR] Error loading songs: {SONG_DATA.last_error or 'file not found'}")
+
+def get_songs_by_mood(mood, limit=3, user_id=None):
     """Get songs matching the detected mood"""
-    # Map detected moods to song moods
-    mood_mapping = {
-        'sad': ['Sad'],
-        'happy': ['Happy'],
-        'angry': ['Angry'], 
-        'bored': ['Chill', 'Relaxed'],
-        'energetic': ['Energetic'],
-        'chill': ['Chill', 'Relaxed'],
-        'focus': ['Focus'],
-        'relaxed': ['Relaxed'],
-        'neutral': ['Happy', 'Energetic', 'Chill']
-    }
+    library = SONG_DATA.current
+    key = mood.lower() if mood.lower() in library.index else None
     
-    target_moods = mood_mapping.get(mood.lower(), ['Happy', 'Energetic'])
+    # Known users rotate through the bucket without repeats
+    if user_id is not None:
+        return library.rotation.next_songs(user_id, key, limit)
     
-    # Filter songs by mood
-    matching_songs = [song for song in SONGS if song.get('mood') in target_moods]
+    matching_songs = library.index[key]
     
-    # Shuffle and return limited number of songs
-    random.shuffle(matching_songs)
-    return matching_songs[:limit]
+    # random.sample only touches `limit` entries instead of shuffling the bucket
+    if len(matching_songs) <= limit:
+        songs = list(matching_songs)
+        random.shuffle(songs)
+        return songs
+    return random.sample(matching_songs, limit)
+
+def recommend_songs(message, mood, limit=3, user_id=None):
+    """Songs the message asks for by title, artist or mood words, else the mood rotation"""
+    library = SONG_DATA.current
+    if library.recommender is not None:
+        matches = library.recommender.top_k(message, limit)
+        # Mood words alone score below the threshold; those requests keep
+        # rotating through the mood bucket instead of repeating one top-k
+        if matches and matches[0][1] >= RECOMMENDER_MIN_SCORE:
+            return [library.songs[row] for row, _ in matches]
+    return get_songs_by_mood(mood, limit, user_id)
 
 def format_song_recommendations(songs, mood):
     """Format song recommendations with sarcastic flair"""
@@ -172,9 +389,12 @@ class SarcasticResponseHandler(BaseHTTPRequestHandler):
                     "device": "cpu",
                     "supports_fine_tuned": False,
                     "response_categories": len(RESPONSES),
-                    "songs_loaded": len(SONGS),
+                    "songs_loaded": len(SONG_DATA.current.songs),
                     "context_aware": True,
-                    "conversation_sessions": len(CONVERSATION_HISTORY)
+                    "conversation_sessions": len(CONVERSATION_HISTORY),
+                    "song_rotation": SONG_DATA.current.rotation.stats(),
+                    "song_recommender": SONG_DATA.current.recommender_stats(),
+                    "data_reload": SONG_DATA.stats()
                 }
             }
             self.wfile.write(json.dumps(response).encode())
@@ -217,7 +437,7 @@ class SarcasticResponseHandler(BaseHTTPRequestHandler):
                 
                 if is_song_request:
                     # Generate song recommendations
-                    songs = get_songs_by_mood(mood, 3)
+                    songs = recommend_songs(message, mood, 3, user_id)
                     intro = random.choice(RESPONSES["song_request"])
                     song_recommendations = format_song_recommendations(songs, mood)
                     response_text = f"{intro}\n\n{song_recommendations}"
@@ -239,7 +459,7 @@ class SarcasticResponseHandler(BaseHTTPRequestHandler):
                         "model_type": "contextual_pattern_matching",
                         "version": "2.0.0",
                         "loaded": True,
-                        "has_songs": len(SONGS) > 0,
+                        "has_songs": len(SONG_DATA.current.songs) > 0,
                         "context_aware": True
                     },
                     "generation_time": 0.001,
@@ -270,99 +490,25 @@ class SarcasticResponseHandler(BaseHTTPRequestHandler):
     
     def detect_intent(self, message, context=None):
         """Detect user intent from message with context awareness"""
-        message_lower = message.lower().strip()
-        
-        # Check recent context for better understanding
-        if context:
-            recent_messages = [entry['message'].lower() for entry in context[-3:]]
-            recent_context = ' '.join(recent_messages)
-        else:
-            recent_context = ""
-        
-        # Song/music request patterns (enhanced)
-        song_patterns = [
-            'suggest', 'recommend', 'song', 'music', 'playlist', 'listen', 'track',
-            'what should i listen', 'what to listen', 'play something', 'any songs'
-        ]
-        if any(pattern in message_lower for pattern in song_patterns):
-            return "song_request"
-        
-        # Greeting patterns
-        if any(word in message_lower for word in ['hi', 'hello', 'hey', 'greetings']):
-            return "greeting"
-        
-        # Identity/who questions
-        if any(phrase in message_lower for phrase in ['who are you', 'what are you', 'who is', 'what is bot', 'favorite color', 'about you']):
-            return "identity"
-        
-        # Confusion patterns
-        if any(phrase in message_lower for phrase in ['what are you talking about', 'confused', 'makes no sense', 'understand']):
-            return "confusion"
-        
-        # Questions
-        if '?' in message:
-            return "questions"
-        
-        return "general"
+        return INTENT_CLASSIFIER.classify(message)
     
     def detect_mood(self, message):
         """Enhanced mood detection"""
-        message_lower = message.lower()
-        
-        # Enhanced mood keywords
-        sad_keywords = ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset', 'lonely', 'blue', 'melancholy']
-        happy_keywords = ['happy', 'excited', 'joy', 'great', 'awesome', 'fantastic', 'good', 'cheerful', 'elated']
-        angry_keywords = ['angry', 'mad', 'furious', 'hate', 'annoyed', 'pissed', 'frustrated', 'irritated']
-        bored_keywords = ['bored', 'boring', 'dull', 'tired', 'meh', 'whatever', 'sleepy']
-        energetic_keywords = ['energetic', 'pumped', 'hyper', 'motivated', 'ready', 'workout', 'party']
-        chill_keywords = ['chill', 'relaxed', 'calm', 'peaceful', 'mellow', 'zen']
-        
-        if any(word in message_lower for word in sad_keywords):
-            return "sad"
-        elif any(word in message_lower for word in happy_keywords):
-            return "happy"
-        elif any(word in message_lower for word in angry_keywords):
-            return "angry"
-        elif any(word in message_lower for word in bored_keywords):
-            return "bored"
-        elif any(word in message_lower for word in energetic_keywords):
-            return "energetic"
-        elif any(word in message_lower for word in chill_keywords):
-            return "chill"
-        else:
-            return "neutral"
+        mood = MOOD_CLASSIFIER.classify(message)
+        if mood == 'neutral' and MOOD_MODEL is not None:
+            predicted, confidence = MOOD_MODEL.predict_one(message)
+            if confidence >= MOOD_MODEL_MIN_CONFIDENCE:
+                return predicted
+        return mood
     
     def is_song_request(self, message):
         """Check if the message is requesting song recommendations"""
-        message_lower = message.lower()
-        
-        # Direct song request patterns
-        song_request_patterns = [
-            'suggest some songs', 'recommend songs', 'any songs', 'play something',
-            'what should i listen', 'music recommendation', 'suggest music',
-            'recommend music', 'songs for', 'music for', 'playlist', 'track',
-            'i want to listen', 'what to listen'
-        ]
-        
         # Check for explicit song requests
-        if any(pattern in message_lower for pattern in song_request_patterns):
+        if SONG_REQUEST_CLASSIFIER.matches_any(message):
             return True
         
         # Check for mood + music combination
-        mood_music_patterns = [
-            ('sad', ['song', 'music']),
-            ('happy', ['song', 'music']),
-            ('angry', ['song', 'music']),
-            ('bored', ['song', 'music']),
-            ('energetic', ['song', 'music']),
-            ('chill', ['song', 'music'])
-        ]
-        
-        for mood, music_words in mood_music_patterns:
-            if mood in message_lower and any(word in message_lower for word in music_words):
-                return True
-        
-        return False
+        return {'mood', 'music'} <= MOOD_MUSIC_CLASSIFIER.labels(message)
     
     def generate_contextual_response(self, message, intent, mood, context):
         """Generate contextual responses based on conversation history"""
@@ -410,6 +556,7 @@ def run_server():
     """Run the HTTP server"""
     server_address = ('localhost', 8001)
     httpd = HTTPServer(server_address, SarcasticResponseHandler)
+    SONG_DATA.start()
     print("[START] Starting Mr. Sarcastic Simple ML Backend...")
     print("[INFO] Simple HTTP server with pattern matching")
     print("[READY] Ready for sarcastic conversations!")
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Adapter Serving for Mr. Sarcastic
+Serves many LoRA adapters (sarcasm levels, per-language personas, ...) from one
+resident base model: adapters are loaded on demand into a small LRU set and
+requests that share an adapter are generated together in one batch
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from lora_adapters import PEFT_MISSING, PeftModel, adapter_base_model, is_adapter_dir, unwrap_adapters
+
+logger = logging.getLogger(__name__)
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+# Adapters are looked up in ml/adapters/<name>/ and in ml/fine_tuned_*/ directories
+DEFAULT_ADAPTER_DIR = os.path.join(ML_DIR, 'adapters')
+DEFAULT_MAX_LOADED = 4
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 20
+
+
+def discover_adapters(*roots: str) -> Dict[str, str]:
+    """
+    Saved adapters under ``roots`` as {name: path}
+
+    ``<root>/<name>/`` is found as ``name``; the default roots are
+    ml/adapters and the ml directory itself (for fine_tuned_* outputs).
+    """
+    adapters = {}
+    for root in roots or (DEFAULT_ADAPTER_DIR, ML_DIR):
+        if not os.path.isdir(root):
+            continue
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name)
+            if os.path.isdir(path) and is_adapter_dir(path):
+                adapters.setdefault(name, path)
+    return adapters
+
+
+class AdapterPool:
+    """
+    Named LoRA adapters on the service's base model, at most ``max_loaded`` in memory
+
+    Adapters are attached to one ``PeftModel`` wrapping the base model and
+    switched with ``set_adapter``, which only changes which small matrices
+    the LoRA layers use. When a new adapter would exceed ``max_loaded`` the
+    least recently used one is deleted. ``adapter=None`` generates with the
+    plain base model. Adapters are only registered if they were trained on
+    the service's base model. If something else replaces the service's
+    model (e.g. a fully fine-tuned model loaded through
+    ``generate_sarcastic_response``), the pool reloads the base model
+    before serving adapters again; callers should treat that as an explicit
+    switch, not something mixed traffic does per request.
+    """
+
+    def __init__(self, service, max_loaded: int = DEFAULT_MAX_LOADED):
+        self.service = service
+        self.max_loaded = max(1, max_loaded)
+        self.adapters: Dict[str, str] = {}
+        self.loaded: "OrderedDict[str, None]" = OrderedDict()
+        self.model = None
+        self.stats = {'requests': 0, 'batches': 0, 'loads': 0, 'evictions': 0, 'hits': 0}
+        # Held while the service's model is in use; hold it to use the model directly
+        self.lock = threading.Lock()
+
+    def attach(self, service):
+        """Serve the registered adapters on another model service (drops adapters for other base models)"""
+        with self.lock:
+            self.service = service
+            self.model = None
+            self.loaded.clear()
+            for name, path in list(self.adapters.items()):
+                if not self.matches_base(path):
+                    del self.adapters[name]
+                    logger.info(f"Dropped adapter {name}: trained on {adapter_base_model(path)}, not {service.model_name}")
+
+    def matches_base(self, path: str) -> bool:
+        """True if the adapter at ``path`` was trained on the service's base model (or does not record one)"""
+        base = adapter_base_model(path)
+        return not base or base == self.service.model_name
+
+    def register(self, name: str, path: str):
+        if not is_adapter_dir(path):
+            raise ValueError(f"{path} is not a saved adapter (no adapter_config.json)")
+        if PeftModel is None:
+            raise ValueError(f"Cannot serve adapter {name}: {PEFT_MISSING}")
+        if not self.matches_base(path):
+            raise ValueError(f"Adapter {name} was trained on {adapter_base_model(path)}, "
+                             f"not on the served base model {self.service.model_name}")
+        with self.lock:
+            if self.adapters.get(name) not in (None, path) and name in self.loaded:
+                # Re-registered under a new path: drop the stale weights
+                self.model.delete_adapter(name)
+                del self.loaded[name]
+            self.adapters[name] = path
+
+    def discover(self, *roots: str) -> List[str]:
+        """Register every adapter found by ``discover_adapters`` that is not registered yet"""
+        found = []
+        for name, path in discover_adapters(*roots).items():
+            if name in self.adapters:
+                continue
+            try:
+                self.register(name, path)
+            except ValueError as e:
+                logger.warning(f"Skipping adapter: {e}")
+                continue
+            found.append(name)
+        return found
+
+    def _prepare(self):
+        """Make sure the service holds the base model (wrapped by this pool once an adapter is loaded)"""
+        service = self.service
+        if not service.is_loaded or (service.loaded_path is not None and not is_adapter_dir(service.loaded_path)):
+            service.load_model(force_reload=service.is_loaded)
+        if self.model is None or service.model is not self.model:
+            service.model, service.loaded_path = unwrap_adapters(service.model), None
+            self.model = None
+            self.loaded.clear()
+
+    def _activate(self, name: str):
+        if name in self.loaded:
+            self.loaded.move_to_end(name)
+            self.stats['hits'] += 1
+        else:
+            start = time.time()
+            path = self.adapters[name]
+            if self.model is None:
+                self.model = PeftModel.from_pretrained(self.service.model, path, adapter_name=name)
+                self.service.model = self.model
+            else:
+                self.model.load_adapter(path, adapter_name=name)
+            self.loaded[name] = None
+            self.stats['loads'] += 1
+            logger.info(f"Loaded adapter {name} in {time.time() - start:.2f}s")
+
+            # Evict after loading so the active adapter is never the one deleted
+            while len(self.loaded) > self.max_loaded:
+                evicted, _ = self.loaded.popitem(last=False)
+                self.model.delete_adapter(evicted)
+                self.stats['evictions'] += 1
+                logger.info(f"Evicted adapter {evicted}")
+        self.model.set_adapter(name)
+
+    def generate(self, adapter: Optional[str], messages: List[str], max_length: int = 150,
+                 temperature: float = 0.8) -> List[str]:
+        """Responses for ``messages`` from one adapter (None: the base model), in one batch"""
+        if adapter is not None and adapter not in self.adapters:
+            raise KeyError(f"Unknown adapter: {adapter}")
+        with self.lock:
+            self._prepare()
+            self.stats['requests'] += len(messages)
+            self.stats['batches'] += 1
+            if adapter is None:
+                if self.model is None:
+                    return self.service.generate_sarcastic_responses(messages, max_length, temperature)
+                with self.model.disable_adapter():
+                    return self.service.generate_sarcastic_responses(messages, max_length, temperature)
+            self._activate(adapter)
+            return self.service.generate_sarcastic_responses(messages, max_length, temperature)
+
+    def info(self) -> Dict:
+        with self.lock:
+            return {
+                'adapters': dict(self.adapters),
+                'loaded': list(self.loaded),
+                'max_loaded': self.max_loaded,
+                'stats': dict(self.stats)
+            }
+
+
+class MicroBatcher:
+    """
+    Collects chat requests for up to ``max_wait_ms`` and generates them in batches
+
+    Requests are grouped by (adapter, temperature); each group becomes one
+    ``AdapterPool.generate`` call of at most ``max_batch_size`` messages,
+    run in a worker thread so the event loop stays responsive. Groups run
+    one after another because they share one model. ``max_length`` may
+    differ within a group: the group generates up to the largest and each
+    response is cut to its own limit.
+    """
+
+    def __init__(self, pool: AdapterPool, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.pool = pool
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def submit(self, message: str, adapter: Optional[str] = None, max_length: int = 150,
+                     temperature: float = 0.8) -> str:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((adapter, temperature, max_length, message, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple]:
+        requests = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while True:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                requests.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return requests
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            groups: Dict[Tuple, List[Tuple]] = {}
+            for request in await self._collect():
+                groups.setdefault(request[:2], []).append(request)
+
+            for (adapter, temperature), requests in groups.items():
+                for start in range(0, len(requests), self.max_batch_size):
+                    batch = [request for request in requests[start:start + self.max_batch_size]
+                             if not request[4].done()]
+                    if not batch:
+                        continue
+                    max_length = max(request[2] for request in batch)
+                    try:
+                        responses = await loop.run_in_executor(
+                            None, self.pool.generate, adapter, [request[3] for request in batch],
+                            max_length, temperature)
+                    except Exception as e:
+                        for request in batch:
+                            if not request[4].done():
+                                request[4].set_exception(e)
+                        continue
+                    for request, response in zip(batch, responses):
+                        if not request[4].done():
+                            request[4].set_result(response[:request[2]])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the adapters the backend would serve")
+    parser.add_argument("roots", nargs="*", help="Directories to scan (default: ml/adapters and ml/)")
+    args = parser.parse_args()
+
+    adapters = discover_adapters(*args.roots)
+    print(f"🎭 {len(adapters)} adapters")
+    for name, path in adapters.items():
+        print(f"   {name}: {path}")
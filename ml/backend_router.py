@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+User-Affinity Router for Mr. Sarcastic
+Consistently hashes user_id onto a ring of local backend instances so every
+user keeps talking to the same process (and the same conversation_history)
+"""
+
+import argparse
+import bisect
+import hashlib
+import http.client
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Hop-by-hop headers must not be forwarded between connections
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length'
+}
+
+# Methods that may be sent twice (RFC 9110 9.2.2); anything else is only retried if it never left
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'TRACE', 'PUT', 'DELETE'}
+
+
+def _ring_hash(key: str) -> int:
+    """Stable 64-bit hash (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: Optional[List[str]] = None, vnodes: int = 160):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        self._keys: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes or []:
+            self.add(node)
+
+    def add(self, node: str):
+        """Add a node; only ~1/N of the keys move to it"""
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = _ring_hash(f"{node}#{i}")
+            index = bisect.bisect(self._keys, point)
+            self._keys.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str):
+        """Remove a node; only its keys move to the neighbouring nodes"""
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(k, o) for k, o in zip(self._keys, self._owners) if o != node]
+        self._keys = [k for k, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the node that owns key"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _ring_hash(key)) % len(self._keys)
+        return self._owners[index]
+
+    def copy(self) -> 'HashRing':
+        """Copy the ring so membership changes can be prepared off to the side"""
+        ring = HashRing(vnodes=self.vnodes)
+        ring.nodes = list(self.nodes)
+        ring._keys = list(self._keys)
+        ring._owners = list(self._owners)
+        return ring
+
+
+class ConnectionPool:
+    """Pool of keep-alive HTTP connections to one backend"""
+
+    def __init__(self, base_url: str, maxsize: int = 16, timeout: float = 60.0):
+        parsed = urlparse(base_url)
+        self.base_url = base_url
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=maxsize)
+        self.created = 0
+
+    @staticmethod
+    def _dropped(conn: http.client.HTTPConnection) -> bool:
+        """True if an idle connection is unusable: closed, or readable (EOF or stray bytes from the backend)"""
+        if conn.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """A connection and whether it was reused from the pool"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                self.created += 1
+                return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+            if not self._dropped(conn):
+                return conn, True
+            conn.close()
+
+    def _release(self, conn: http.client.HTTPConnection):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """
+        Send a request, retrying once if a pooled connection went stale
+
+        Idle connections the backend already closed are dropped before use.
+        If a reused connection still fails, the request is retried on a new
+        one only when it cannot have been processed twice: the method is
+        idempotent, or sending it failed so the backend never got it whole.
+        """
+        for attempt in range(2):
+            conn, reused = self._acquire()
+            sent = False
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._release(conn)
+                return response.status, response.getheaders(), data
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The backend closed a keep-alive connection; retry on a fresh one if that is safe
+                conn.close()
+                if attempt == 1 or not reused or (sent and method.upper() not in IDEMPOTENT_METHODS):
+                    raise
+            except Exception:
+                conn.close()
+                raise
+
+    def get_json(self, method: str, path: str, payload=None) -> Tuple[int, Dict]:
+        """Convenience wrapper for the router's own control calls"""
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        status, _, data = self.request(method, path, body, headers)
+        try:
+            return status, json.loads(data.decode('utf-8')) if data else {}
+        except ValueError:
+            return status, {}
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> Dict:
+        return {"idle_connections": self._idle.qsize(), "connections_created": self.created}
+
+
+class BackendRouter:
+    """Routes users to backends and moves their history when the ring changes"""
+
+    def __init__(self, backends: List[str], vnodes: int = 160, pool_size: int = 16,
+                 max_tracked_users: int = 100000):
+        self.ring = HashRing(backends, vnodes=vnodes)
+        self.pool_size = pool_size
+        self.pools = {url: ConnectionPool(url, pool_size) for url in backends}
+        self.max_tracked_users = max_tracked_users
+        # Recently seen users -> backend that holds their history (bounded LRU)
+        self.user_owners: 'OrderedDict[str, str]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.membership_lock = threading.Lock()
+        self.migrated_users = 0
+        self.last_rebalance = None
+
+    def route(self, user_id: str) -> Optional[str]:
+        backend = self.ring.get(user_id)
+        if backend is not None:
+            with self.lock:
+                self.user_owners[user_id] = backend
+                self.user_owners.move_to_end(user_id)
+                if len(self.user_owners) > self.max_tracked_users:
+                    self.user_owners.popitem(last=False)
+        return backend
+
+    def add_backend(self, url: str) -> Dict:
+        """Add a backend and pull the history of users that now hash to it"""
+        with self.membership_lock:
+            if url in self.ring.nodes:
+                return {"status": "unchanged", "backends": self.ring.nodes}
+            self.pools[url] = ConnectionPool(url, self.pool_size)
+            new_ring = self.ring.copy()
+            new_ring.add(url)
+            return self._rebalance(new_ring)
+
+    def remove_backend(self, url: str) -> Dict:
+        """Drain a backend by moving its users' history to their new owners"""
+        with self.membership_lock:
+            if url not in self.ring.nodes:
+                return {"status": "unchanged", "backends": self.ring.nodes}
+            new_ring = self.ring.copy()
+            new_ring.remove(url)
+            result = self._rebalance(new_ring)
+            pool = self.pools.pop(url, None)
+            if pool:
+                pool.close()
+            return result
+
+    def _rebalance(self, new_ring: HashRing) -> Dict:
+        start_time = time.time()
+        with self.lock:
+            tracked = list(self.user_owners.items())
+
+        moves = []
+        for user_id, old_owner in tracked:
+            new_owner = new_ring.get(user_id)
+            if new_owner and new_owner != old_owner:
+                moves.append((user_id, old_owner, new_owner))
+
+        # Copy history before switching so the new owner has context on the first request
+        migrated = 0
+        for user_id, old_owner, new_owner in moves:
+            if self._copy_history(user_id, old_owner, new_owner):
+                migrated += 1
+
+        self.ring = new_ring
+        with self.lock:
+            for user_id, _, new_owner in moves:
+                if user_id in self.user_owners:
+                    self.user_owners[user_id] = new_owner
+
+        # Only forget the old copy once traffic points at the new owner
+        for user_id, old_owner, _ in moves:
+            pool = self.pools.get(old_owner)
+            if pool:
+                try:
+                    pool.get_json('DELETE', f"/conversation/{user_id}")
+                except Exception as e:
+                    logger.warning(f"Could not clear {user_id} on {old_owner}: {e}")
+
+        self.migrated_users += migrated
+        self.last_rebalance = {
+            "moved_users": len(moves),
+            "migrated_histories": migrated,
+            "duration": time.time() - start_time,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        logger.info(f"Rebalanced ring: {self.last_rebalance}")
+        return {"status": "rebalanced", "backends": self.ring.nodes, **self.last_rebalance}
+
+    def _copy_history(self, user_id: str, old_owner: str, new_owner: str) -> bool:
+        source = self.pools.get(old_owner)
+        target = self.pools.get(new_owner)
+        if not source or not target:
+            return False
+        try:
+            status, data = source.get_json('GET', f"/conversation/{user_id}")
+            history = data.get('history') if status == 200 else None
+            if not history:
+                return False
+            status, _ = target.get_json('PUT', f"/conversation/{user_id}", {"history": history})
+            return status == 200
+        except Exception as e:
+            logger.warning(f"History migration failed for {user_id} ({old_owner} -> {new_owner}): {e}")
+            return False
+
+    def status(self) -> Dict:
+        return {
+            "backends": {url: self.pools[url].stats() for url in self.ring.nodes},
+            "tracked_users": len(self.user_owners),
+            "migrated_users": self.migrated_users,
+            "last_rebalance": self.last_rebalance
+        }
+
+
+def extract_user_id(path: str, body: bytes) -> Optional[str]:
+    """Find the user a request belongs to (URL path first, then JSON body)"""
+    parts = path.split('?')[0].strip('/').split('/')
+    if len(parts) == 2 and parts[0] == 'conversation':
+        return parts[1]
+    if body:
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return None
+        if isinstance(payload, dict):
+            # FastAPI backends use user_id, the simple backend uses userId
+            return payload.get('user_id') or payload.get('userId')
+    return None
+
+
+class RouterRequestHandler(BaseHTTPRequestHandler):
+    """Proxies requests to the backend that owns the user"""
+
+    protocol_version = 'HTTP/1.1'
+    router: BackendRouter = None
+
+    def do_GET(self):
+        if self.path == '/router/status':
+            self._send_json(200, self.router.status())
+        elif self.path == '/health':
+            self._send_json(200, {
+                "status": "healthy" if self.router.ring.nodes else "no_backends",
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "service_name": "Mr. Sarcastic Backend Router",
+                "backends": self.router.ring.nodes
+            })
+        else:
+            self._proxy()
+
+    def do_POST(self):
+        if self.path == '/router/backends':
+            url = self._read_json().get('url')
+            if not url:
+                self._send_json(400, {"error": "url is required"})
+                return
+            self._send_json(200, self.router.add_backend(url))
+        else:
+            self._proxy()
+
+    def do_DELETE(self):
+        if self.path == '/router/backends':
+            url = self._read_json().get('url')
+            if not url:
+                self._send_json(400, {"error": "url is required"})
+                return
+            self._send_json(200, self.router.remove_backend(url))
+        else:
+            self._proxy()
+
+    def do_PUT(self):
+        self._proxy()
+
+    def do_OPTIONS(self):
+        """Handle CORS preflight requests"""
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _read_json(self) -> Dict:
+        try:
+            return json.loads(self._read_body().decode('utf-8') or '{}')
+        except ValueError:
+            return {}
+
+    def _proxy(self):
+        body = self._read_body()
+        user_id = extract_user_id(self.path, body) or 'anonymous'
+        backend = self.router.route(user_id)
+        if backend is None:
+            self._send_json(503, {"error": "No backends available"})
+            return
+
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        try:
+            status, response_headers, data = self.router.pools[backend].request(
+                self.command, self.path, body or None, headers
+            )
+        except Exception as e:
+            logger.error(f"Backend {backend} failed for user {user_id}: {e}")
+            self._send_json(502, {"error": "Backend unavailable", "backend": backend})
+            return
+
+        self.send_response(status)
+        for key, value in response_headers:
+            if key.lower() not in HOP_BY_HOP_HEADERS:
+                self.send_header(key, value)
+        self.send_header('X-Routed-Backend', backend)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Override to reduce log noise"""
+        pass
+
+
+def run_router(backends: List[str], host: str = '0.0.0.0', port: int = 8000,
+               vnodes: int = 160, pool_size: int = 16):
+    """Run the router in front of the given backend URLs"""
+    RouterRequestHandler.router = BackendRouter(backends, vnodes=vnodes, pool_size=pool_size)
+    httpd = ThreadingHTTPServer((host, port), RouterRequestHandler)
+    httpd.daemon_threads = True
+
+    print("🔀 Starting Mr. Sarcastic Backend Router...")
+    for backend in backends:
+        print(f"   • {backend}")
+    print(f"📡 Router running on http://{host}:{port}")
+    print("=" * 60)
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Router stopped by user")
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="User-affinity router for Mr. Sarcastic backends")
+    parser.add_argument("--backend", "-b", action="append", default=[],
+                       help="Backend base URL (repeat for each instance)")
+    parser.add_argument("--host", default="0.0.0.0", help="Host to bind to")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind to")
+    parser.add_argument("--vnodes", type=int, default=160, help="Virtual nodes per backend")
+    parser.add_argument("--pool-size", type=int, default=16,
+                       help="Keep-alive connections kept per backend")
+
+    args = parser.parse_args()
+    run_router(args.backend or ["http://127.0.0.1:8001"], args.host, args.port,
+               args.vnodes, args.pool_size)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Song Categorizer Benchmark
+Compares per-song keyword scans with the batch categorizer on a synthetic
+playlist and checks that both pick the same mood for every song
+"""
+
+import argparse
+import random
+import time
+
+from playlist_extractor import YouTubeMusicPlaylistExtractor
+
+TITLE_WORDS = [
+    'love', 'night', 'heart', 'fire', 'rain', 'summer', 'blue', 'dream', 'city', 'light',
+    'girl', 'boy', 'road', 'home', 'forever', 'baby', 'tonight', 'golden', 'wild', 'stars',
+    'chill', 'lofi', 'dance', 'party', 'sad', 'tears', 'rock', 'metal', 'piano', 'acoustic',
+    'remix', 'soft', 'study', 'zen', 'sunshine', 'rage', 'slow', 'beat', 'peaceful', 'relaxing'
+]
+FILLER = ['the', 'my', 'of', 'in', 'you', 'we', 'me', 'and', 'feat.', '(official', 'video)', '-']
+
+
+def legacy_categorize_song(extractor, title, artist):
+    """The original per-song implementation"""
+    combined_text = f"{title} {artist}".lower()
+
+    for mood, keywords in extractor.mood_categories.items():
+        for keyword in keywords:
+            if keyword in combined_text:
+                return mood.title()
+
+    if any(word in combined_text for word in ['remix', 'dance', 'club', 'beat']):
+        return 'Energetic'
+    elif any(word in combined_text for word in ['ballad', 'slow', 'piano', 'violin']):
+        return 'Sad'
+    elif any(word in combined_text for word in ['acoustic', 'unplugged', 'soft']):
+        return 'Relaxed'
+    else:
+        return 'Happy'
+
+
+def make_playlist(size, seed=42):
+    """Synthetic (title, artist) pairs with a realistic repeated vocabulary"""
+    rng = random.Random(seed)
+    artists = [f"{rng.choice(TITLE_WORDS).title()} {rng.choice(['Band', 'Collective', 'Kid', 'Project', 'Sounds'])}"
+               for _ in range(20000)]
+    songs = []
+    for _ in range(size):
+        words = [rng.choice(TITLE_WORDS if rng.random() < 0.4 else FILLER) for _ in range(rng.randint(2, 7))]
+        songs.append((' '.join(words).title(), rng.choice(artists)))
+    return songs
+
+
+def run(size):
+    extractor = YouTubeMusicPlaylistExtractor()
+    songs = make_playlist(size)
+
+    start = time.perf_counter()
+    legacy = [legacy_categorize_song(extractor, title, artist) for title, artist in songs]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = extractor.categorize_songs(songs)
+    batch_time = time.perf_counter() - start
+
+    mismatches = sum(1 for old, (new, _) in zip(legacy, batch) if old != new)
+    counts = {}
+    for mood, _ in batch:
+        counts[mood] = counts.get(mood, 0) + 1
+
+    print(f"🎵 {size} songs")
+    print(f"   Per-song scans:   {legacy_time:8.2f}s ({legacy_time / size * 1e6:.2f} µs/song)")
+    print(f"   Batch categorize: {batch_time:8.2f}s ({batch_time / size * 1e6:.2f} µs/song, includes scores)")
+    print(f"   Speedup:          {legacy_time / batch_time:8.1f}x")
+    print(f"   Mismatches:       {mismatches}")
+    print(f"   Moods: {dict(sorted(counts.items()))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batch song mood categorization")
+    parser.add_argument("--songs", type=int, default=1000000, help="Synthetic playlist size")
+    args = parser.parse_args()
+
+    run(args.songs)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Text Sanitizer Benchmark
+Compares the old multi-pass cleaners with the single-pass sanitizer on the
+bundled sarcastic responses and on synthetic transcript text, and checks that
+every output is identical
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+
+from process_youtube_data import YouTubeHumorProcessor
+from text_sanitizer import response_sanitizer, transcript_sanitizer
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORDS = [
+    'time', 'travel', 'Einstein', 'figured', 'universe', 'stars', 'light', 'speed', 'you', 'your',
+    'fuck', 'Fuck', 'ass', 'ASS', 'dumbass', 'stupid', 'shit', 'Shit', 'fuck ass', 'stupid ass',
+    'dumb ass', 'asshole', 'shitty', '[Music]', '[Applause]', '[Laughter]', '[ __ ]', '12:34',
+    '[0:15]', '1:02:03', '[', ']', 'facts', 'about', 'this', 'is', 'real', 'ago', '...', '?', ','
+]
+SPACES = [' ', ' ', ' ', ' ', '  ', '\n', '\t', ' \n ']
+
+
+def legacy_clean_text(processor, text):
+    """The original YouTubeHumorProcessor.clean_text"""
+    text = re.sub(r'\s+', ' ', text).strip()
+    for starter in processor.sarcastic_starters:
+        if text.lower().startswith(starter.lower()):
+            text = text[len(starter):].strip()
+            break
+    replacements = {
+        r'\bfuck ass\b': '',
+        r'\bfuck\b': 'freakin',
+        r'\bdumbass\b': 'dummy',
+        r'\bstupid ass\b': 'silly',
+        r'\bshit\b': 'stuff',
+        r'\bass\b': '',
+    }
+    for pattern, replacement in replacements.items():
+        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+    text = re.sub(r'\s+', ' ', text).strip()
+    if text and not text[-1] in '.!?':
+        text += '.'
+    return text
+
+
+def legacy_clean_transcript(text):
+    """The original youtube_extractor YouTubeTranscriptExtractor.clean_transcript"""
+    if not text:
+        return ""
+    text = re.sub(r'\[\d+:\d+\]', '', text)
+    text = re.sub(r'\d+:\d+', '', text)
+    text = text.replace('[Music]', '')
+    text = text.replace('[Applause]', '')
+    text = text.replace('[Laughter]', '')
+    text = re.sub(r'\[.*?\]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def legacy_extract_sarcastic_response(text):
+    """The original EnhancedSarcasticModel._extract_sarcastic_response"""
+    text = text.strip()
+    prefixes_to_remove = [
+        "Oh wow, let me explain this sarcastically:",
+        "Here's the deal with this shit:",
+        "You know what's funny about this?",
+        "Let me break this down for you:"
+    ]
+    for prefix in prefixes_to_remove:
+        if text.startswith(prefix):
+            text = text[len(prefix):].strip()
+    text = text.replace("fuck ass", "").replace("dumbass", "dummy").replace("stupid ass", "silly")
+    return text[:200]
+
+
+def bundled_texts():
+    """Responses shipped in sarcastic_responses.json"""
+    with open(os.path.join(ML_DIR, 'sarcastic_responses.json'), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [text for value in data.values() if isinstance(value, list) for text in value if isinstance(text, str)]
+
+
+def synthetic_texts(size, starters, seed=42):
+    """Transcript-like text mixing starters, profanity, annotations and odd whitespace"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(size):
+        parts = []
+        if rng.random() < 0.3:
+            parts.append(rng.choice(starters))
+        for _ in range(rng.randint(5, 40)):
+            parts.append(rng.choice(WORDS))
+        text = ''.join(part + rng.choice(SPACES) for part in parts)
+        texts.append(rng.choice(['', ' ', '\n']) + text)
+    return texts
+
+
+def compare(name, legacy, sanitize, texts):
+    start = time.perf_counter()
+    expected = [legacy(text) for text in texts]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [sanitize(text) for text in texts]
+    new_time = time.perf_counter() - start
+
+    mismatches = [(text, old, new) for text, old, new in zip(texts, expected, actual) if old != new]
+    print(f"   {name:<22} legacy {legacy_time / len(texts) * 1e6:7.2f} µs  single-pass "
+          f"{new_time / len(texts) * 1e6:7.2f} µs  ({legacy_time / new_time:4.1f}x)  mismatches: {len(mismatches)}")
+    for text, old, new in mismatches[:3]:
+        print(f"      {text!r}\n        legacy: {old!r}\n        new:    {new!r}")
+    return len(mismatches)
+
+
+def run(size):
+    processor = YouTubeHumorProcessor()
+    sanitizer = transcript_sanitizer()
+    cleaners = [
+        ('clean_text', lambda text: legacy_clean_text(processor, text), processor.clean_text),
+        ('clean_transcript', legacy_clean_transcript, sanitizer.clean),
+        ('sarcastic_response', legacy_extract_sarcastic_response, response_sanitizer().clean),
+    ]
+
+    mismatches = 0
+    for label, texts in (('bundled responses', bundled_texts()),
+                         ('synthetic transcripts', synthetic_texts(size, processor.sarcastic_starters))):
+        print(f"🧽 {len(texts)} {label}")
+        for name, legacy, sanitize in cleaners:
+            mismatches += compare(name, legacy, sanitize, texts)
+
+    texts = synthetic_texts(size, processor.sarcastic_starters, seed=7)
+    start = time.perf_counter()
+    processor.sanitizer.clean_batch(texts)
+    print(f"🧽 clean_batch: {(time.perf_counter() - start) / len(texts) * 1e6:.2f} µs/text")
+    print("✅ Identical output" if not mismatches else f"❌ {mismatches} mismatches")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the single-pass text sanitizer")
+    parser.add_argument("--texts", type=int, default=100000, help="Synthetic texts to clean")
+    args = parser.parse_args()
+
+    run(args.texts)
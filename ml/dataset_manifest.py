@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Dataset Manifest for Mr. Sarcastic
+Records which videos a JSONL training file was built from, so adding a URL
+only processes that video and removing one only drops its lines
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+MANIFEST_VERSION = 1
+
+
+class DatasetManifest:
+    """
+    Per-video bookkeeping for an append-only JSONL dataset
+
+    Every active video owns one contiguous block of lines in the output file
+    (byte ``offset`` and ``length``, plus a SHA-256 ``content_hash`` of the
+    block). New videos are appended; removed videos are tombstoned in the
+    manifest and their blocks are dropped by copying the remaining blocks,
+    which needs no re-processing. The manifest is saved atomically after the
+    data file (and straight after every tombstone rewrite), ``prepare()``
+    truncates any lines appended after the last save and falls back to a
+    full build if a block no longer matches its hash, so an interrupted run
+    resumes cleanly.
+    """
+
+    def __init__(self, output_file: str, manifest_file: Optional[str] = None):
+        self.output_file = output_file
+        self.manifest_file = manifest_file or os.path.splitext(output_file)[0] + '.manifest.json'
+        self.videos: Dict[str, Dict] = {}
+        self.size = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_file):
+            return
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != MANIFEST_VERSION or data.get('output') != os.path.basename(self.output_file):
+            return
+        self.videos = data.get('videos', {})
+        self.size = data.get('size', 0)
+
+    def prepare(self, incremental: bool = True) -> bool:
+        """
+        Make the output file match the manifest; returns True if it is reusable
+
+        A full build (or an output file that is shorter than the manifest
+        says or whose blocks no longer match their hashes) starts from an
+        empty file and manifest.
+        """
+        actual = os.path.getsize(self.output_file) if os.path.exists(self.output_file) else -1
+        if incremental and actual >= self.size:
+            if actual > self.size:
+                # Lines appended by a run that died before saving the manifest
+                with open(self.output_file, 'r+b') as f:
+                    f.truncate(self.size)
+            if not self.verify():
+                return True
+
+        open(self.output_file, 'wb').close()
+        self.videos = {}
+        self.size = 0
+        return False
+
+    def active(self) -> Dict[str, Dict]:
+        return {video_id: entry for video_id, entry in self.videos.items() if entry['status'] == 'active'}
+
+    def plan(self, urls: List[str], video_id_of: Callable[[str], Optional[str]]) -> Tuple[List[str], List[str]]:
+        """
+        ``(urls to process, removed video ids)`` for the wanted URL list
+
+        Each new video is listed once; URLs without a video id are kept so
+        the caller reports them.
+        """
+        video_ids = {url: video_id_of(url) for url in urls}
+        active = self.active()
+        wanted = {video_id for video_id in video_ids.values() if video_id}
+
+        pending = []
+        seen = set()
+        for url in urls:
+            video_id = video_ids[url]
+            if video_id is None:
+                pending.append(url)
+            elif video_id not in active and video_id not in seen:
+                pending.append(url)
+                seen.add(video_id)
+        removed = [video_id for video_id in active if video_id not in wanted]
+        return pending, removed
+
+    def append(self, video_id: str, url: str, records: List[Dict], meta: Optional[Dict] = None):
+        """Append a video's records to the output file and record its block (``meta`` is kept alongside)"""
+        data = ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8')
+        with open(self.output_file, 'ab') as f:
+            f.write(data)
+        self.videos[video_id] = {
+            'url': url,
+            'status': 'active',
+            'offset': self.size,
+            'length': len(data),
+            'records': len(records),
+            'content_hash': hashlib.sha256(data).hexdigest(),
+            'added_at': round(time.time()),
+            'meta': meta or {}
+        }
+        self.size += len(data)
+
+    def tombstone(self, video_ids: Iterable[str]) -> int:
+        """Mark videos removed and drop their lines (saving the manifest); returns the number of records dropped"""
+        dropped = 0
+        for video_id in video_ids:
+            entry = self.videos.get(video_id)
+            if not entry or entry['status'] != 'active':
+                continue
+            entry['status'] = 'removed'
+            entry['removed_at'] = round(time.time())
+            dropped += entry['records']
+
+        stale = [entry for entry in self.videos.values() if entry['status'] == 'removed' and entry.get('length')]
+        if not stale:
+            return dropped
+
+        # Copy the surviving blocks in file order; positions shift down
+        tmp_file = f"{self.output_file}.tmp"
+        offset = 0
+        with open(self.output_file, 'rb') as src, open(tmp_file, 'wb') as dst:
+            for entry in self.active_in_order():
+                src.seek(entry['offset'])
+                dst.write(src.read(entry['length']))
+                entry['offset'] = offset
+                offset += entry['length']
+        os.replace(tmp_file, self.output_file)
+
+        for entry in stale:
+            entry['offset'] = None
+            entry['length'] = 0
+        self.size = offset
+        # Later appends land at the new offsets; a crash must not pair them with the old manifest
+        self.save()
+        return dropped
+
+    def verify(self) -> List[str]:
+        """Ids of active videos whose block no longer matches its content hash"""
+        corrupt = []
+        with open(self.output_file, 'rb') as f:
+            for video_id, entry in self.active().items():
+                f.seek(entry['offset'])
+                if hashlib.sha256(f.read(entry['length'])).hexdigest() != entry['content_hash']:
+                    corrupt.append(video_id)
+        return corrupt
+
+    def active_in_order(self) -> List[Dict]:
+        """Active entries in the order their lines appear in the output file"""
+        return sorted(self.active().values(), key=lambda entry: entry['offset'])
+
+    def total_records(self) -> int:
+        return sum(entry['records'] for entry in self.active().values())
+
+    def save(self):
+        data = {
+            'version': MANIFEST_VERSION,
+            'output': os.path.basename(self.output_file),
+            'size': self.size,
+            'updated_at': round(time.time()),
+            'videos': self.videos
+        }
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a dataset manifest")
+    parser.add_argument("output_file", help="JSONL dataset the manifest belongs to")
+    parser.add_argument("--verify", action="store_true", help="Check every block against its content hash")
+    args = parser.parse_args()
+
+    manifest = DatasetManifest(args.output_file)
+    active = manifest.active()
+    print(f"📒 {args.output_file}: {len(active)} videos, {manifest.total_records()} records, "
+          f"{len(manifest.videos) - len(active)} tombstoned")
+    if args.verify:
+        corrupt = manifest.verify()
+        print(f"❌ Corrupt blocks: {corrupt}" if corrupt else "✅ All blocks match their content hashes")
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Dataset Shards for Mr. Sarcastic
+Converts prepared training pairs (JSONL) into memory-mapped Arrow shards once,
+so training runs load them lazily instead of re-parsing the JSONL into RAM
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Iterator, List, Optional
+
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+FORMAT_VERSION = 1
+DEFAULT_ROWS_PER_SHARD = 500000
+DEFAULT_BATCH_ROWS = 10000
+
+
+def shard_dir_for(jsonl_path: str) -> str:
+    """Shard directory kept next to a JSONL file"""
+    return os.path.splitext(jsonl_path)[0] + '.shards'
+
+
+def _source_info(path: str) -> Dict:
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _read_batches(jsonl_path: str, batch_rows: int) -> Iterator[List[Dict]]:
+    batch = []
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            batch.append(json.loads(line))
+            if len(batch) >= batch_rows:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def read_index(shard_dir: str) -> Optional[Dict]:
+    path = os.path.join(shard_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('version') == FORMAT_VERSION else None
+
+
+def is_current(jsonl_path: str, shard_dir: str) -> bool:
+    """True if the shards were converted from the JSONL file as it is now"""
+    index = read_index(shard_dir)
+    return index is not None and index.get('source') == _source_info(jsonl_path)
+
+
+def convert_jsonl(jsonl_path: str, shard_dir: Optional[str] = None,
+                  rows_per_shard: int = DEFAULT_ROWS_PER_SHARD, batch_rows: int = DEFAULT_BATCH_ROWS) -> str:
+    """
+    Write a JSONL file as Arrow IPC stream shards plus an ``index.json``
+
+    The JSONL is read ``batch_rows`` records at a time, so conversion memory
+    does not grow with the file. The schema comes from the first batch; later
+    records missing a column get nulls and extra keys are dropped (counted in
+    the index). Shards are written to a temporary directory and swapped in
+    when complete.
+    """
+    shard_dir = shard_dir or shard_dir_for(jsonl_path)
+    tmp_dir = f"{shard_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    start = time.perf_counter()
+    source = _source_info(jsonl_path)
+    schema = None
+    shards = []
+    writer = None
+    shard_rows = 0
+    dropped_keys = 0
+
+    def close_shard():
+        nonlocal writer, shard_rows
+        if writer is not None:
+            writer.close()
+            shards[-1]['rows'] = shard_rows
+        writer, shard_rows = None, 0
+
+    try:
+        for records in _read_batches(jsonl_path, batch_rows):
+            if schema is None:
+                schema = pa.RecordBatch.from_pylist(records).schema
+            columns = set(schema.names)
+            dropped_keys += sum(1 for record in records for key in record if key not in columns)
+
+            offset = 0
+            while offset < len(records):
+                if writer is None:
+                    name = f"shard-{len(shards):05d}.arrow"
+                    shards.append({'file': name, 'rows': 0})
+                    writer = pa.ipc.new_stream(os.path.join(tmp_dir, name), schema)
+                take = min(len(records) - offset, rows_per_shard - shard_rows)
+                writer.write_batch(pa.RecordBatch.from_pylist(records[offset:offset + take], schema=schema))
+                offset += take
+                shard_rows += take
+                if shard_rows >= rows_per_shard:
+                    close_shard()
+        close_shard()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    index = {
+        'version': FORMAT_VERSION,
+        'source': source,
+        'columns': schema.names if schema is not None else [],
+        'rows': sum(shard['rows'] for shard in shards),
+        'shards': shards,
+        'dropped_keys': dropped_keys,
+        'converted_at': round(time.time())
+    }
+    with open(os.path.join(tmp_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.replace(tmp_dir, shard_dir)
+    logger.info(f"Converted {index['rows']} records from {jsonl_path} into {len(shards)} shards "
+                f"in {time.perf_counter() - start:.1f}s")
+    return shard_dir
+
+
+def load_shards(shard_dir: str):
+    """Memory-mapped ``datasets.Dataset`` over the shards (no rows are read until used)"""
+    from datasets import Dataset, concatenate_datasets
+
+    index = read_index(shard_dir)
+    if index is None:
+        raise FileNotFoundError(f"No dataset shards in {shard_dir}")
+    if not index['shards']:
+        return Dataset.from_dict({column: [] for column in index['columns']})
+    parts = [Dataset.from_file(os.path.join(shard_dir, shard['file'])) for shard in index['shards']]
+    return parts[0] if len(parts) == 1 else concatenate_datasets(parts)
+
+
+def load_training_dataset(path: str, rows_per_shard: int = DEFAULT_ROWS_PER_SHARD):
+    """
+    Training pairs from a shard directory or a JSONL file
+
+    A JSONL file is converted to ``<stem>.shards/`` the first time (and
+    whenever it changes); later runs just memory-map the shards.
+    """
+    if os.path.isdir(path):
+        return load_shards(path)
+    shard_dir = shard_dir_for(path)
+    if not is_current(path, shard_dir):
+        convert_jsonl(path, shard_dir, rows_per_shard)
+    return load_shards(shard_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Convert training pairs to memory-mapped Arrow shards")
+    parser.add_argument("path", help="JSONL file to convert, or a shard directory to inspect")
+    parser.add_argument("--output", "-o", help="Shard directory (default: <stem>.shards next to the JSONL)")
+    parser.add_argument("--rows-per-shard", type=int, default=DEFAULT_ROWS_PER_SHARD, help="Records per shard")
+    parser.add_argument("--force", action="store_true", help="Convert even if the shards are up to date")
+    args = parser.parse_args()
+
+    shard_dir = args.path
+    if not os.path.isdir(args.path):
+        shard_dir = args.output or shard_dir_for(args.path)
+        if args.force or not is_current(args.path, shard_dir):
+            convert_jsonl(args.path, shard_dir, args.rows_per_shard)
+        else:
+            print(f"✅ {shard_dir} is up to date")
+
+    index = read_index(shard_dir)
+    print(f"📦 {shard_dir}: {index['rows']} rows in {len(index['shards'])} shards, columns {index['columns']}")
@@ -7,10 +7,28 @@ import logging
 from typing import Optional, List, Dict
 import time
 
+from text_sanitizer import response_sanitizer
+from dataset_shards import load_training_dataset
+from tokenization_cache import TokenizationCache, render_prompts
+from length_bucketing import LENGTH_COLUMN, dataset_lengths, format_padding_report, padding_report, with_lengths
+from sequence_packing import (PackedCollator, format_packing_report, pack_dataset, packing_report,
+                              supports_block_diagonal_attention)
+from training_metrics import TrainingMetricsCallback
+from lora_adapters import (ADAPTER_LEARNING_RATE, add_lora_adapters, adapter_base_dtype, format_adapter_report,
+                           is_adapter_dir, load_adapter)
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+RESPONSE_SANITIZER = response_sanitizer()
+
+# Training prompt formats (part of the tokenization cache key)
+PROMPT_TEMPLATES = {
+    "mistral-7b": "<s>[INST] {instruction}\n{input} [/INST] {output}</s>",
+    "default": "{prompt}{completion}{eos_token}"
+}
+
 class EnhancedSarcasticModel:
     """
     Enhanced model service supporting multiple pre-trained models optimized for sarcasm and humor
@@ -44,13 +62,15 @@ class EnhancedSarcasticModel:
         }
     }
     
-    def __init__(self, model_key: str = "mistral-7b", device: Optional[str] = None):
+    def __init__(self, model_key: str = "mistral-7b", device: Optional[str] = None,
+                 tokenization_cache: Optional[TokenizationCache] = None):
         """
         Initialize the enhanced sarcastic model
         
         Args:
             model_key: Key from SUPPORTED_MODELS
             device: Device to load model on ('cuda', 'cpu', or 'auto')
+            tokenization_cache: Cache for tokenized training data (default location if None)
         """
         if model_key not in self.SUPPORTED_MODELS:
             raise ValueError(f"Model {model_key} not supported. Choose from: {list(self.SUPPORTED_MODELS.keys())}")
@@ -68,11 +88,14 @@ class EnhancedSarcasticModel:
         self.tokenizer = None
         self.model = None
         self.is_loaded = False
+        self.tokenization_cache = tokenization_cache or TokenizationCache()
+        # Fine-tuned model or adapter directory currently loaded (None: base model)
+        self.loaded_path: Optional[str] = None
         
         logger.info(f"Initialized {model_key} model service on device: {self.device}")
         
-    def load_model(self, force_reload: bool = False):
-        """Load the pretrained model and tokenizer"""
+    def load_model(self, force_reload: bool = False, torch_dtype: Optional[torch.dtype] = None):
+        """Load the pretrained model and tokenizer (torch_dtype overrides fp16 on GPU / fp32 on CPU)"""
         if self.is_loaded and not force_reload:
             logger.info("Model already loaded")
             return
@@ -94,7 +117,7 @@ class EnhancedSarcasticModel:
             # Load model with appropriate settings
             model_kwargs = {
                 "trust_remote_code": True,
-                "torch_dtype": torch.float16 if torch.cuda.is_available() else torch.float32,
+                "torch_dtype": torch_dtype or (torch.float16 if torch.cuda.is_available() else torch.float32),
                 "low_cpu_mem_usage": True
             }
             
@@ -114,6 +137,7 @@ class EnhancedSarcasticModel:
                 self.model = self.model.to(self.device)
             
             self.is_loaded = True
+            self.loaded_path = None
             load_time = time.time() - start_time
             
             logger.info(f"Model loaded successfully in {load_time:.2f}s")
@@ -194,26 +218,8 @@ class EnhancedSarcasticModel:
         return random.choice(common_inputs)
     
     def _extract_sarcastic_response(self, text: str) -> str:
-        """Extract and clean sarcastic response from YouTube text"""
-        # Clean up the text - remove excessive profanity while keeping the sarcastic tone
-        text = text.strip()
-        
-        # Remove repetitive sarcastic prefixes that are in the data
-        prefixes_to_remove = [
-            "Oh wow, let me explain this sarcastically:",
-            "Here's the deal with this shit:",
-            "You know what's funny about this?",
-            "Let me break this down for you:"
-        ]
-        
-        for prefix in prefixes_to_remove:
-            if text.startswith(prefix):
-                text = text[len(prefix):].strip()
-        
-        # Clean up excessive profanity but keep the sarcastic tone
-        text = text.replace("fuck ass", "").replace("dumbass", "dummy").replace("stupid ass", "silly")
-        
-        return text[:200]  # Limit response length
+        """Extract and clean sarcastic response from YouTube text (single pass, see RESPONSE_SANITIZER)"""
+        return RESPONSE_SANITIZER.clean(text)
     
     def _get_sarcastic_examples(self) -> List[Dict]:
         """Get additional high-quality sarcastic training examples"""
@@ -250,31 +256,55 @@ class EnhancedSarcasticModel:
         
         return examples
     
-    def fine_tune(self, training_data_path: str, output_dir: str = None, **training_args):
+    def fine_tune(self, training_data_path: str, output_dir: str = None, packing: bool = False,
+                  block_size: Optional[int] = None, adapter: bool = False, lora_config: Optional[Dict] = None,
+                  **training_args):
         """
         Fine-tune the model on sarcastic conversation data
         
         Args:
             training_data_path: Path to prepared training data
             output_dir: Directory to save the fine-tuned model
+            packing: Concatenate short pairs into blocks of block_size tokens
+                instead of one pair per row (attention kept within each pair where
+                the architecture accepts a 4D mask, plain EOS-separated packing otherwise)
+            block_size: Packed block size (default: the tokenization max_length)
+            adapter: Freeze the base model and train LoRA adapters only; the
+                output directory then holds just the adapter
+            lora_config: Overrides for lora_adapters.DEFAULT_LORA_CONFIG
             **training_args: Additional training arguments
         """
         if not self.is_loaded:
-            self.load_model()
+            # Frozen base weights can stay in 16-bit when only adapters train
+            self.load_model(torch_dtype=adapter_base_dtype() if adapter else None)
         
         if output_dir is None:
-            output_dir = f"./fine_tuned_{self.model_key}_sarcastic"
+            output_dir = f"./fine_tuned_{self.model_key}_sarcastic" + ("_adapter" if adapter else "")
+        
+        if adapter:
+            self.model = add_lora_adapters(self.model, **(lora_config or {}))
+            logger.info(f"LoRA adapters: {format_adapter_report(self.model)}")
         
         logger.info(f"Starting fine-tuning with data from {training_data_path}")
         
         # Load and prepare dataset
         train_dataset = self._load_training_dataset(training_data_path)
         
-        # Data collator
-        data_collator = DataCollatorForLanguageModeling(
-            tokenizer=self.tokenizer,
-            mlm=False
-        )
+        if packing:
+            block_size = block_size or min(512, self.model_config["max_length"] // 4)
+            lengths = dataset_lengths(train_dataset)
+            logger.info(f"Packing: {format_packing_report(packing_report(lengths, block_size))}")
+            block_diagonal = supports_block_diagonal_attention(self.model)
+            logger.info(f"Packed attention: {'per pair (block-diagonal mask)' if block_diagonal else 'EOS-separated'}")
+            train_dataset = pack_dataset(train_dataset, block_size, self.tokenizer.eos_token_id,
+                                         reset_positions=block_diagonal)
+            data_collator = PackedCollator(self.tokenizer.pad_token_id, block_diagonal=block_diagonal)
+        else:
+            # Data collator (pads each batch to its longest example)
+            data_collator = DataCollatorForLanguageModeling(
+                tokenizer=self.tokenizer,
+                mlm=False
+            )
         
         # Default training arguments optimized for sarcasm
         default_args = {
@@ -283,7 +313,7 @@ class EnhancedSarcasticModel:
             "gradient_accumulation_steps": 16,
             "warmup_steps": 100,
             "max_steps": 1000,
-            "learning_rate": 5e-5,
+            "learning_rate": ADAPTER_LEARNING_RATE if adapter else 5e-5,
             "fp16": torch.cuda.is_available(),
             "logging_steps": 50,
             "save_steps": 250,
@@ -291,11 +321,18 @@ class EnhancedSarcasticModel:
             "dataloader_drop_last": True,
             "evaluation_strategy": "no",
             "load_best_model_at_end": False,
+            # Batch examples of similar length so per-batch padding stays small
+            "group_by_length": True,
+            "length_column_name": LENGTH_COLUMN,
         }
         
         # Override with user-provided arguments
         default_args.update(training_args)
         
+        if not packing:
+            report = padding_report(dataset_lengths(train_dataset), default_args["per_device_train_batch_size"])
+            logger.info(f"Padding: {format_padding_report(report)}")
+        
         training_arguments = TrainingArguments(**default_args)
         
         # Create trainer
@@ -304,6 +341,8 @@ class EnhancedSarcasticModel:
             args=training_arguments,
             data_collator=data_collator,
             train_dataset=train_dataset,
+            # Throughput and memory per logging step, in output_dir/training_metrics.jsonl
+            callbacks=[TrainingMetricsCallback()],
         )
         
         # Start training
@@ -315,47 +354,46 @@ class EnhancedSarcasticModel:
         training_time = time.time() - start_time
         logger.info(f"Training completed in {training_time:.2f}s")
         
-        # Save model and tokenizer
+        # Save model (only the adapter weights in adapter mode) and tokenizer
         trainer.save_model(output_dir)
         self.tokenizer.save_pretrained(output_dir)
         
-        logger.info(f"Fine-tuned model saved to {output_dir}")
+        logger.info(f"Fine-tuned {'adapter' if adapter else 'model'} saved to {output_dir}")
         return output_dir
     
     def _load_training_dataset(self, data_path: str) -> Dataset:
-        """Load and tokenize training dataset"""
-        with open(data_path, 'r', encoding='utf-8') as f:
-            data = [json.loads(line) for line in f]
-        
-        dataset = Dataset.from_list(data)
+        """Load and tokenize training dataset (tokenized once per data file, tokenizer and template)"""
+        # Mistral uses its instruction format, other models prompt + completion
+        template = PROMPT_TEMPLATES.get(self.model_key, PROMPT_TEMPLATES["default"])
+        max_length = min(512, self.model_config["max_length"] // 4)
         
+        # Unpadded ids plus their length; the collator pads each batch to its longest example
         def tokenize_function(examples):
-            if self.model_key == "mistral-7b":
-                # Format for Mistral with instruction format
-                texts = []
-                for inst, inp, out in zip(examples['instruction'], examples['input'], examples['output']):
-                    text = f"<s>[INST] {inst}\n{inp} [/INST] {out}</s>"
-                    texts.append(text)
-            else:
-                # Standard format for other models
-                texts = []
-                for prompt, completion in zip(examples['prompt'], examples['completion']):
-                    text = prompt + completion + self.tokenizer.eos_token
-                    texts.append(text)
+            texts = render_prompts(examples, template, eos_token=self.tokenizer.eos_token)
             
-            return self.tokenizer(
+            return with_lengths(self.tokenizer(
                 texts,
                 truncation=True,
-                padding=True,
-                max_length=min(512, self.model_config["max_length"] // 4),
+                padding=False,
+                max_length=max_length,
                 return_tensors=None
+            ))
+        
+        def tokenize(cache_file_name):
+            # Memory-mapped Arrow shards, converted once per JSONL
+            dataset = load_training_dataset(data_path)
+            return dataset.map(
+                tokenize_function,
+                batched=True,
+                remove_columns=dataset.column_names,
+                cache_file_name=cache_file_name
             )
         
-        tokenized_dataset = dataset.map(
-            tokenize_function,
-            batched=True,
-            remove_columns=dataset.column_names
+        tokenized_dataset = self.tokenization_cache.get_or_tokenize(
+            data_path, self.tokenizer, template, max_length, tokenize,
+            truncation=True, padding=False
         )
+        logger.info(f"Tokenization cache: {self.tokenization_cache.stats()}")
         
         return tokenized_dataset
     
@@ -379,11 +417,7 @@ class EnhancedSarcasticModel:
         elif not self.is_loaded:
             self.load_model()
         
-        # Format prompt based on model type
-        if self.model_key == "mistral-7b":
-            formatted_prompt = f"<s>[INST] You are a sarcastic and humorous chatbot. Respond with wit and sarcasm.\n{user_message} [/INST]"
-        else:
-            formatted_prompt = f"User: {user_message}\nSarcastic Chatbot:"
+        formatted_prompt = self._format_prompt(user_message)
         
         # Tokenize input
         inputs = self.tokenizer.encode(formatted_prompt, return_tensors="pt")
@@ -407,8 +441,54 @@ class EnhancedSarcasticModel:
         
         # Decode and clean response
         response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        return self._extract_response(response, user_message, max_length)
+    
+    def generate_sarcastic_responses(self, user_messages: List[str], max_length: int = 150,
+                                     temperature: float = 0.8) -> List[str]:
+        """
+        Generate sarcastic responses for several messages in one batched generate call
+        
+        Uses whatever model is currently loaded (including an active adapter).
+        Prompts are left-padded so every sequence continues from its last token.
+        """
+        if not self.is_loaded:
+            self.load_model()
+        
+        padding_side = self.tokenizer.padding_side
+        self.tokenizer.padding_side = "left"
+        try:
+            inputs = self.tokenizer([self._format_prompt(message) for message in user_messages],
+                                    return_tensors="pt", padding=True)
+        finally:
+            self.tokenizer.padding_side = padding_side
+        inputs = inputs.to(self.model.device)
+        
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max_length,
+                num_return_sequences=1,
+                temperature=temperature,
+                do_sample=True,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id,
+                repetition_penalty=1.1,
+                top_k=50,
+                top_p=0.9
+            )
         
-        # Extract only the bot response
+        responses = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        return [self._extract_response(response, message, max_length)
+                for response, message in zip(responses, user_messages)]
+    
+    def _format_prompt(self, user_message: str) -> str:
+        """Format prompt based on model type"""
+        if self.model_key == "mistral-7b":
+            return f"<s>[INST] You are a sarcastic and humorous chatbot. Respond with wit and sarcasm.\n{user_message} [/INST]"
+        return f"User: {user_message}\nSarcastic Chatbot:"
+    
+    def _extract_response(self, response: str, user_message: str, max_length: int) -> str:
+        """Extract only the bot response from the decoded output"""
         if self.model_key == "mistral-7b":
             if "[/INST]" in response:
                 response = response.split("[/INST]")[-1].strip()
@@ -422,9 +502,20 @@ class EnhancedSarcasticModel:
         return response[:max_length]
     
     def _load_fine_tuned_model(self, model_path: str):
-        """Load a fine-tuned model"""
+        """Load a fine-tuned model, or a LoRA adapter on top of the base model"""
+        if self.is_loaded and self.loaded_path == model_path:
+            return
         logger.info(f"Loading fine-tuned model from {model_path}")
         
+        if is_adapter_dir(model_path):
+            # Adapters go on the base model, so drop a fully fine-tuned model first
+            full_model_loaded = self.loaded_path is not None and not is_adapter_dir(self.loaded_path)
+            self.load_model(force_reload=full_model_loaded, torch_dtype=adapter_base_dtype())
+            self.model = load_adapter(self.model, model_path)
+            self.loaded_path = model_path
+            logger.info("Fine-tuned adapter loaded successfully")
+            return
+        
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
         self.model = AutoModelForCausalLM.from_pretrained(
             model_path,
@@ -436,6 +527,7 @@ class EnhancedSarcasticModel:
             self.model = self.model.to(self.device)
         
         self.is_loaded = True
+        self.loaded_path = model_path
         logger.info("Fine-tuned model loaded successfully")
     
     @classmethod
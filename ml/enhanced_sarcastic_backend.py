@@ -16,6 +16,7 @@ import uvicorn
 from typing import List, Optional, Dict, Any
 import re
 import os
+from keyword_classifier import KeywordClassifier
 
 # Request/Response models
 class ChatRequest(BaseModel):
@@ -25,6 +26,9 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.9
     max_length: Optional[int] = 150
 
+class ConversationImport(BaseModel):
+    history: List[Dict[str, Any]] = []
+
 class ChatResponse(BaseModel):
     success: bool
     response: str
@@ -37,6 +41,23 @@ class ChatResponse(BaseModel):
 class SmartSarcasticBot:
     """Enhanced sarcastic chatbot with GPT-2 XL and intelligent prompt engineering"""
     
+    # Checked in priority order, first matching category wins
+    MOOD_CLASSIFIER = KeywordClassifier({
+        'greeting': ['hello', 'hi', 'hey', 'what\'s up', 'sup'],
+        'identity': ['who are you', 'what are you', 'who made you', 'creator*', 'who am i'],
+        'question': ['?', 'how', 'what', 'why', 'when', 'where'],
+        'friendship': ['friend*', 'like you', 'love you'],
+        'insult': ['shut up', 'fuck*', 'stupid', 'dumb', 'hate*'],
+        'angry': ['angry', 'mad', 'pissed', 'annoyed', 'frustrated'],
+        'confusion': ['understand*', 'talking about', 'mean*', 'confused']
+    }, default='default')
+    
+    TOPIC_CLASSIFIER = KeywordClassifier({
+        'friendship': ['friend*'],
+        'identity': ['who', 'identity', 'creator*'],
+        'help': ['help*', 'advice']
+    }, default='general')
+    
     def __init__(self):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model = None
@@ -102,8 +123,6 @@ class SmartSarcasticBot:
 
     def analyze_context(self, message, user_id=None, conversation_history=None):
         """Analyze the context and mood of the message"""
-        message_lower = message.lower().strip()
-        
         # Check conversation history for context
         context_info = {
             'is_continuation': False,
@@ -118,22 +137,7 @@ class SmartSarcasticBot:
                 context_info['previous_topic'] = recent_messages[-1].get('topic', 'general')
         
         # Mood detection with more nuance
-        if any(word in message_lower for word in ['hello', 'hi', 'hey', 'what\'s up', 'sup']):
-            mood = 'greeting'
-        elif any(word in message_lower for word in ['who are you', 'what are you', 'who made you', 'creator', 'who am i']):
-            mood = 'identity'
-        elif '?' in message or any(word in message_lower for word in ['how', 'what', 'why', 'when', 'where']):
-            mood = 'question'
-        elif any(word in message_lower for word in ['friend', 'friendship', 'like you', 'love you']):
-            mood = 'friendship'
-        elif any(word in message_lower for word in ['shut up', 'fuck', 'stupid', 'dumb', 'hate']):
-            mood = 'insult'
-        elif any(word in message_lower for word in ['angry', 'mad', 'pissed', 'annoyed', 'frustrated']):
-            mood = 'angry'
-        elif any(word in message_lower for word in ['understand', 'talking about', 'mean', 'confused']):
-            mood = 'confusion'
-        else:
-            mood = 'default'
+        mood = self.MOOD_CLASSIFIER.classify(message)
         
         return mood, context_info
 
@@ -286,15 +290,7 @@ class SmartSarcasticBot:
 
     def _extract_topic(self, message):
         """Extract main topic from message for context tracking"""
-        # Simple topic extraction - could be enhanced with NLP
-        if any(word in message.lower() for word in ['friend', 'friendship']):
-            return 'friendship'
-        elif any(word in message.lower() for word in ['who', 'identity', 'creator']):
-            return 'identity'
-        elif any(word in message.lower() for word in ['help', 'advice']):
-            return 'help'
-        else:
-            return 'general'
+        return self.TOPIC_CLASSIFIER.classify(message)
 
     def _fallback_response(self, message, start_time):
         """High-quality fallback responses when model fails"""
@@ -380,6 +376,12 @@ async def get_conversation_history(user_id: str):
     else:
         return {"history": []}
 
+@app.put("/conversation/{user_id}")
+async def import_conversation_history(user_id: str, request: ConversationImport):
+    """Replace a user's history (used by the router when a user moves between instances)"""
+    bot.conversation_history[user_id] = request.history
+    return {"message": f"Conversation history imported for {user_id}", "exchanges": len(request.history)}
+
 @app.delete("/conversation/{user_id}")
 async def clear_conversation_history(user_id: str):
     """Clear conversation history for a user"""
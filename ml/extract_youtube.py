@@ -7,13 +7,35 @@ Simple script to extract and prepare training data from YouTube videos
 import os
 import json
 import re
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 
+from transcript_cache import TranscriptCache, add_cache_arguments, cache_from_args
+from dataset_manifest import DatasetManifest
+from fetch_scheduler import (FetchScheduler, RetryBudgetExhausted, RetryQueue, add_scheduler_arguments,
+                             is_unavailable, scheduler_from_args, shared_scheduler)
+
+def extract_video_id(url: str) -> Optional[str]:
+    """Video ID from a youtu.be, watch?v= or shorts URL (None if unrecognised)"""
+    if "youtu.be/" in url:
+        return url.split("youtu.be/")[1].split("?")[0]
+    elif "youtube.com/watch?v=" in url:
+        return url.split("v=")[1].split("&")[0]
+    elif "youtube.com/shorts/" in url:
+        return url.split("shorts/")[1].split("?")[0]
+    return None
+
 class YouTubeTranscriptExtractor:
     """Extract and clean YouTube transcripts"""
 
-    def __init__(self):
+    def __init__(self, cache: Optional[TranscriptCache] = None, scheduler: Optional[FetchScheduler] = None):
         self.youtube_transcript_api = None
+        self.cache = cache
+        self.scheduler = scheduler or shared_scheduler()
+        # url -> RetryBudgetExhausted for videos still throttled when their retries ran out
+        self.throttled: Dict[str, RetryBudgetExhausted] = {}
 
     def load_api(self):
         """Load YouTube transcript API"""
@@ -28,37 +50,63 @@ class YouTubeTranscriptExtractor:
 
     def extract_transcript(self, url: str) -> Optional[Dict]:
         """Extract transcript from YouTube URL"""
-        if not self.youtube_transcript_api:
+        if not self.youtube_transcript_api and (self.cache is None or self.cache.mode != 'only'):
             return None
 
         try:
             # Extract video ID from various YouTube URL formats
-            if "youtu.be/" in url:
-                video_id = url.split("youtu.be/")[1].split("?")[0]
-            elif "youtube.com/watch?v=" in url:
-                video_id = url.split("v=")[1].split("&")[0]
-            elif "youtube.com/shorts/" in url:
-                video_id = url.split("shorts/")[1].split("?")[0]
-            else:
+            video_id = extract_video_id(url)
+            if not video_id:
                 print(f"❌ Invalid YouTube URL: {url}")
                 return None
 
             print(f"🎯 Extracting transcript for video ID: {video_id}")
 
-            # Get transcript using the correct API
-            fetched_transcript = self.youtube_transcript_api.fetch(video_id, languages=['en'])
+            def fetch():
+                # Get transcript using the correct API
+                fetched_transcript = self.youtube_transcript_api.fetch(video_id, languages=['en'])
+                return fetched_transcript.language_code, [
+                    {'text': snippet.text, 'start': snippet.start, 'duration': snippet.duration}
+                    for snippet in fetched_transcript.snippets
+                ]
+
+            def download():
+                try:
+                    return self.scheduler.call(video_id, fetch)
+                except Exception as e:
+                    # No transcript to fetch: None lets the cache remember it
+                    if is_unavailable(e):
+                        return None
+                    raise
+
+            if self.cache is not None:
+                found = self.cache.transcript(video_id, ['en'], download)
+                if not found:
+                    print(f"❌ No cached transcript for {video_id}")
+                    return None
+            else:
+                found = download()
+                if not found:
+                    print(f"❌ No transcript available for {video_id}")
+                    return None
+            language, snippets = found
+            self.throttled.pop(url, None)
 
             # Extract text from snippets
-            full_text = " ".join([snippet.text for snippet in fetched_transcript.snippets])
+            full_text = " ".join([snippet['text'] for snippet in snippets])
 
             return {
                 'text': full_text,
                 'video_id': video_id,
-                'duration': sum([snippet.duration for snippet in fetched_transcript.snippets]),
-                'language': fetched_transcript.language_code,
+                'duration': sum([snippet['duration'] for snippet in snippets]),
+                'language': language,
                 'url': url
             }
 
+        except RetryBudgetExhausted as e:
+            print(f"⏳ Still throttled, queued for the next run: {url}")
+            self.throttled[url] = e
+            return None
         except Exception as e:
             print(f"❌ Error extracting transcript from {url}: {e}")
             return None
@@ -143,27 +191,74 @@ def split_transcript_smartly(text: str, max_segment_length: int = 150) -> List[s
 
     return [seg for seg in segments if len(seg.strip()) > 20]
 
-def create_training_dataset(urls: List[str]) -> Optional[str]:
-    """Create training dataset from YouTube URLs"""
+def fetch_transcripts(extractor: YouTubeTranscriptExtractor, urls: List[str], workers: int = 1) -> List[Optional[Dict]]:
+    """Fetch every transcript, up to `workers` at a time, in the order of `urls`"""
+    if workers <= 1:
+        return [extractor.extract_transcript(url) for url in urls]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcript') as pool:
+        return list(pool.map(extractor.extract_transcript, urls))
+
+def create_training_dataset(urls: List[str], workers: int = 1,
+                            extractor: Optional[YouTubeTranscriptExtractor] = None,
+                            cache: Optional[TranscriptCache] = None, incremental: bool = False,
+                            dataset_file: str = "youtube_humor_dataset.jsonl",
+                            scheduler: Optional[FetchScheduler] = None) -> Optional[str]:
+    """
+    Create training dataset from YouTube URLs (pass an extractor to use a different transcript source)
+
+    With ``incremental=True`` only URLs missing from the dataset manifest
+    are fetched and appended, and removed URLs have their samples dropped.
+    Videos still rate limited after their retries are listed in
+    ``<dataset>.retry.json`` and added to the next run's URLs until they
+    succeed.
+    """
     print("🎬 Creating training dataset from YouTube...")
 
     # Initialize extractor
-    extractor = YouTubeTranscriptExtractor()
-    if not extractor.load_api():
-        return None
+    if extractor is None:
+        extractor = YouTubeTranscriptExtractor(cache=cache, scheduler=scheduler)
+        # Cache-only runs never download, so they work without the API
+        if not extractor.load_api() and (cache is None or cache.mode != 'only'):
+            return None
+
+    retry_queue = RetryQueue(RetryQueue.path_for(dataset_file))
+    manifest = DatasetManifest(dataset_file)
+    incremental = manifest.prepare(incremental)
+    queued = len(retry_queue)
+    urls = retry_queue.merge(urls, extract_video_id, done=manifest.active())
+    if len(retry_queue):
+        print(f"🔁 Retrying {len(retry_queue)} videos queued by earlier runs")
+    if queued > len(retry_queue):
+        print(f"🧹 Cleared {queued - len(retry_queue)} queued videos already in the dataset")
+    pending, removed = manifest.plan(urls, extract_video_id)
+    dropped = manifest.tombstone(removed)
+    if incremental:
+        print(f"📒 Incremental build: {len(pending)} new, {len(removed)} removed "
+              f"({dropped} samples dropped), {len(manifest.active())} unchanged")
 
     all_training_data = []
     successful_extractions = 0
+    extractor.scheduler.reset_budgets()
 
-    for i, url in enumerate(urls, 1):
-        print(f"\n📹 Processing video {i}/{len(urls)}")
+    # Transcript round-trips dominate; run them on the worker pool first
+    print(f"📥 Fetching {len(pending)} transcripts with {workers} worker(s)...")
+    start = time.perf_counter()
+    fetched = fetch_transcripts(extractor, pending, workers)
+    fetch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i, (url, transcript_data) in enumerate(zip(pending, fetched), 1):
+        print(f"\n📹 Processing video {i}/{len(pending)}")
         print(f"🔗 URL: {url}")
 
         try:
-            # Extract transcript
-            transcript_data = extractor.extract_transcript(url)
             if not transcript_data:
-                print("❌ Failed to extract transcript")
+                if url in extractor.throttled:
+                    error = extractor.throttled[url]
+                    retry_queue.add(error.video_id, url, error.last_error)
+                else:
+                    print("❌ Failed to extract transcript")
+                    retry_queue.remove(extract_video_id(url))
                 continue
 
             # Clean transcript
@@ -174,6 +269,10 @@ def create_training_dataset(urls: List[str]) -> Optional[str]:
             # Create training pairs
             training_pairs = create_humor_training_pairs(clean_text, transcript_data)
             all_training_data.extend(training_pairs)
+            manifest.append(transcript_data['video_id'], url, [{"text": text} for text in training_pairs],
+                            meta={'duration': transcript_data['duration'], 'language': transcript_data['language']})
+
+            retry_queue.remove(transcript_data['video_id'])
 
             print(f"📚 Created {len(training_pairs)} training samples")
             successful_extractions += 1
@@ -181,20 +280,26 @@ def create_training_dataset(urls: List[str]) -> Optional[str]:
         except Exception as e:
             print(f"❌ Error processing {url}: {str(e)}")
             continue
+    processing_seconds = time.perf_counter() - start
+
+    print(f"\n⏱️ Fetching: {fetch_seconds:.1f}s, processing: {processing_seconds:.1f}s")
+    print(f"🚦 Fetch scheduler: {extractor.scheduler.stats()}")
+    if extractor.cache is not None:
+        print(f"📦 Transcript cache: {extractor.cache.stats()}")
 
-    if not all_training_data:
+    manifest.save()
+    retry_queue.save()
+    if len(retry_queue):
+        print(f"🔁 {len(retry_queue)} throttled videos queued in {retry_queue.path}")
+
+    if not manifest.total_records():
         print("\n❌ No training data created!")
         return None
 
-    # Save training data
-    dataset_file = "youtube_humor_dataset.jsonl"
-    with open(dataset_file, 'w', encoding='utf-8') as f:
-        for text in all_training_data:
-            f.write(json.dumps({"text": text}) + '\n')
-
-    print(f"\n✅ Success! Created dataset with {len(all_training_data)} training samples")
+    print(f"\n✅ Success! Added {len(all_training_data)} training samples "
+          f"(dataset now has {manifest.total_records()})")
     print(f"📁 Saved to: {dataset_file}")
-    print(f"🎯 Successfully processed {successful_extractions}/{len(urls)} videos")
+    print(f"🎯 Successfully processed {successful_extractions}/{len(pending)} videos")
 
     return dataset_file
 
@@ -213,6 +318,14 @@ def preview_dataset(dataset_file: str, num_samples: int = 5):
 
 def main():
     """Main function"""
+    parser = argparse.ArgumentParser(description="Build a humor dataset from YouTube transcripts")
+    parser.add_argument("--workers", type=int, default=8, help="Transcripts fetched at once")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process URLs added since the last build and drop removed ones")
+    add_cache_arguments(parser)
+    add_scheduler_arguments(parser)
+    args = parser.parse_args()
+
     print("🎬 YouTube Transcript Extractor for Mr. Sarcastic")
     print("=" * 55)
 
@@ -233,7 +346,8 @@ def main():
     print(f"📹 Found {len(urls)} YouTube videos to process")
 
     # Create training dataset
-    dataset_file = create_training_dataset(urls)
+    dataset_file = create_training_dataset(urls, workers=args.workers, cache=cache_from_args(args),
+                                           incremental=args.incremental, scheduler=scheduler_from_args(args))
 
     if dataset_file:
         # Preview the dataset
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Fetch Scheduler for Mr. Sarcastic
+Shared rate limiting for outbound YouTube calls: a global token bucket,
+jittered exponential backoff on throttling, a retry budget per video and a
+persistent queue of videos to retry on the next run
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Collection, Dict, Iterator, List, Optional
+
+# Exception class names youtube-transcript-api / pytube use for throttling
+RATE_LIMIT_ERRORS = {'TooManyRequests', 'RequestBlocked', 'IpBlocked'}
+# ... and for a video that has no transcript to fetch (asking again will not change that soon)
+UNAVAILABLE_ERRORS = {'NoTranscriptFound', 'TranscriptsDisabled', 'VideoUnavailable', 'VideoUnplayable'}
+
+
+def _error_chain(exc: BaseException) -> Iterator[BaseException]:
+    """The exception and the errors it wraps (``raise ... from`` or raised while handling them)"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or (None if exc.__suppress_context__ else exc.__context__)
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """
+    HTTP status carried by an exception (urllib ``code`` or requests
+    ``response``), or by the HTTP error it wraps (youtube-transcript-api
+    raises its own errors while handling the requests one)
+    """
+    for error in _error_chain(exc):
+        code = getattr(error, 'code', None)
+        if isinstance(code, int):
+            return code
+        code = getattr(getattr(error, 'response', None), 'status_code', None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """Decided from the HTTP status or the exception type, never from the message"""
+    if status_code(exc) == 429:
+        return True
+    return any(cls.__name__ in RATE_LIMIT_ERRORS for error in _error_chain(exc) for cls in type(error).__mro__)
+
+
+def is_unavailable(exc: BaseException) -> bool:
+    """The video has no transcript (disabled, none in the requested languages, or the video is gone)"""
+    return not is_rate_limited(exc) and any(cls.__name__ in UNAVAILABLE_ERRORS for cls in type(exc).__mro__)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Throttling, 5xx responses and connection-level failures are worth retrying"""
+    if is_rate_limited(exc):
+        return True
+    code = status_code(exc)
+    if code is not None:
+        return code >= 500
+    # Connection resets, timeouts, DNS failures (requests/urllib errors are OSErrors too)
+    return isinstance(exc, OSError)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header on the exception's response, or on the HTTP error it wraps"""
+    for error in _error_chain(exc):
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or getattr(error, 'headers', None)
+        try:
+            value = headers.get('Retry-After') if headers else None
+            if value is not None:
+                return float(value)
+        except (AttributeError, TypeError, ValueError):
+            continue
+    return None
+
+
+class RetryBudgetExhausted(Exception):
+    """A video used up its retries; callers queue it for the next run"""
+
+    def __init__(self, video_id: str, attempts: int, last_error: BaseException):
+        super().__init__(f"{video_id}: gave up after {attempts} attempts ({type(last_error).__name__}: {last_error})")
+        self.video_id = video_id
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``hold()`` pauses every caller (used after a 429)"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping as needed; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.paused_until - now
+            time.sleep(delay)
+            waited += delay
+
+    def hold(self, seconds: float):
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            # Nothing accrues while paused, so callers resume at the base rate
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+
+class RetryQueue:
+    """
+    Videos that ran out of retries, persisted as JSON for the next run
+
+    Runs call ``merge`` on their URL list before planning, so queued videos
+    are fetched again, and ``remove`` once a video succeeds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    @staticmethod
+    def path_for(output_file: str) -> str:
+        """Queue file kept next to a dataset"""
+        return os.path.splitext(output_file)[0] + '.retry.json'
+
+    def add(self, video_id: str, url: str, error: BaseException):
+        error = f"{type(error).__name__}: {error}"
+        with self.lock:
+            entry = self.entries.setdefault(video_id, {'url': url, 'runs': 0})
+            entry.update(url=url, last_error=error, queued_at=round(time.time()))
+            entry['runs'] += 1
+
+    def remove(self, video_id: str):
+        with self.lock:
+            self.entries.pop(video_id, None)
+
+    def urls(self) -> List[str]:
+        with self.lock:
+            return [entry['url'] for entry in self.entries.values()]
+
+    def merge(self, urls: List[str], video_id_of: Callable[[str], Optional[str]],
+              done: Collection[str] = ()) -> List[str]:
+        """
+        ``urls`` followed by the queued videos missing from it
+
+        Entries for videos in ``done`` (already in the dataset) are cleared
+        instead of being fetched again.
+        """
+        wanted = {video_id_of(url) for url in urls}
+        merged = list(urls)
+        with self.lock:
+            for video_id, entry in list(self.entries.items()):
+                if video_id in done:
+                    del self.entries[video_id]
+                elif video_id not in wanted:
+                    merged.append(entry['url'])
+                    wanted.add(video_id)
+        return merged
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self.entries
+
+    def save(self):
+        with self.lock:
+            if not self.entries and not os.path.exists(self.path):
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class FetchScheduler:
+    """
+    Runs outbound calls through a shared token bucket with retries
+
+    Every attempt takes a token. A rate-limited response pauses the whole
+    bucket for the backoff delay (or the server's Retry-After), so parallel
+    workers slow down together instead of hammering a throttled endpoint.
+    Other transient failures only back off the calling thread. Each video
+    gets ``max_retries`` retries across all of its calls in one run; after
+    that ``RetryBudgetExhausted`` is raised so the caller can put the video
+    in a RetryQueue.
+    """
+
+    def __init__(self, rate: float = 4.0, burst: int = 8, max_retries: int = 4,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.lock = threading.Lock()
+        self.retries_used: Dict[str, int] = {}
+        self.counters = {'calls': 0, 'retries': 0, 'throttled': 0, 'exhausted': 0}
+        self.waited_seconds = 0.0
+
+    def _count(self, name: str, waited: float = 0.0):
+        with self.lock:
+            self.counters[name] += 1
+            self.waited_seconds += waited
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential delay for the n-th retry with +/-50% jitter"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.5)
+
+    def reset_budgets(self):
+        """Give every video a fresh retry budget (call at the start of a run)"""
+        with self.lock:
+            self.retries_used.clear()
+
+    def call(self, video_id: str, func: Callable, *args, **kwargs) -> Any:
+        """Call ``func`` under the rate limit, retrying retryable failures within the video's budget"""
+        attempt = 0
+        while True:
+            self._count('calls', self.bucket.acquire())
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                with self.lock:
+                    used = self.retries_used.get(video_id, 0)
+                    if used >= self.max_retries:
+                        self.counters['exhausted'] += 1
+                        raise RetryBudgetExhausted(video_id, attempt + 1, e) from e
+                    self.retries_used[video_id] = used + 1
+                    self.counters['retries'] += 1
+
+                delay = retry_after(e) or self.backoff(used)
+                if is_rate_limited(e):
+                    self._count('throttled')
+                    self.bucket.hold(delay)
+                else:
+                    time.sleep(delay)
+                    with self.lock:
+                        self.waited_seconds += delay
+                attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                **self.counters,
+                'rate': self.bucket.rate,
+                'waited_seconds': round(self.waited_seconds, 2)
+            }
+
+
+_shared: Optional[FetchScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler() -> FetchScheduler:
+    """Process-wide scheduler used by the extractors unless one is passed in"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = FetchScheduler()
+        return _shared
+
+
+def add_scheduler_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--rate", type=float, default=4.0, help="Outbound YouTube requests per second")
+    parser.add_argument("--burst", type=int, default=8, help="Requests allowed in a burst")
+    parser.add_argument("--max-retries", type=int, default=4, help="Retries per video per run")
+
+
+def scheduler_from_args(args: argparse.Namespace) -> FetchScheduler:
+    return FetchScheduler(args.rate, args.burst, args.max_retries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show a transcript retry queue")
+    parser.add_argument("queue", help="Retry queue JSON written by an extraction run")
+    args = parser.parse_args()
+
+    queue = RetryQueue(args.queue)
+    print(f"🔁 {len(queue)} videos queued for retry")
+    for video_id, entry in queue.entries.items():
+        print(f"   {video_id}  runs={entry['runs']}  {entry.get('last_error', '')}")
@@ -1,17 +1,29 @@
 from transformers import AutoModelForCausalLM, AutoTokenizer, DataCollatorForLanguageModeling, Trainer, TrainingArguments
-from datasets import load_dataset, Dataset
 import torch
 import json
 import os
 
+from dataset_shards import load_training_dataset
+from tokenization_cache import TokenizationCache, render_prompts
+from length_bucketing import LENGTH_COLUMN, dataset_lengths, format_padding_report, padding_report, with_lengths
+from sequence_packing import (PackedCollator, format_packing_report, pack_dataset, packing_report,
+                              supports_block_diagonal_attention)
+from lora_adapters import (ADAPTER_LEARNING_RATE, add_lora_adapters, adapter_base_dtype, format_adapter_report,
+                           is_adapter_dir, load_adapter)
+from training_metrics import TrainingMetricsCallback
+
+PROMPT_TEMPLATE = "{prompt}{completion}{eos_token}"
+MAX_LENGTH = 512
+
 class FalconFineTuner:
-    def __init__(self, model_name="tiiuae/falcon-7b"):
+    def __init__(self, model_name="tiiuae/falcon-7b", tokenization_cache=None):
         self.model_name = model_name
         self.tokenizer = None
         self.model = None
+        self.tokenization_cache = tokenization_cache or TokenizationCache()
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
-    def load_model(self):
+    def load_model(self, torch_dtype=None):
         """Load the pretrained Falcon model and tokenizer"""
         print(f"Loading model {self.model_name} on device: {self.device}")
         
@@ -24,7 +36,7 @@ class FalconFineTuner:
         self.model = AutoModelForCausalLM.from_pretrained(
             self.model_name, 
             trust_remote_code=True,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            torch_dtype=torch_dtype or (torch.float16 if torch.cuda.is_available() else torch.float32),
             device_map="auto" if torch.cuda.is_available() else None
         )
         
@@ -39,33 +51,34 @@ class FalconFineTuner:
             print("No dataset found, creating sample sarcastic dataset...")
             self.create_sample_dataset(dataset_path)
             
-        # Load the JSONL dataset
-        with open(dataset_path, 'r', encoding='utf-8') as f:
-            data = [json.loads(line) for line in f]
-            
-        # Convert to Hugging Face dataset
-        dataset = Dataset.from_list(data)
-        
-        # Tokenize the dataset
+        # Tokenize the dataset (reused from the tokenization cache when neither
+        # the data nor the tokenizer changed). Ids are stored unpadded with their
+        # length; the collator pads each batch to its longest example.
         def tokenize_function(examples):
             # Combine prompt and completion for training
-            texts = []
-            for prompt, completion in zip(examples['prompt'], examples['completion']):
-                text = prompt + completion + self.tokenizer.eos_token
-                texts.append(text)
+            texts = render_prompts(examples, PROMPT_TEMPLATE, eos_token=self.tokenizer.eos_token)
                 
-            return self.tokenizer(
+            return with_lengths(self.tokenizer(
                 texts, 
                 truncation=True, 
-                padding=True, 
-                max_length=512,
+                padding=False, 
+                max_length=MAX_LENGTH,
                 return_tensors=None
+            ))
+        
+        def tokenize(cache_file_name):
+            # Memory-map the dataset from Arrow shards (converted from the JSONL on first use)
+            dataset = load_training_dataset(dataset_path)
+            return dataset.map(
+                tokenize_function, 
+                batched=True, 
+                remove_columns=dataset.column_names,
+                cache_file_name=cache_file_name
             )
         
-        tokenized_dataset = dataset.map(
-            tokenize_function, 
-            batched=True, 
-            remove_columns=dataset.column_names
+        tokenized_dataset = self.tokenization_cache.get_or_tokenize(
+            dataset_path, self.tokenizer, PROMPT_TEMPLATE, MAX_LENGTH, tokenize,
+            truncation=True, padding=False
         )
         
         print(f"Dataset prepared with {len(tokenized_dataset)} examples")
@@ -92,28 +105,54 @@ class FalconFineTuner:
                 
         print(f"Sample dataset created at {output_path}")
         
-    def train(self, dataset_path, output_dir="./falcon-humor-chatbot", max_steps=1000):
-        """Fine-tune the model"""
+    def train(self, dataset_path, output_dir="./falcon-humor-chatbot", max_steps=1000, batch_size=1,
+              packing=False, block_size=MAX_LENGTH, adapter=False, callbacks=None):
+        """
+        Fine-tune the model (effective batch size 16: batch_size x gradient accumulation)
+        
+        With packing, short pairs are concatenated into blocks of block_size tokens
+        (attention and position ids kept per pair where the model accepts a 4D mask),
+        so each step trains on several pairs.
+        With adapter, the base model is frozen and only LoRA adapters are trained
+        and saved to output_dir. callbacks are added to the Trainer's (e.g. job
+        progress reporting).
+        """
         if not self.model or not self.tokenizer:
-            self.load_model()
+            self.load_model(torch_dtype=adapter_base_dtype() if adapter else None)
+        
+        if adapter:
+            self.model = add_lora_adapters(self.model)
+            print(f"LoRA adapters: {format_adapter_report(self.model)}")
             
         # Prepare dataset
         train_dataset = self.prepare_dataset(dataset_path)
         
-        # Data collator
-        data_collator = DataCollatorForLanguageModeling(
-            tokenizer=self.tokenizer, 
-            mlm=False
-        )
+        if packing:
+            lengths = dataset_lengths(train_dataset)
+            print(f"Packing: {format_packing_report(packing_report(lengths, block_size))}")
+            block_diagonal = supports_block_diagonal_attention(self.model)
+            train_dataset = pack_dataset(train_dataset, block_size, self.tokenizer.eos_token_id,
+                                         reset_positions=block_diagonal)
+            data_collator = PackedCollator(self.tokenizer.pad_token_id, block_diagonal=block_diagonal)
+        else:
+            print(f"Padding: {format_padding_report(padding_report(dataset_lengths(train_dataset), batch_size))}")
+            
+            # Data collator (pads each batch to its longest example)
+            data_collator = DataCollatorForLanguageModeling(
+                tokenizer=self.tokenizer, 
+                mlm=False
+            )
         
         # Training arguments
         training_args = TrainingArguments(
             output_dir=output_dir,
-            per_device_train_batch_size=1,
-            gradient_accumulation_steps=16,
+            per_device_train_batch_size=batch_size,
+            gradient_accumulation_steps=max(1, 16 // batch_size),
+            group_by_length=True,
+            length_column_name=LENGTH_COLUMN,
             warmup_steps=100,
             max_steps=max_steps,
-            learning_rate=5e-5,
+            learning_rate=ADAPTER_LEARNING_RATE if adapter else 5e-5,
             fp16=torch.cuda.is_available(),
             logging_steps=10,
             save_steps=500,
@@ -127,6 +166,7 @@ class FalconFineTuner:
             args=training_args,
             data_collator=data_collator,
             train_dataset=train_dataset,
+            callbacks=[TrainingMetricsCallback(), *(callbacks or [])],
         )
         
         print("Starting training...")
@@ -137,10 +177,16 @@ class FalconFineTuner:
         self.tokenizer.save_pretrained(output_dir)
         
         print(f"Training completed! Model saved to {output_dir}")
+        return output_dir
         
-    def generate_response(self, prompt, max_length=100, model_path=None):
-        """Generate a response using the fine-tuned model"""
-        if model_path:
+    def load_fine_tuned(self, model_path):
+        """Load a fine-tuned model (or a base model plus a fine-tuned adapter) from model_path"""
+        if is_adapter_dir(model_path):
+            # Load the base model and attach the fine-tuned adapter
+            if not self.model:
+                self.load_model(torch_dtype=adapter_base_dtype())
+            self.model = load_adapter(self.model, model_path)
+        else:
             # Load fine-tuned model
             self.tokenizer = AutoTokenizer.from_pretrained(model_path)
             self.model = AutoModelForCausalLM.from_pretrained(
@@ -148,6 +194,11 @@ class FalconFineTuner:
                 torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
                 device_map="auto" if torch.cuda.is_available() else None
             )
+    
+    def generate_response(self, prompt, max_length=100, model_path=None):
+        """Generate a response using the fine-tuned model"""
+        if model_path:
+            self.load_fine_tuned(model_path)
         elif not self.model:
             self.load_model()
             
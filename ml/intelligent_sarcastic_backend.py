@@ -14,6 +14,7 @@ import uvicorn
 from typing import List, Optional, Dict, Any
 import re
 import logging
+from keyword_classifier import KeywordClassifier
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,6 +28,9 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.9
     max_length: Optional[int] = 100
 
+class ConversationImport(BaseModel):
+    history: List[Dict[str, Any]] = []
+
 class ChatResponse(BaseModel):
     success: bool
     response: str
@@ -39,14 +43,24 @@ class ChatResponse(BaseModel):
 class IntelligentSarcasticBot:
     """Intelligent sarcastic chatbot with advanced context awareness and personality"""
     
+    # Checked in priority order, first matching category wins
+    CONTEXT_CLASSIFIER = KeywordClassifier({
+        'greeting': ['hello', 'hi', 'hey', 'sup', 'what\'s up', 'yo'],
+        'identity': ['who are you', 'who made you', 'creator*', 'who am i', 'what are you'],
+        'friendship': ['can i be your friend', 'be my friend', 'friends', 'friendship'],
+        'insult': ['shut up', 'fuck off', 'stupid', 'dumb', 'hate you', 'asshole*'],
+        'confusion': ['do you even understand', 'understand me', 'get it', 'talking about'],
+        'identity_claim': ['i am him', 'i\'m him', 'iam him', 'him'],
+        'question': ['?', 'how', 'what', 'why', 'when', 'where'],
+        'angry': ['angry', 'mad', 'pissed', 'annoyed', 'frustrated']
+    }, default='default')
+    
     def __init__(self):
         self.conversation_history = {}  # Track conversations by user_id
         logger.info("✅ Intelligent Sarcastic Bot initialized - ready for witty banter!")
 
     def analyze_context(self, message, user_id=None, conversation_history=None):
         """Advanced context analysis"""
-        message_lower = message.lower().strip()
-        
         # Check conversation history for context
         context_clues = []
         if user_id and user_id in self.conversation_history:
@@ -54,24 +68,7 @@ class IntelligentSarcasticBot:
             context_clues = [exchange.get('mood', 'neutral') for exchange in recent]
         
         # Enhanced mood detection with context
-        if any(word in message_lower for word in ['hello', 'hi', 'hey', 'sup', 'what\'s up', 'yo']):
-            return 'greeting'
-        elif any(phrase in message_lower for phrase in ['who are you', 'who made you', 'creator', 'who am i', 'what are you']):
-            return 'identity'
-        elif any(phrase in message_lower for phrase in ['can i be your friend', 'be my friend', 'friends', 'friendship']):
-            return 'friendship'
-        elif any(phrase in message_lower for phrase in ['shut up', 'fuck off', 'stupid', 'dumb', 'hate you', 'asshole']):
-            return 'insult'
-        elif any(phrase in message_lower for phrase in ['do you even understand', 'understand me', 'get it', 'talking about']):
-            return 'confusion'
-        elif any(phrase in message_lower for phrase in ['i am him', 'i\'m him', 'iam him']) or 'him' in message_lower:
-            return 'identity_claim'
-        elif '?' in message or any(word in message_lower for word in ['how', 'what', 'why', 'when', 'where']):
-            return 'question'
-        elif any(word in message_lower for word in ['angry', 'mad', 'pissed', 'annoyed', 'frustrated']):
-            return 'angry'
-        else:
-            return 'default'
+        return self.CONTEXT_CLASSIFIER.classify(message)
 
     def generate_contextual_response(self, message, mood, user_id=None, conversation_history=None):
         """Generate highly contextual sarcastic responses"""
@@ -269,6 +266,12 @@ async def get_conversation_history(user_id: str):
     else:
         return {"history": []}
 
+@app.put("/conversation/{user_id}")
+async def import_conversation_history(user_id: str, request: ConversationImport):
+    """Replace a user's history (used by the router when a user moves between instances)"""
+    bot.conversation_history[user_id] = request.history
+    return {"message": f"Conversation history imported for {user_id}", "exchanges": len(request.history)}
+
 @app.delete("/conversation/{user_id}")
 async def clear_conversation_history(user_id: str):
     """Clear conversation history for a user"""
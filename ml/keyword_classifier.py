@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Shared Keyword Classifier for Mr. Sarcastic
+Compiles ordered keyword tables into a single Aho-Corasick automaton so mood
+and intent detection is one pass over the message, whatever the table size
+"""
+
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Canonical mood table shared by the song-aware backends (priority = order)
+MOOD_KEYWORDS = {
+    'sad': ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset', 'lonely', 'blue', 'melancholy'],
+    'happy': ['happy', 'excited', 'joy', 'great', 'awesome', 'fantastic', 'good', 'cheerful', 'elated'],
+    'angry': ['angry', 'mad', 'furious', 'hate', 'annoyed', 'pissed', 'frustrated', 'irritated'],
+    'bored': ['bored', 'boring', 'dull', 'tired', 'meh', 'whatever', 'sleepy'],
+    'energetic': ['energetic', 'pumped', 'hyper', 'motivated', 'ready', 'workout', 'party'],
+    'chill': ['chill', 'relaxed', 'calm', 'peaceful', 'mellow', 'zen']
+}
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+class KeywordClassifier:
+    """
+    Multi-pattern keyword matcher with priority ordering
+
+    Categories are checked in insertion order, so the first category in the
+    table wins when several match (the same semantics as an if/elif chain of
+    ``any(word in message_lower ...)`` checks). With ``word_boundary=True`` a
+    keyword only matches whole words; a trailing ``*`` turns a keyword into a
+    prefix match (``'song*'`` matches "song" and "songs").
+
+    When no keyword contains whitespace, a match never spans two
+    whitespace-separated tokens, so the batch methods scan each distinct
+    token once and reuse the result (bounded by ``token_cache_size``).
+    """
+
+    def __init__(self, categories: Dict[str, Iterable[str]], default: Optional[str] = None,
+                 word_boundary: bool = True, token_cache_size: int = 200000):
+        self.default = default
+        self.word_boundary = word_boundary
+        self.token_cache_size = token_cache_size
+        self._token_cache: Dict[str, Tuple[int, ...]] = {}
+        self.labels_by_priority: List[str] = list(categories)
+
+        self._keywords: List[str] = []
+        self._keyword_labels: List[List[int]] = []
+        self._needs_start: List[bool] = []
+        self._needs_end: List[bool] = []
+        keyword_ids: Dict[Tuple[str, bool], int] = {}
+
+        for priority, (label, keywords) in enumerate(categories.items()):
+            for keyword in keywords:
+                keyword = keyword.lower()
+                is_prefix = keyword.endswith('*')
+                if is_prefix:
+                    keyword = keyword[:-1]
+                if not keyword:
+                    continue
+                key = (keyword, is_prefix)
+                if key not in keyword_ids:
+                    keyword_ids[key] = len(self._keywords)
+                    self._keywords.append(keyword)
+                    self._keyword_labels.append([])
+                    self._needs_start.append(word_boundary and _is_word_char(keyword[0]))
+                    self._needs_end.append(word_boundary and not is_prefix and _is_word_char(keyword[-1]))
+                labels = self._keyword_labels[keyword_ids[key]]
+                if priority not in labels:
+                    labels.append(priority)
+
+        self._splittable = not any(ch.isspace() for keyword in self._keywords for ch in keyword)
+        self._build_automaton()
+
+    def _build_automaton(self):
+        """Build the trie, failure links and a fully resolved transition table"""
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+
+        for keyword_id, keyword in enumerate(self._keywords):
+            state = 0
+            for ch in keyword:
+                if ch not in goto[state]:
+                    goto.append({})
+                    out.append([])
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            out[state].append(keyword_id)
+
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        pending = deque(goto[0].values())
+
+        # Breadth-first so every failure target is resolved before it is copied
+        while pending:
+            state = pending.popleft()
+            transitions = dict(delta[fail[state]])
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, 0)
+                transitions[ch] = child
+                pending.append(child)
+            delta[state] = transitions
+            out[state] = out[state] + out[fail[state]]
+
+        self._delta = delta
+        self._out = [tuple(ids) for ids in out]
+
+    def _matches(self, text: str) -> Iterator[int]:
+        """Yield the id of every keyword occurrence in already-lowercased text"""
+        delta = self._delta
+        out = self._out
+        keywords = self._keywords
+        needs_start = self._needs_start
+        needs_end = self._needs_end
+        last = len(text) - 1
+        state = 0
+
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if not out[state]:
+                continue
+            for keyword_id in out[state]:
+                if needs_start[keyword_id]:
+                    start = i - len(keywords[keyword_id])
+                    if start >= 0 and _is_word_char(text[start]):
+                        continue
+                if needs_end[keyword_id] and i < last and _is_word_char(text[i + 1]):
+                    continue
+                yield keyword_id
+
+    def _token_priorities(self, token: str) -> Tuple[int, ...]:
+        """Label priorities hit inside one whitespace-free token (cached)"""
+        cache = self._token_cache
+        priorities = cache.get(token)
+        if priorities is None:
+            keyword_labels = self._keyword_labels
+            priorities = tuple(priority for keyword_id in self._matches(token)
+                               for priority in keyword_labels[keyword_id])
+            if len(cache) >= self.token_cache_size:
+                cache.clear()
+            cache[token] = priorities
+        return priorities
+
+    def _hit_priorities(self, text: str) -> Tuple[int, ...]:
+        """Label priority of every keyword hit in one message (per-token cache when possible)"""
+        text = text.lower()
+        if not self._splittable:
+            keyword_labels = self._keyword_labels
+            return tuple(priority for keyword_id in self._matches(text) for priority in keyword_labels[keyword_id])
+
+        cache = self._token_cache
+        hits: Tuple[int, ...] = ()
+        for token in text.split():
+            priorities = cache.get(token)
+            if priorities is None:
+                priorities = self._token_priorities(token)
+            if priorities:
+                hits += priorities
+        return hits
+
+    def classify(self, text: str) -> Optional[str]:
+        """Return the highest-priority matching label, or the default"""
+        best = len(self.labels_by_priority)
+        for keyword_id in self._matches(text.lower()):
+            priority = min(self._keyword_labels[keyword_id])
+            if priority < best:
+                best = priority
+                if best == 0:
+                    break
+        if best < len(self.labels_by_priority):
+            return self.labels_by_priority[best]
+        return self.default
+
+    def labels(self, text: str) -> Set[str]:
+        """Return every label with at least one matching keyword"""
+        found = set()
+        for keyword_id in self._matches(text.lower()):
+            for priority in self._keyword_labels[keyword_id]:
+                found.add(self.labels_by_priority[priority])
+        return found
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """Count keyword hits per label"""
+        counts = dict.fromkeys(self.labels_by_priority, 0)
+        for keyword_id in self._matches(text.lower()):
+            for priority in self._keyword_labels[keyword_id]:
+                counts[self.labels_by_priority[priority]] += 1
+        return counts
+
+    def matches_any(self, text: str) -> bool:
+        """True if any keyword in the table matches"""
+        for _ in self._matches(text.lower()):
+            return True
+        return False
+
+    def classify_batch(self, texts: Iterable[str]) -> List[Optional[str]]:
+        """Classify many messages with the same compiled automaton"""
+        labels = self.labels_by_priority
+        results = []
+        for text in texts:
+            hits = self._hit_priorities(text)
+            results.append(labels[min(hits)] if hits else self.default)
+        return results
+
+    def scores_batch(self, texts: Iterable[str]) -> List[Dict[str, int]]:
+        """Per-label hit counts for many messages"""
+        labels = self.labels_by_priority
+        return [dict(zip(labels, counts)) for _, counts in self.classify_with_scores_batch(texts)]
+
+    def classify_with_scores_batch(self, texts: Iterable[str],
+                                   finalize: Optional[Callable[[Optional[str], Tuple[int, ...]], Any]] = None) -> List[Any]:
+        """
+        ``(label, counts)`` for many messages, one scan each
+
+        ``counts`` is aligned with ``labels_by_priority``. Messages that hit
+        the same keywords share one result object, so large batches mostly
+        cost a split and a few dictionary lookups per message. ``finalize``
+        maps ``(label, counts)`` to the value returned for a message and is
+        called once per distinct result.
+        """
+        labels = self.labels_by_priority
+        n_labels = len(labels)
+        combos: Dict[Tuple[int, ...], Any] = {}
+        results = []
+        for text in texts:
+            hits = self._hit_priorities(text)
+            result = combos.get(hits)
+            if result is None:
+                counts = [0] * n_labels
+                for priority in hits:
+                    counts[priority] += 1
+                label = labels[min(hits)] if hits else self.default
+                if finalize is None:
+                    result = (label, tuple(counts))
+                else:
+                    result = finalize(label, tuple(counts))
+                combos[hits] = result
+            results.append(result)
+        return results
+
+    def __len__(self) -> int:
+        return len(self._keywords)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Length Bucketing for Mr. Sarcastic
+Helpers for training on unpadded token ids: a length column for the Trainer's
+length-grouped sampler, and a report of how much padding per-batch collation
+and length grouping save over padding inside ``dataset.map``
+"""
+
+import argparse
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+LENGTH_COLUMN = 'length'
+# datasets.map batch size the tokenizers used to pad over (padding=True)
+MAP_BATCH_SIZE = 1000
+# Megabatch size (in batches) of transformers' LengthGroupedSampler
+MEGABATCH_MULTIPLIER = 50
+
+
+def with_lengths(encodings: Dict[str, List]) -> Dict[str, List]:
+    """Add the token count of each example to unpadded tokenizer output"""
+    encodings[LENGTH_COLUMN] = [len(ids) for ids in encodings['input_ids']]
+    return encodings
+
+
+def dataset_lengths(dataset) -> np.ndarray:
+    """Token counts of a tokenized ``datasets.Dataset`` (from the length column if present)"""
+    if LENGTH_COLUMN in dataset.column_names:
+        return np.fromiter(dataset[LENGTH_COLUMN], dtype=np.int64, count=len(dataset))
+    return np.fromiter((len(ids) for ids in dataset['input_ids']), dtype=np.int64, count=len(dataset))
+
+
+def length_grouped_order(lengths: Sequence[int], batch_size: int, megabatch_multiplier: int = MEGABATCH_MULTIPLIER,
+                         seed: int = 42) -> np.ndarray:
+    """
+    Example order the way ``TrainingArguments(group_by_length=True)`` samples it
+
+    The data is shuffled and cut into megabatches of
+    ``megabatch_multiplier * batch_size`` examples, each sorted by length
+    (longest first), so consecutive batches hold examples of similar length
+    while the batch order stays random.
+    """
+    lengths = np.asarray(lengths)
+    order = np.random.default_rng(seed).permutation(len(lengths))
+    megabatch = max(1, megabatch_multiplier * batch_size)
+    for start in range(0, len(order), megabatch):
+        chunk = order[start:start + megabatch]
+        order[start:start + megabatch] = chunk[np.argsort(-lengths[chunk], kind='stable')]
+    return order
+
+
+def padded_tokens(lengths: Sequence[int], order: Sequence[int], batch_size: int) -> int:
+    """Tokens processed when examples are batched in ``order`` and padded to each batch's longest"""
+    lengths = np.asarray(lengths)[np.asarray(order)]
+    if len(lengths) == 0:
+        return 0
+    starts = np.arange(0, len(lengths), batch_size)
+    sizes = np.diff(np.append(starts, len(lengths)))
+    return int((np.maximum.reduceat(lengths, starts) * sizes).sum())
+
+
+def padding_report(lengths: Sequence[int], batch_size: int, map_batch_size: int = MAP_BATCH_SIZE,
+                   seed: int = 42) -> Dict:
+    """
+    Tokens processed per epoch under three ways of padding
+
+    map_padded: padding=True inside ``dataset.map`` (every example padded to
+        the longest in its map chunk), the old behaviour
+    random: unpadded ids in shuffled batches, padded at collation
+    bucketed: unpadded ids in length-grouped batches, padded at collation
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    real = int(lengths.sum())
+    identity = np.arange(len(lengths))
+    shuffled = np.random.default_rng(seed).permutation(len(lengths))
+    tokens = {
+        'map_padded': padded_tokens(lengths, identity, map_batch_size),
+        'random': padded_tokens(lengths, shuffled, batch_size),
+        'bucketed': padded_tokens(lengths, length_grouped_order(lengths, batch_size, seed=seed), batch_size),
+    }
+    return {
+        'examples': len(lengths),
+        'batch_size': batch_size,
+        'real_tokens': real,
+        'tokens': tokens,
+        'padding_fraction': {name: (1 - real / total) if total else 0.0 for name, total in tokens.items()},
+        'saved_fraction': (1 - tokens['bucketed'] / tokens['map_padded']) if tokens['map_padded'] else 0.0
+    }
+
+
+def format_padding_report(report: Dict) -> str:
+    padding = report['padding_fraction']
+    return (f"{report['examples']} examples, batch size {report['batch_size']}: padding "
+            f"{padding['map_padded']:.1%} when padded in map, {padding['random']:.1%} per batch, "
+            f"{padding['bucketed']:.1%} per length-grouped batch "
+            f"({report['saved_fraction']:.1%} fewer tokens than before)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report padding saved by per-batch padding and length grouping")
+    parser.add_argument("dataset", help="Tokenized dataset directory (save_to_disk / tokenization cache entry data)")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1, 4, 8, 16], help="Per-device batch sizes")
+    args = parser.parse_args()
+
+    from datasets import load_from_disk
+
+    lengths = dataset_lengths(load_from_disk(args.dataset))
+    print(f"📏 {len(lengths)} examples, mean {lengths.mean():.1f} tokens, max {lengths.max()}")
+    for batch_size in args.batch_size:
+        print(f"   {format_padding_report(padding_report(lengths, batch_size))}")
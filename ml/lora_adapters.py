@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+LoRA Adapters for Mr. Sarcastic
+Parameter-efficient fine-tuning: the base model is frozen (and kept in 16-bit)
+while small low-rank adapter matrices are trained and saved on their own, which
+makes fine-tuning feasible on CPU-only machines
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+
+import torch
+
+# Only the adapter paths need peft; base and fully fine-tuned models work without it
+try:
+    from peft import LoraConfig, PeftModel, TaskType, get_peft_model
+    from peft.utils import load_peft_weights, set_peft_model_state_dict
+except ImportError:
+    LoraConfig = PeftModel = TaskType = get_peft_model = None
+    load_peft_weights = set_peft_model_state_dict = None
+
+logger = logging.getLogger(__name__)
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# target_modules=None lets peft pick the attention projections for the
+# architecture (c_attn for GPT-2/DialoGPT, q_proj/v_proj for Llama and
+# Mistral, query_key_value for Falcon)
+DEFAULT_LORA_CONFIG = {
+    "r": 8,
+    "lora_alpha": 16,
+    "lora_dropout": 0.05,
+    "target_modules": None,
+}
+# Adapters train well at a much higher learning rate than full fine-tuning
+ADAPTER_LEARNING_RATE = 2e-4
+ADAPTER_CONFIG_FILE = "adapter_config.json"
+PEFT_MISSING = "LoRA adapters need peft (pip install peft)"
+
+
+def require_peft():
+    if PeftModel is None:
+        raise ImportError(PEFT_MISSING)
+
+
+def adapter_base_dtype() -> torch.dtype:
+    """dtype for frozen base weights: fp16 on GPU, bf16 on CPU (fp16 matmuls are slow there)"""
+    return torch.float16 if torch.cuda.is_available() else torch.bfloat16
+
+
+def _upcast_adapters(model):
+    """
+    Keep the LoRA matrices in fp32 on a 16-bit base
+
+    peft creates them in the base weights' dtype, which would run AdamW in
+    bf16 on CPU and make the fp16 GradScaler refuse fp16 gradients on GPU.
+    peft casts the layer input to the adapter dtype and the result back.
+    """
+    for name, param in model.named_parameters():
+        if "lora_" in name and param.dtype != torch.float32:
+            param.data = param.data.float()
+    return model
+
+
+def add_lora_adapters(model, **overrides) -> 'PeftModel':
+    """Freeze ``model`` and wrap it with trainable fp32 LoRA adapters (``overrides`` update DEFAULT_LORA_CONFIG)"""
+    require_peft()
+    settings = {**DEFAULT_LORA_CONFIG, **overrides}
+    config = LoraConfig(task_type=TaskType.CAUSAL_LM, bias="none", **settings)
+    return _upcast_adapters(get_peft_model(model, config))
+
+
+def is_adapter_dir(path: str) -> bool:
+    """True if ``path`` holds a saved adapter rather than a full model"""
+    return os.path.isfile(os.path.join(path, ADAPTER_CONFIG_FILE))
+
+
+def adapter_base_model(path: str) -> Optional[str]:
+    """Base model name or path an adapter was trained on"""
+    with open(os.path.join(path, ADAPTER_CONFIG_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f).get("base_model_name_or_path")
+
+
+def unwrap_adapters(model):
+    """The base model under any attached adapters (``model`` itself if it has none)"""
+    if PeftModel is not None and isinstance(model, PeftModel):
+        return model.unload()
+    return model
+
+
+def load_adapter(base_model, path: str, trainable: bool = False) -> 'PeftModel':
+    """Attach a saved adapter to a loaded base model (replacing any adapter already attached)"""
+    require_peft()
+    model = _upcast_adapters(PeftModel.from_pretrained(unwrap_adapters(base_model), path, is_trainable=trainable))
+    # from_pretrained copied the saved weights into 16-bit matrices; load them again at full precision
+    set_peft_model_state_dict(model, load_peft_weights(path))
+    return model
+
+
+def parameter_counts(model) -> Dict:
+    trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    total = sum(p.numel() for p in model.parameters())
+    return {
+        "trainable": trainable,
+        "total": total,
+        "trainable_fraction": trainable / total if total else 0.0
+    }
+
+
+def training_memory_estimate(model) -> Dict:
+    """
+    Bytes for weights, gradients and AdamW state (activations excluded)
+
+    Compares the model as it is (frozen base plus fp32 adapters) with
+    full-parameter fp32 training of the same network.
+    """
+    weights = sum(p.numel() * p.element_size() for p in model.parameters())
+    trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    base = sum(p.numel() for p in model.parameters() if not p.requires_grad)
+    # fp32 gradient plus two fp32 AdamW moments per trained parameter
+    adapter_bytes = weights + trainable * 12
+    full_bytes = (base + trainable) * 16
+    return {
+        "adapter_bytes": adapter_bytes,
+        "full_bytes": full_bytes,
+        "reduction": full_bytes / adapter_bytes if adapter_bytes else 0.0
+    }
+
+
+def format_adapter_report(model) -> str:
+    counts = parameter_counts(model)
+    memory = training_memory_estimate(model)
+    return (f"{counts['trainable']:,} of {counts['total']:,} parameters trainable "
+            f"({counts['trainable_fraction']:.2%}); weights + optimizer state "
+            f"{memory['adapter_bytes'] / 2**20:.0f} MB vs {memory['full_bytes'] / 2**20:.0f} MB "
+            f"for full fine-tuning ({memory['reduction']:.1f}x less)")
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(dirpath, name))
+               for dirpath, _, names in os.walk(path) for name in names)
+
+
+def tiny_gpt2(vocab_texts, vocab_size: int = 512, n_layer: int = 2, n_embd: int = 64):
+    """A randomly initialised GPT-2 and a byte-level BPE tokenizer trained on ``vocab_texts`` (no downloads)"""
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(vocab_texts, vocab_size=vocab_size, special_tokens=["<|endoftext|>"])
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe._tokenizer, eos_token="<|endoftext|>", pad_token="<|endoftext|>")
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=256, n_layer=n_layer, n_head=2, n_embd=n_embd,
+                        bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id)
+    return GPT2LMHeadModel(config), tokenizer
+
+
+def smoke_test(workdir: str, max_steps: int = 30) -> bool:
+    """
+    End-to-end adapter run on CPU with a tiny GPT-2
+
+    Fine-tunes through EnhancedSarcasticModel.fine_tune(adapter=True) on the
+    bundled sarcastic responses, then checks that the base weights did not
+    change, that only the adapter was saved, and that reloading it on the
+    base model reproduces the trained model's outputs.
+    """
+    from enhanced_model_service import EnhancedSarcasticModel
+    from tokenization_cache import TokenizationCache
+
+    with open(os.path.join(ML_DIR, 'sarcastic_responses.json'), 'r', encoding='utf-8') as f:
+        responses = [text for value in json.load(f).values() if isinstance(value, list)
+                     for text in value if isinstance(text, str)]
+    data_path = os.path.join(workdir, 'pairs.jsonl')
+    with open(data_path, 'w', encoding='utf-8') as f:
+        for text in responses:
+            f.write(json.dumps({"prompt": "User: say something\nSarcastic Chatbot: ", "completion": text}) + '\n')
+
+    torch.manual_seed(0)
+    base, tokenizer = tiny_gpt2(responses)
+    # Same dtypes as a real adapter run: 16-bit frozen base, fp32 adapters
+    base = base.to(adapter_base_dtype())
+    base_state = {name: tensor.clone() for name, tensor in base.state_dict().items()}
+
+    service = EnhancedSarcasticModel("falcon-7b", device="cpu",
+                                     tokenization_cache=TokenizationCache(os.path.join(workdir, 'tokenized')))
+    service.model, service.tokenizer, service.is_loaded = base, tokenizer, True
+    output_dir = service.fine_tune(
+        data_path, os.path.join(workdir, 'adapter'), adapter=True,
+        max_steps=max_steps, per_device_train_batch_size=4, gradient_accumulation_steps=1,
+        warmup_steps=0, logging_steps=10, save_steps=max_steps * 10, report_to=[]
+    )
+
+    checks = {}
+    trained = service.model.eval()
+    # peft keeps each wrapped layer's original weight under ``<layer>.base_layer``
+    trained_base = {name.replace(".base_layer", ""): tensor
+                    for name, tensor in trained.get_base_model().state_dict().items() if "lora_" not in name}
+    checks["base weights unchanged"] = all(torch.equal(trained_base[name], tensor) for name, tensor in base_state.items())
+    checks["adapters trained in fp32"] = all(param.dtype == torch.float32
+                                             for param in trained.parameters() if param.requires_grad)
+    checks["only adapter saved"] = is_adapter_dir(output_dir) and not any(
+        name.startswith(("model.safetensors", "pytorch_model")) for name in os.listdir(output_dir))
+
+    reloaded_base, _ = tiny_gpt2(responses)
+    reloaded_base = reloaded_base.to(adapter_base_dtype())
+    reloaded_base.load_state_dict(base_state)
+    reloaded = load_adapter(reloaded_base, output_dir).eval()
+    inputs = tokenizer("User: how are you?\nSarcastic Chatbot:", return_tensors="pt")
+    with torch.no_grad():
+        logits = trained(**inputs).logits
+        checks["reloaded adapter matches"] = torch.allclose(logits, reloaded(**inputs).logits, atol=1e-5)
+        with reloaded.disable_adapter():
+            checks["adapter changes outputs"] = not torch.allclose(logits, reloaded(**inputs).logits)
+
+    print(f"🧪 {format_adapter_report(trained)}")
+    print(f"💾 Adapter {_dir_size(output_dir) / 1024:.0f} KB vs base model "
+          f"{sum(t.numel() * t.element_size() for t in base_state.values()) / 1024:.0f} KB")
+    for name, passed in checks.items():
+        print(f"   {'✅' if passed else '❌'} {name}")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Inspect LoRA adapters or run the CPU smoke test")
+    parser.add_argument("adapter", nargs="?", help="Saved adapter directory to describe")
+    parser.add_argument("--smoke-test", action="store_true", help="Train and reload an adapter on a tiny GPT-2")
+    parser.add_argument("--steps", type=int, default=30, help="Training steps for the smoke test")
+    args = parser.parse_args()
+
+    if args.smoke_test:
+        with tempfile.TemporaryDirectory() as workdir:
+            passed = smoke_test(workdir, args.steps)
+        print("✅ Smoke test passed" if passed else "❌ Smoke test failed")
+        raise SystemExit(0 if passed else 1)
+    if args.adapter:
+        print(f"📦 {args.adapter}: base {adapter_base_model(args.adapter)}, {_dir_size(args.adapter) / 1024:.0f} KB")
+    else:
+        parser.print_help()
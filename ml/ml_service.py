@@ -1,17 +1,30 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
+import asyncio
 import json
 import os
+import threading
 import uvicorn
 from fine_tune_falcon import FalconFineTuner
 from youtube_extractor import YouTubeTranscriptExtractor
+from transcript_cache import TranscriptCache, DEFAULT_CACHE_DIR
+from keyword_classifier import KeywordClassifier
+from training_jobs import TrainingJobManager
 
 app = FastAPI(title="Mr. Sarcastic ML Service", version="1.0.0")
 
 # Global variables
+# fine_tuner is the serving model; a newly trained model is loaded into a fresh
+# FalconFineTuner off the request path and swapped in with one assignment
 fine_tuner = None
 model_loaded = False
+job_manager = None
+LEGACY_MODEL_PATH = "./falcon-humor-chatbot"
+current_model_path = None
+loading_model_path = None
+# Generation runs in executor threads, one request at a time per process
+generation_lock = threading.Lock()
 
 class ChatRequest(BaseModel):
     message: str
@@ -28,18 +41,29 @@ class TrainingRequest(BaseModel):
     youtube_urls: Optional[List[str]] = []
     custom_data: Optional[List[dict]] = []
     max_steps: Optional[int] = 500
+    transcript_cache_mode: Optional[str] = "use"  # "use", "only" (no downloads) or "refresh"
 
 class TrainingResponse(BaseModel):
     status: str
     message: str
     model_path: Optional[str] = None
+    job_id: Optional[str] = None
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize the ML service"""
-    global fine_tuner, model_loaded
+    global fine_tuner, model_loaded, job_manager, loading_model_path
     try:
-        fine_tuner = FalconFineTuner()
+        job_manager = TrainingJobManager(on_model_ready=switch_model)
+        model_path = job_manager.current_model_path or (
+            LEGACY_MODEL_PATH if os.path.exists(LEGACY_MODEL_PATH) else None)
+        if model_path:
+            # Load the last trained model in the background; /chat answers 503 until it is ready
+            loading_model_path = model_path
+            threading.Thread(target=switch_model, args=(model_path,), daemon=True).start()
+        else:
+            # Base model, loaded on the first chat
+            fine_tuner = FalconFineTuner()
         print("ML Service initialized successfully")
     except Exception as e:
         print(f"Error initializing ML service: {str(e)}")
@@ -52,20 +76,17 @@ async def health_check():
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Generate a sarcastic response to user input"""
-    global fine_tuner, model_loaded
+    # One read of the global: a model swapped in meanwhile serves the next request
+    tuner = fine_tuner
+    if not tuner:
+        if loading_model_path:
+            raise HTTPException(status_code=503, detail="Model is still loading")
+        raise HTTPException(status_code=500, detail="ML service not initialized")
     
     try:
-        if not fine_tuner:
-            raise HTTPException(status_code=500, detail="ML service not initialized")
-        
-        # Check if we have a fine-tuned model
-        model_path = "./falcon-humor-chatbot" if os.path.exists("./falcon-humor-chatbot") else None
-        
-        # Generate response
-        response = fine_tuner.generate_response(
-            request.message, 
-            max_length=100, 
-            model_path=model_path
+        # Generate response off the event loop
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, generate_with, tuner, request.message
         )
         
         # Simple mood detection based on keywords (can be enhanced)
@@ -80,93 +101,147 @@ async def chat(request: ChatRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
+def generate_with(tuner: FalconFineTuner, message: str) -> str:
+    with generation_lock:
+        return tuner.generate_response(message, max_length=100)
+
+def switch_model(model_path: str):
+    """
+    Load a trained model into a new FalconFineTuner and serve it from the next chat on
+    
+    Runs in a background thread (the training job watcher, or startup), so
+    chats keep using the previous model while the new one loads.
+    """
+    global fine_tuner, current_model_path, model_loaded, loading_model_path
+    loading_model_path = model_path
+    print(f"📥 Loading trained model: {model_path}")
+    try:
+        tuner = FalconFineTuner()
+        tuner.load_fine_tuned(model_path)
+    except Exception as e:
+        print(f"❌ Failed to load trained model {model_path}: {str(e)}")
+        if fine_tuner is None:
+            # Nothing served yet (startup): fall back to the base model
+            fine_tuner = FalconFineTuner()
+        return
+    finally:
+        loading_model_path = None
+    
+    fine_tuner = tuner
+    current_model_path = model_path
+    model_loaded = True
+    print(f"🔄 Switched to newly trained model: {model_path}")
+
+def run_training_job(progress, output_dir: str, dataset_path: Optional[str], custom_data: List[dict],
+                     youtube_urls: List[str], cache_mode: str, max_steps: int) -> str:
+    """Training job body, run by TrainingJobManager in a separate process"""
+    # Without an explicit path the dataset is written to the job's directory
+    dataset_path = dataset_path or os.path.join(os.path.dirname(output_dir), "dataset.jsonl")
+    progress.update(phase="preparing_data")
+    
+    # If custom data is provided, create a dataset file
+    if custom_data:
+        with open(dataset_path, 'w', encoding='utf-8') as f:
+            for item in custom_data:
+                f.write(json.dumps(item) + '\n')
+    
+    # Process YouTube URLs if provided
+    if youtube_urls:
+        youtube_data = process_youtube_urls(youtube_urls, cache_mode)
+        # Append to dataset
+        with open(dataset_path, 'a', encoding='utf-8') as f:
+            for item in youtube_data:
+                f.write(json.dumps(item) + '\n')
+    
+    progress.update(phase="loading_model")
+    return FalconFineTuner().train(
+        dataset_path=dataset_path,
+        output_dir=output_dir,
+        max_steps=max_steps,
+        callbacks=[progress.callback()]
+    )
+
 @app.post("/train", response_model=TrainingResponse)
 async def train_model(request: TrainingRequest):
-    """Train the model with custom data"""
-    global fine_tuner
+    """Start training in the background; poll /training-status/{job_id} for progress"""
+    if not job_manager:
+        raise HTTPException(status_code=500, detail="ML service not initialized")
     
     try:
-        if not fine_tuner:
-            raise HTTPException(status_code=500, detail="ML service not initialized")
-        
-        dataset_path = request.dataset_path or "custom_training_data.jsonl"
-        
-        # If custom data is provided, create a dataset file
-        if request.custom_data:
-            with open(dataset_path, 'w', encoding='utf-8') as f:
-                for item in request.custom_data:
-                    f.write(json.dumps(item) + '\n')
-        
-        # Process YouTube URLs if provided (placeholder for now)
-        if request.youtube_urls:
-            youtube_data = process_youtube_urls(request.youtube_urls)
-            # Append to dataset
-            with open(dataset_path, 'a', encoding='utf-8') as f:
-                for item in youtube_data:
-                    f.write(json.dumps(item) + '\n')
-        
-        # Start training
-        output_dir = "./falcon-humor-chatbot"
-        fine_tuner.train(
-            dataset_path=dataset_path,
-            output_dir=output_dir,
+        job_id = job_manager.submit(
+            run_training_job,
+            description=f"{len(request.custom_data or [])} custom pairs, {len(request.youtube_urls or [])} videos",
+            dataset_path=request.dataset_path,
+            custom_data=request.custom_data or [],
+            youtube_urls=request.youtube_urls or [],
+            cache_mode=request.transcript_cache_mode or "use",
             max_steps=request.max_steps or 500
         )
-        
-        global model_loaded
-        model_loaded = True
-        
-        return TrainingResponse(
-            status="success",
-            message="Model training completed successfully",
-            model_path=output_dir
-        )
-        
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         return TrainingResponse(
             status="error",
-            message=f"Training failed: {str(e)}"
+            message=f"Training failed to start: {str(e)}"
         )
+    
+    return TrainingResponse(
+        status="started",
+        message="Training started in the background",
+        job_id=job_id
+    )
 
 @app.get("/training-status")
 async def get_training_status():
     """Get the current training status"""
-    model_exists = os.path.exists("./falcon-humor-chatbot")
     return {
-        "model_trained": model_exists,
+        "model_trained": current_model_path is not None,
         "model_loaded": model_loaded,
-        "model_path": "./falcon-humor-chatbot" if model_exists else None
+        "model_path": current_model_path,
+        "loading_model_path": loading_model_path,
+        "active_job": job_manager.active_job() if job_manager else None
     }
 
+@app.get("/training-status/{job_id}")
+async def get_job_status(job_id: str):
+    """Progress of a training job (state, phase, step, loss, ETA)"""
+    status = job_manager.status(job_id) if job_manager else None
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Training job not found: {job_id}")
+    return status
+
+@app.get("/training-jobs")
+async def list_training_jobs():
+    """All training jobs, oldest first"""
+    return {"jobs": job_manager.list_jobs() if job_manager else []}
+
+@app.post("/training-jobs/{job_id}/cancel")
+def cancel_training_job(job_id: str):
+    """Stop a running training job (the served model is unchanged)"""
+    if not job_manager or not job_manager.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"No running training job: {job_id}")
+    return {"status": "cancelled", "job_id": job_id}
+
+MOOD_CLASSIFIER = KeywordClassifier({
+    'sad': ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset'],
+    'happy': ['happy', 'excited', 'joy', 'great', 'awesome', 'fantastic'],
+    'angry': ['angry', 'mad', 'furious', 'hate*', 'annoyed', 'pissed'],
+    'bored': ['bored', 'boring', 'dull', 'nothing to do', 'tired']
+}, default='neutral')
+
 def detect_mood(message: str) -> str:
     """Simple mood detection based on keywords"""
-    message_lower = message.lower()
-    
-    sad_keywords = ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset']
-    happy_keywords = ['happy', 'excited', 'joy', 'great', 'awesome', 'fantastic']
-    angry_keywords = ['angry', 'mad', 'furious', 'hate', 'annoyed', 'pissed']
-    bored_keywords = ['bored', 'boring', 'dull', 'nothing to do', 'tired']
-    
-    if any(word in message_lower for word in sad_keywords):
-        return "sad"
-    elif any(word in message_lower for word in happy_keywords):
-        return "happy"
-    elif any(word in message_lower for word in angry_keywords):
-        return "angry"
-    elif any(word in message_lower for word in bored_keywords):
-        return "bored"
-    else:
-        return "neutral"
-
-def process_youtube_urls(urls: List[str]) -> List[dict]:
-    """Process YouTube URLs and extract transcript data"""
+    return MOOD_CLASSIFIER.classify(message)
+
+def process_youtube_urls(urls: List[str], cache_mode: str = "use") -> List[dict]:
+    """Process YouTube URLs and extract transcript data (transcripts are cached on disk)"""
     if not urls:
         return []
     
     print(f"🎬 Processing {len(urls)} YouTube videos...")
     
     try:
-        extractor = YouTubeTranscriptExtractor()
+        extractor = YouTubeTranscriptExtractor(cache=TranscriptCache(DEFAULT_CACHE_DIR, cache_mode))
         processed_data = []
         
         for url in urls:
@@ -184,6 +259,7 @@ def process_youtube_urls(urls: List[str]) -> List[dict]:
                 continue
                 
         print(f"✅ Successfully processed {len(processed_data)} training pairs from YouTube")
+        print(f"📦 Transcript cache: {extractor.cache.stats()}")
         return processed_data
         
     except Exception as e:
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Hashed N-gram Mood Model for Mr. Sarcastic
+Linear softmax classifier over hashed word and character n-grams, trained from
+the keyword tables and the response corpus and scored in batches with NumPy
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+import zlib
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from keyword_classifier import KeywordClassifier, MOOD_KEYWORDS
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join(ML_DIR, 'mood_model.npz')
+
+# Phrases wrapped around every table keyword to give the model seed examples
+SEED_TEMPLATES = [
+    "{}",
+    "i feel {}",
+    "i'm so {}",
+    "feeling {} today",
+    "i am {} right now",
+    "kind of {} lately",
+    "ugh, {}",
+    "honestly just {}",
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+class HashedNgramFeaturizer:
+    """Maps text to hashed word and character n-gram feature ids"""
+
+    BIAS_FEATURE = 0
+
+    def __init__(self, n_features: int = 2 ** 18, char_ngrams: Tuple[int, int] = (3, 5),
+                 word_ngrams: int = 2, cache_size: int = 100000):
+        self.n_features = n_features
+        self.char_ngrams = char_ngrams
+        self.word_ngrams = word_ngrams
+        self.cache_size = cache_size
+        self._token_cache: Dict[str, Tuple[int, ...]] = {}
+
+    def _hash(self, feature: str) -> int:
+        # Feature 0 is reserved for the bias so every row has at least one entry
+        return 1 + zlib.crc32(feature.encode('utf-8')) % (self.n_features - 1)
+
+    def _token_features(self, token: str) -> Tuple[int, ...]:
+        """Word and character n-gram ids for one token or word n-gram (cached)"""
+        cached = self._token_cache.get(token)
+        if cached is None:
+            ids = [self._hash('w:' + token)]
+            # Word n-grams (joined with spaces) only get the word feature
+            if ' ' not in token:
+                padded = f"<{token}>"
+                min_n, max_n = self.char_ngrams
+                for n in range(min_n, max_n + 1):
+                    for i in range(len(padded) - n + 1):
+                        ids.append(self._hash('c:' + padded[i:i + n]))
+            cached = tuple(ids)
+            if len(self._token_cache) >= self.cache_size:
+                self._token_cache.clear()
+            self._token_cache[token] = cached
+        return cached
+
+    def features(self, text: str) -> List[int]:
+        """Return the feature ids for one message (repeats count as term frequency)"""
+        tokens = _TOKEN_RE.findall(text.lower())
+        found = [self.BIAS_FEATURE]
+
+        for token in tokens:
+            found.extend(self._token_features(token))
+
+        for n in range(2, self.word_ngrams + 1):
+            for i in range(len(tokens) - n + 1):
+                found.extend(self._token_features(' '.join(tokens[i:i + n])))
+
+        return found
+
+    def transform(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Featurize a batch into flat CSR-style arrays
+
+        Returns:
+            (indices, values, starts) where row ``r`` owns
+            ``indices[starts[r]:starts[r + 1]]``; values are 1/sqrt(row length)
+        """
+        rows = [self.features(text) for text in texts]
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        starts = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=starts[1:])
+
+        indices = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=int(starts[-1]))
+        values = np.repeat((1.0 / np.sqrt(lengths)).astype(np.float32), lengths)
+        return indices, values, starts
+
+
+class MoodModel:
+    """Softmax regression over hashed n-grams with batched NumPy scoring"""
+
+    def __init__(self, labels: Sequence[str], featurizer: Optional[HashedNgramFeaturizer] = None):
+        self.labels = list(labels)
+        self.label_index = {label: i for i, label in enumerate(self.labels)}
+        self.featurizer = featurizer or HashedNgramFeaturizer()
+        self.weights = np.zeros((self.featurizer.n_features, len(self.labels)), dtype=np.float32)
+
+    def _scores(self, indices: np.ndarray, values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        # Sparse (batch x features) @ dense (features x labels): gather the
+        # touched weight rows once, then sum each message's segment
+        if len(starts) <= 1:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        contributions = self.weights[indices] * values[:, None]
+        return np.add.reduceat(contributions, starts[:-1], axis=0)
+
+    @staticmethod
+    def _softmax(scores: np.ndarray) -> np.ndarray:
+        scores = scores - scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Class probabilities for a batch of messages (rows follow ``texts``)"""
+        return self._softmax(self._scores(*self.featurizer.transform(texts)))
+
+    def predict(self, texts: Sequence[str]) -> List[Tuple[str, float]]:
+        """Return ``(label, confidence)`` for each message"""
+        probabilities = self.predict_proba(texts)
+        best = probabilities.argmax(axis=1)
+        return [(self.labels[i], float(probabilities[row, i])) for row, i in enumerate(best)]
+
+    def predict_one(self, text: str) -> Tuple[str, float]:
+        return self.predict([text])[0]
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], epochs: int = 8,
+            learning_rate: float = 0.5, l2: float = 1e-5, batch_size: int = 256,
+            seed: int = 42, verbose: bool = True) -> 'MoodModel':
+        """Train with class-balanced mini-batch SGD"""
+        y = np.array([self.label_index[label] for label in labels], dtype=np.int64)
+        indices, values, starts = self.featurizer.transform(texts)
+        lengths = np.diff(starts)
+        n_samples = len(y)
+
+        counts = np.bincount(y, minlength=len(self.labels)).astype(np.float32)
+        class_weight = n_samples / (len(self.labels) * np.maximum(counts, 1))
+        rng = np.random.default_rng(seed)
+
+        for epoch in range(epochs):
+            lr = learning_rate / (1 + epoch)
+            order = rng.permutation(n_samples)
+            total_loss = 0.0
+
+            for begin in range(0, n_samples, batch_size):
+                batch = order[begin:begin + batch_size]
+                batch_lengths = lengths[batch]
+                batch_starts = np.zeros(len(batch) + 1, dtype=np.int64)
+                np.cumsum(batch_lengths, out=batch_starts[1:])
+                # Positions of every batch entry inside the flat arrays
+                offsets = np.arange(batch_starts[-1]) - np.repeat(batch_starts[:-1], batch_lengths)
+                positions = np.repeat(starts[batch], batch_lengths) + offsets
+                batch_indices = indices[positions]
+                batch_values = values[positions]
+
+                probabilities = self._softmax(self._scores(batch_indices, batch_values, batch_starts))
+                targets = y[batch]
+                sample_weight = class_weight[targets]
+                total_loss -= float(np.sum(sample_weight * np.log(probabilities[np.arange(len(batch)), targets] + 1e-9)))
+
+                delta = probabilities
+                delta[np.arange(len(batch)), targets] -= 1.0
+                delta *= sample_weight[:, None]
+
+                gradient = batch_values[:, None] * np.repeat(delta, batch_lengths, axis=0)
+                gradient += l2 * self.weights[batch_indices]
+                np.add.at(self.weights, batch_indices, -lr * gradient)
+
+            if verbose:
+                print(f"   Epoch {epoch + 1}/{epochs} - loss {total_loss / max(n_samples, 1):.4f}")
+
+        return self
+
+    def save(self, path: str = DEFAULT_MODEL_PATH) -> str:
+        """Store only the non-zero weight rows as float16"""
+        rows = np.flatnonzero(np.any(self.weights != 0, axis=1)).astype(np.uint32)
+        featurizer = self.featurizer
+        np.savez_compressed(
+            path,
+            rows=rows,
+            weights=self.weights[rows].astype(np.float16),
+            labels=np.array(self.labels),
+            config=np.array([featurizer.n_features, featurizer.char_ngrams[0],
+                             featurizer.char_ngrams[1], featurizer.word_ngrams], dtype=np.int64)
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MODEL_PATH) -> 'MoodModel':
+        with np.load(path, allow_pickle=False) as data:
+            n_features, char_min, char_max, word_ngrams = (int(v) for v in data['config'])
+            featurizer = HashedNgramFeaturizer(n_features, (char_min, char_max), word_ngrams)
+            model = cls([str(label) for label in data['labels']], featurizer)
+            model.weights[data['rows']] = data['weights'].astype(np.float32)
+        return model
+
+
+def seed_examples(categories: Dict[str, Iterable[str]]) -> Tuple[List[str], List[str]]:
+    """Expand every table keyword through the seed templates"""
+    texts, labels = [], []
+    for label, keywords in categories.items():
+        for keyword in keywords:
+            keyword = keyword.rstrip('*')
+            for template in SEED_TEMPLATES:
+                texts.append(template.format(keyword))
+                labels.append(label)
+    return texts, labels
+
+
+def load_corpus_texts(ml_dir: str = ML_DIR, chunk_words: int = 40) -> List[str]:
+    """Collect unlabelled text from the response corpus and processed YouTube data"""
+    texts = []
+
+    responses_path = os.path.join(ml_dir, 'sarcastic_responses.json')
+    if os.path.exists(responses_path):
+        with open(responses_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        texts.extend(data.get('responses', []))
+        texts.extend(text for _, text in data.get('patterns', []))
+
+    for path in sorted(glob.glob(os.path.join(ml_dir, 'processed_*.jsonl'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                for key in ('input', 'output', 'completion'):
+                    if item.get(key):
+                        texts.append(item[key].strip())
+                if item.get('prompt'):
+                    texts.append(item['prompt'].replace('User:', '').split('\n')[0].strip())
+
+    # Raw transcripts are long; split them into message-sized chunks
+    raw_path = os.path.join(ml_dir, 'youtube_humor_dataset.jsonl')
+    if os.path.exists(raw_path):
+        with open(raw_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    words = json.loads(line).get('text', '').split()
+                except json.JSONDecodeError:
+                    continue
+                for i in range(0, len(words), chunk_words):
+                    texts.append(' '.join(words[i:i + chunk_words]))
+
+    return [text for text in texts if text]
+
+
+def build_training_set(categories: Dict[str, Iterable[str]] = MOOD_KEYWORDS, default: str = 'neutral',
+                       corpus_texts: Optional[List[str]] = None, default_ratio: float = 1.0,
+                       seed: int = 42) -> Tuple[List[str], List[str]]:
+    """
+    Seed examples plus corpus text weakly labelled by the keyword rules
+
+    Unmatched corpus text becomes the default class, capped at
+    ``default_ratio`` times the number of labelled examples.
+    """
+    texts, labels = seed_examples(categories)
+    classifier = KeywordClassifier(categories, default=default)
+    unlabelled = []
+
+    for text in corpus_texts or []:
+        label = classifier.classify(text)
+        if label == default:
+            unlabelled.append(text)
+        else:
+            texts.append(text)
+            labels.append(label)
+
+    rng = np.random.default_rng(seed)
+    keep = min(len(unlabelled), int(len(texts) * default_ratio))
+    for i in rng.permutation(len(unlabelled))[:keep]:
+        texts.append(unlabelled[i])
+        labels.append(default)
+
+    return texts, labels
+
+
+def train_mood_model(output_path: str = DEFAULT_MODEL_PATH, epochs: int = 8,
+                     n_features: int = 2 ** 18) -> MoodModel:
+    """Train the mood model from MOOD_KEYWORDS and the local corpus"""
+    corpus = load_corpus_texts()
+    texts, labels = build_training_set(MOOD_KEYWORDS, 'neutral', corpus)
+    print(f"📚 Training mood model on {len(texts)} examples ({len(corpus)} corpus texts)")
+
+    model = MoodModel(list(MOOD_KEYWORDS) + ['neutral'], HashedNgramFeaturizer(n_features))
+    start = time.time()
+    model.fit(texts, labels, epochs=epochs)
+
+    predicted = [label for label, _ in model.predict(texts)]
+    accuracy = sum(p == t for p, t in zip(predicted, labels)) / max(len(labels), 1)
+    print(f"✅ Trained in {time.time() - start:.1f}s - training accuracy {accuracy:.1%}")
+
+    model.save(output_path)
+    print(f"💾 Saved {os.path.getsize(output_path) / 1024:.1f} KB to {output_path}")
+    return model
+
+
+def benchmark(model: MoodModel, batch_size: int = 10000):
+    """Compare batched scoring against one call per message"""
+    corpus = load_corpus_texts() or [template.format(k) for k in MOOD_KEYWORDS['sad'] for template in SEED_TEMPLATES]
+    texts = [corpus[i % len(corpus)] for i in range(batch_size)]
+
+    start = time.time()
+    model.predict(texts)
+    batched = time.time() - start
+
+    sample = texts[:min(len(texts), 1000)]
+    start = time.time()
+    for text in sample:
+        model.predict_one(text)
+    per_message = (time.time() - start) / len(sample) * len(texts)
+
+    print(f"⚡ {batch_size} messages: batched {batched * 1000:.1f}ms, "
+          f"per-message (extrapolated) {per_message * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or query the hashed n-gram mood model")
+    parser.add_argument("--train", action="store_true", help="Train and save the model")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Model file path")
+    parser.add_argument("--epochs", type=int, default=8, help="Training epochs")
+    parser.add_argument("--features", type=int, default=2 ** 18, help="Hash space size")
+    parser.add_argument("--benchmark", type=int, default=0, metavar="N", help="Score N messages in one batch")
+    parser.add_argument("messages", nargs="*", help="Messages to classify")
+
+    args = parser.parse_args()
+
+    if args.train:
+        mood_model = train_mood_model(args.model, args.epochs, args.features)
+    else:
+        start = time.time()
+        mood_model = MoodModel.load(args.model)
+        print(f"📂 Loaded {args.model} in {(time.time() - start) * 1000:.1f}ms")
+
+    for message, (mood, confidence) in zip(args.messages, mood_model.predict(args.messages)):
+        print(f"{mood:>10} {confidence:.2f}  {message}")
+
+    if args.benchmark:
+        benchmark(mood_model, args.benchmark)
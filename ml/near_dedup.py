@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Filter for Mr. Sarcastic
+Streams training texts through MinHash signatures and LSH band tables so
+transcript segments that differ by a few edits are kept only once; band
+matches are candidates, confirmed by their signature-estimated similarity
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar('T')
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """Overlapping word n-grams of the normalised text (the whole text if it is shorter)"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return [' '.join(words)]
+    return [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def candidate_probability(similarity: float, bands: int, rows: int) -> float:
+    """Chance that two texts of this Jaccard similarity share at least one band"""
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def optimal_bands(threshold: float, num_perm: int, recall: float = 0.99) -> Tuple[int, int]:
+    """
+    ``(bands, rows)`` with ``bands * rows <= num_perm`` for candidate generation
+
+    The S-curve is centred well below ``threshold``: the most selective
+    banding that still makes a pair at exactly ``threshold`` a candidate
+    with probability ``recall``. The extra candidates cost a signature
+    comparison each, and are dropped there.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if candidate_probability(threshold, bands, rows) < recall:
+            break
+        best = (bands, rows)
+    return best
+
+
+class NearDuplicateFilter:
+    """
+    Streaming MinHash/LSH de-duplication
+
+    Texts are processed in chunks: the word shingles of a chunk are hashed
+    with ``num_perm`` universal hash functions in one numpy pass, and each
+    signature is cut into bands. Bands are sized for a lower effective
+    threshold (see ``optimal_bands``), so a kept text sharing a band key is
+    only a candidate: the text joins the cluster of the candidate with the
+    highest signature-estimated Jaccard similarity if that reaches
+    ``verify_threshold`` and is dropped; otherwise it starts a new cluster
+    and is kept. The estimate is noisy (standard error
+    ``sqrt(t * (1 - t) / num_perm)``), so ``verify_threshold`` defaults to
+    one standard error below ``threshold``; otherwise pairs just above the
+    threshold would be missed about half of the time.
+
+    Band keys of kept texts live in sorted numpy runs per band that are
+    merged log-structured style, so lookups are vectorised binary searches.
+    Memory is about 12 bytes per band plus the ``4 * num_perm``-byte
+    signature per kept text, and a cluster-size counter; nothing depends on
+    text length and dropped texts cost nothing.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 3,
+                 chunk_size: int = 512, seed: int = 1, verify_threshold: Optional[float] = None):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.chunk_size = chunk_size
+        if verify_threshold is None:
+            verify_threshold = threshold - float(np.sqrt(threshold * (1 - threshold) / num_perm))
+        self.verify_threshold = verify_threshold
+        self.bands, self.rows = optimal_bands(verify_threshold, num_perm)
+
+        rng = np.random.default_rng(seed)
+        # a, b < 2**32 keep a * x + b below 2**64 for 32-bit shingle hashes
+        self._a = rng.integers(1, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        # Odd multipliers folding a band's rows into one 64-bit key
+        self._fold = rng.integers(1, 1 << 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+
+        # Per band: list of (sorted keys, cluster ids) runs
+        self._runs: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in range(self.bands)]
+        self._cluster_sizes = np.zeros(1024, dtype=np.int32)
+        # Signature of each kept text, indexed by cluster id
+        self._signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self.candidates = 0
+        self.rejected = 0
+        self.seen = 0
+        self.kept = 0
+        self.seconds = 0.0
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """``(len(texts), num_perm)`` uint32 MinHash signatures"""
+        hashes = []
+        offsets = np.zeros(len(texts), dtype=np.int64)
+        for i, text in enumerate(texts):
+            offsets[i] = len(hashes)
+            hashes.extend(zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(text, self.shingle_size))
+
+        values = np.array(hashes, dtype=np.uint64)
+        permuted = ((self._a * values + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """``(n, bands)`` uint64 keys, one per band of each signature"""
+        banded = signatures[:, :self.bands * self.rows].reshape(len(signatures), self.bands, self.rows)
+        return (banded.astype(np.uint64) * self._fold).sum(axis=2, dtype=np.uint64)
+
+    def similarity(self, signatures: np.ndarray, others: np.ndarray) -> np.ndarray:
+        """Estimated Jaccard similarity of paired signatures (share of equal MinHash values)"""
+        return (signatures == others).mean(axis=-1)
+
+    def _lookup(self, keys: np.ndarray, signatures: np.ndarray) -> np.ndarray:
+        """Most similar kept cluster (estimated Jaccard >= verify_threshold) sharing a band key with each row, or -1"""
+        rows, ids = [], []
+        for band, runs in enumerate(self._runs):
+            column = keys[:, band]
+            for run_keys, run_ids in runs:
+                index = np.minimum(np.searchsorted(run_keys, column), len(run_keys) - 1)
+                hit = np.flatnonzero(run_keys[index] == column)
+                rows.append(hit)
+                ids.append(run_ids[index[hit]])
+
+        found = np.full(len(keys), -1, dtype=np.int64)
+        if not rows:
+            return found
+        pairs = np.unique(np.stack([np.concatenate(rows), np.concatenate(ids).astype(np.int64)], axis=1), axis=0)
+        if not len(pairs):
+            return found
+        estimates = self.similarity(signatures[pairs[:, 0]], self._signatures[pairs[:, 1]])
+        verified = estimates >= self.verify_threshold
+        self.candidates += len(pairs)
+        self.rejected += int(len(pairs) - verified.sum())
+
+        # Best estimate per row, smallest cluster id on ties
+        pairs, estimates = pairs[verified], estimates[verified]
+        order = np.lexsort((pairs[:, 1], -estimates, pairs[:, 0]))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pairs[order[1:], 0] != pairs[order[:-1], 0]
+        best = pairs[order[first]]
+        found[best[:, 0]] = best[:, 1]
+        return found
+
+    def _insert(self, keys: np.ndarray, cluster_ids: np.ndarray):
+        for band, runs in enumerate(self._runs):
+            order = np.argsort(keys[:, band], kind='stable')
+            runs.append((keys[order, band], cluster_ids[order]))
+            # Merge runs of similar size so there are O(log n) of them
+            while len(runs) > 1 and len(runs[-2][0]) <= 2 * len(runs[-1][0]):
+                (keys_a, ids_a), (keys_b, ids_b) = runs.pop(-2), runs.pop()
+                merged = np.concatenate([keys_a, keys_b])
+                order = np.argsort(merged, kind='stable')
+                runs.append((merged[order], np.concatenate([ids_a, ids_b])[order]))
+
+    def _grow(self, size: int):
+        if size > len(self._cluster_sizes):
+            capacity = max(size, 2 * len(self._cluster_sizes))
+            grown = np.zeros(capacity, dtype=np.int32)
+            grown[:len(self._cluster_sizes)] = self._cluster_sizes
+            self._cluster_sizes = grown
+            signatures = np.zeros((capacity, self.num_perm), dtype=np.uint32)
+            signatures[:len(self._signatures)] = self._signatures
+            self._signatures = signatures
+
+    def check(self, texts: List[str]) -> np.ndarray:
+        """
+        Cluster id for each text, marking kept texts as seen
+
+        A text is kept when its cluster id is new, i.e. equal to the number of
+        texts kept before it. Texts are compared in order, ``chunk_size`` at a time.
+        """
+        if len(texts) <= self.chunk_size:
+            return self._check_chunk(texts)
+        return np.concatenate([self._check_chunk(texts[i:i + self.chunk_size])
+                               for i in range(0, len(texts), self.chunk_size)])
+
+    def _check_chunk(self, texts: List[str]) -> np.ndarray:
+        start = time.perf_counter()
+        signatures = self.signatures(texts)
+        keys = self.band_keys(signatures)
+        clusters = self._lookup(keys, signatures)
+
+        # Texts of this chunk that match neither the index nor an earlier text of the chunk are new
+        local: Dict[Tuple[int, int], List[int]] = {}
+        new_rows = []
+        for i, row in enumerate(keys.tolist()):
+            if clusters[i] >= 0:
+                continue
+            candidates = sorted({j for band, key in enumerate(row) for j in local.get((band, key), ())})
+            if candidates:
+                estimates = self.similarity(signatures[i], signatures[candidates])
+                self.candidates += len(candidates)
+                self.rejected += int((estimates < self.verify_threshold).sum())
+                best = int(np.argmax(estimates))
+                if estimates[best] >= self.verify_threshold:
+                    clusters[i] = clusters[candidates[best]]
+                    continue
+            clusters[i] = self.kept + len(new_rows)
+            new_rows.append(i)
+            for band, key in enumerate(row):
+                local.setdefault((band, key), []).append(i)
+
+        self._grow(self.kept + len(new_rows))
+        if new_rows:
+            self._insert(keys[new_rows], clusters[new_rows])
+            self._signatures[self.kept:self.kept + len(new_rows)] = signatures[new_rows]
+        self.kept += len(new_rows)
+        self.seen += len(texts)
+        np.add.at(self._cluster_sizes, clusters, 1)
+        self.seconds += time.perf_counter() - start
+        return clusters
+
+    def filter(self, items: Iterable[T], key: Callable[[T], str] = str) -> Iterator[T]:
+        """Yield the items whose ``key`` text is not a near-duplicate of an earlier one, in order"""
+        chunk: List[T] = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                yield from self._kept(chunk, key)
+                chunk = []
+        if chunk:
+            yield from self._kept(chunk, key)
+
+    def _kept(self, chunk: List[T], key: Callable[[T], str]) -> Iterator[T]:
+        # New cluster ids are handed out in order, so each one's first item is the kept text
+        next_new = self.kept
+        for item, cluster in zip(chunk, self.check([key(item) for item in chunk])):
+            if cluster == next_new:
+                next_new += 1
+                yield item
+
+    def stats(self, top: int = 5) -> Dict:
+        """Kept/dropped counts and the cluster-size distribution"""
+        sizes = self._cluster_sizes[:self.kept]
+        duplicated = sizes[sizes > 1]
+        histogram = Counter(min(int(size), 10) for size in duplicated)
+        largest = np.argsort(-sizes, kind='stable')[:top]
+        return {
+            'threshold': self.threshold,
+            'verify_threshold': round(self.verify_threshold, 3),
+            'bands': self.bands,
+            'rows': self.rows,
+            'seen': self.seen,
+            'kept': self.kept,
+            'dropped': self.seen - self.kept,
+            'candidates': self.candidates,
+            'rejected_candidates': self.rejected,
+            'clusters_with_duplicates': int(len(duplicated)),
+            'cluster_size_histogram': {('10+' if size == 10 else str(size)): count
+                                       for size, count in sorted(histogram.items())},
+            'largest_clusters': [{'kept_index': int(i), 'size': int(sizes[i])} for i in largest if sizes[i] > 1],
+            'texts_per_second': round(self.seen / self.seconds) if self.seconds else None
+        }
+
+
+def print_stats(stats: Dict):
+    print(f"🧹 Near-duplicates: kept {stats['kept']}/{stats['seen']}, dropped {stats['dropped']} "
+          f"(threshold {stats['threshold']}, {stats['bands']} bands x {stats['rows']} rows)")
+    print(f"   Band candidates: {stats['candidates']}, rejected by signature similarity "
+          f"(< {stats['verify_threshold']}): {stats['rejected_candidates']}")
+    print(f"   Clusters with duplicates: {stats['clusters_with_duplicates']}  sizes: {stats['cluster_size_histogram']}")
+    for cluster in stats['largest_clusters']:
+        print(f"   kept text #{cluster['kept_index']}: {cluster['size']} copies")
+
+
+def mutate(text: str, rng: random.Random, edits: int) -> str:
+    """Copy of ``text`` with ``edits`` single-word substitutions, insertions or deletions"""
+    words = text.split()
+    for _ in range(edits):
+        i = rng.randrange(len(words))
+        op = rng.random()
+        if op < 0.4:
+            words[i] = rng.choice(['like', 'um', 'basically', 'literally', 'so', 'right'])
+        elif op < 0.7:
+            words.insert(i, rng.choice(['uh', 'you know', 'I mean']))
+        elif len(words) > 5:
+            del words[i]
+    return ' '.join(words)
+
+
+def jaccard(a: str, b: str, shingle_size: int = 3) -> float:
+    """Exact shingle Jaccard similarity (what the signatures estimate)"""
+    first, second = set(shingles(a, shingle_size)), set(shingles(b, shingle_size))
+    return len(first & second) / len(first | second)
+
+
+def benchmark(size: int = 100000, threshold: float = 0.8):
+    """Recall by true similarity on synthetic segments with near-duplicate copies, plus throughput"""
+    rng = random.Random(42)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    originals = [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(20, 40))) for _ in range(size // 2)]
+    copies = []
+    for _ in range(size - len(originals)):
+        source = rng.randrange(len(originals))
+        copies.append((mutate(originals[source], rng, rng.randint(1, 3)), source))
+
+    dedup = NearDuplicateFilter(threshold)
+    start = time.perf_counter()
+    original_clusters = dedup.check(originals)
+    copy_clusters = dedup.check([text for text, _ in copies])
+    seconds = time.perf_counter() - start
+
+    # A copy is caught when it lands in its source's cluster
+    caught = Counter()
+    total = Counter()
+    for (text, source), cluster in zip(copies, copy_clusters):
+        similarity = jaccard(text, originals[source])
+        band = 'above' if similarity >= threshold else 'near' if similarity >= threshold - 0.1 else 'below'
+        total[band] += 1
+        caught[band] += cluster == original_clusters[source]
+    merged_originals = len(originals) - len(set(original_clusters.tolist()))
+
+    print(f"🧹 {size} texts ({len(copies)} edited copies) in {seconds:.1f}s ({size / seconds:,.0f} texts/s)")
+    for band, label in (('above', f">= {threshold}"), ('near', f"{threshold - 0.1:.1f}-{threshold}"),
+                        ('below', f"< {threshold - 0.1:.1f}")):
+        if total[band]:
+            print(f"   Copies with similarity {label:>9}: {caught[band] / total[band]:6.1%} dropped ({total[band]})")
+    print(f"   Unrelated originals merged: {merged_originals}")
+    print_stats(dedup.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drop near-duplicate records from a JSONL dataset")
+    parser.add_argument("input_file", nargs='?', help="JSONL dataset")
+    parser.add_argument("--output", "-o", help="Where to write the kept records")
+    parser.add_argument("--field", default="output", help="Record field to compare (e.g. output, completion, text)")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard similarity treated as duplicate")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash permutations")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Benchmark on N synthetic segments")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.threshold)
+    elif args.input_file and args.output:
+        dedup = NearDuplicateFilter(args.threshold, args.num_perm)
+        with open(args.input_file, 'r', encoding='utf-8') as src, open(args.output, 'w', encoding='utf-8') as dst:
+            records = (json.loads(line) for line in src if line.strip())
+            for record in dedup.filter(records, key=lambda record: str(record.get(args.field, ''))):
+                dst.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print_stats(dedup.stats())
+    else:
+        parser.print_help()
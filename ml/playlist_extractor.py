@@ -5,12 +5,38 @@ Extracts song information from YouTube Music playlists for the Songs page
 """
 
 import re
+import os
 import json
+import time
+import random
+import asyncio
+import textwrap
+import argparse
 import requests
-from typing import List, Dict, Optional
+from requests.adapters import HTTPAdapter
+from typing import Any, AsyncIterator, Iterable, List, Dict, Optional, TextIO, Tuple
 import urllib.parse
 from dataclasses import dataclass
 from datetime import datetime
+from song_catalog import write_catalog
+from keyword_classifier import KeywordClassifier
+
+YOUTUBE_API_BASE = "https://www.googleapis.com/youtube/v3"
+PAGE_SIZE = 50  # YouTube Data API maximum for playlistItems and videos
+
+# 403 reasons that mean "slow down" rather than "forbidden"
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+class PlaylistFetchError(Exception):
+    """Raised when the YouTube Data API keeps failing for a playlist"""
+
+def parse_iso_duration(duration: str) -> int:
+    """Convert an ISO 8601 duration (PT1H2M3S) to seconds"""
+    match = re.fullmatch(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?', duration or '')
+    if not match:
+        return 0
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
 
 @dataclass
 class Song:
@@ -26,7 +52,38 @@ class Song:
 class YouTubeMusicPlaylistExtractor:
     """Extract songs from YouTube Music playlists"""
     
-    def __init__(self):
+    # Checked after mood_categories, in order, when no mood keyword matches
+    FALLBACK_PATTERNS = [
+        ('Energetic', ['remix', 'dance', 'club', 'beat']),
+        ('Sad', ['ballad', 'slow', 'piano', 'violin']),
+        ('Relaxed', ['acoustic', 'unplugged', 'soft'])
+    ]
+    DEFAULT_MOOD = 'Happy'
+    
+    def __init__(self, api_key: Optional[str] = None, api_base: str = YOUTUBE_API_BASE,
+                 concurrency: int = 8, max_retries: int = 5, backoff_base: float = 1.0,
+                 timeout: float = 30.0):
+        """
+        Args:
+            api_key: YouTube Data API key (defaults to $YOUTUBE_API_KEY)
+            api_base: API root, overridable to point at a local stub server
+            concurrency: Maximum in-flight API requests
+            max_retries: Retries per request on rate limits and server errors
+            backoff_base: First backoff delay in seconds (doubles per retry)
+        """
+        self.api_key = api_key or os.environ.get('YOUTUBE_API_KEY')
+        self.api_base = api_base.rstrip('/')
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        
+        # One pooled session shared by every worker thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
         self.mood_categories = {
             # Map keywords to moods based on song titles/artists
             'chill': ['chill', 'lofi', 'relax', 'calm', 'peace', 'ambient', 'smooth', 'mellow'],
@@ -52,25 +109,47 @@ class YouTubeMusicPlaylistExtractor:
         
         return None
     
+    def _get_categorizer(self) -> KeywordClassifier:
+        """Compile mood_categories plus the fallback patterns into one automaton (rebuilt if edited)"""
+        if getattr(self, '_categorizer_source', None) != self.mood_categories:
+            table = {mood: keywords for mood, keywords in self.mood_categories.items()}
+            for mood, keywords in self.FALLBACK_PATTERNS:
+                table[f"fallback:{mood}"] = keywords
+            self._categorizer = KeywordClassifier(table, word_boundary=False)
+            self._categorizer_source = {mood: list(keywords) for mood, keywords in self.mood_categories.items()}
+        return self._categorizer
+    
+    def categorize_songs(self, songs: Iterable[Tuple[str, str]]) -> List[Tuple[str, Dict[str, int]]]:
+        """
+        Categorize many (title, artist) pairs in one batch
+        
+        Returns:
+            ``(mood, scores)`` per song, where ``mood`` matches
+            categorize_song and ``scores`` counts keyword hits per mood
+        """
+        categorizer = self._get_categorizer()
+        mood_names = [mood.title() for mood in self.mood_categories]
+        n_moods = len(mood_names)
+        label_moods = {
+            label: label[len('fallback:'):] if label.startswith('fallback:') else label.title()
+            for label in categorizer.labels_by_priority
+        }
+        label_moods[None] = self.DEFAULT_MOOD
+
+        def finalize(label, counts):
+            return label_moods[label], dict(zip(mood_names, counts[:n_moods]))
+
+        texts = (f"{title} {artist}" for title, artist in songs)
+        # Songs with identical keyword hits share one finalized entry; hand
+        # each song its own scores dict
+        return [
+            (mood, scores.copy())
+            for mood, scores in categorizer.classify_with_scores_batch(texts, finalize)
+        ]
+    
     def categorize_song(self, title: str, artist: str) -> str:
         """Categorize song based on title and artist keywords"""
-        combined_text = f"{title} {artist}".lower()
-        
-        # Check each mood category
-        for mood, keywords in self.mood_categories.items():
-            for keyword in keywords:
-                if keyword in combined_text:
-                    return mood.title()
-        
-        # Default categorization based on common patterns
-        if any(word in combined_text for word in ['remix', 'dance', 'club', 'beat']):
-            return 'Energetic'
-        elif any(word in combined_text for word in ['ballad', 'slow', 'piano', 'violin']):
-            return 'Sad'
-        elif any(word in combined_text for word in ['acoustic', 'unplugged', 'soft']):
-            return 'Relaxed'
-        else:
-            return 'Happy'  # Default mood
+        return self.categorize_songs([(title, artist)])[0][0]
     
     def format_duration(self, duration_seconds: int) -> str:
         """Format duration from seconds to mm:ss"""
@@ -81,11 +160,163 @@ class YouTubeMusicPlaylistExtractor:
         seconds = duration_seconds % 60
         return f"{minutes}:{seconds:02d}"
     
-    def extract_playlist_songs(self, playlist_url: str) -> List[Song]:
+    async def _api_get(self, semaphore: asyncio.Semaphore, endpoint: str, params: Dict[str, Any]) -> Dict:
+        """GET an API endpoint on a pooled connection, backing off on rate limits"""
+        url = f"{self.api_base}/{endpoint}"
+        params = dict(params, key=self.api_key)
+        
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                try:
+                    response = await asyncio.to_thread(self.session.get, url, params=params, timeout=self.timeout)
+                except requests.RequestException as e:
+                    response, error = None, str(e)
+            
+            if response is not None:
+                if response.status_code == 200:
+                    return response.json()
+                
+                reason = self._error_reason(response)
+                error = f"HTTP {response.status_code} {reason or ''}".strip()
+                retryable = (response.status_code == 429 or response.status_code >= 500 or
+                             (response.status_code == 403 and reason in RATE_LIMIT_REASONS))
+                if not retryable:
+                    raise PlaylistFetchError(f"{endpoint}: {error}")
+            
+            if attempt == self.max_retries:
+                break
+            
+            # Honour Retry-After when given, otherwise jittered exponential backoff
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+            print(f"⏳ {endpoint} failed ({error}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        
+        raise PlaylistFetchError(f"{endpoint}: giving up after {self.max_retries + 1} attempts ({error})")
+    
+    @staticmethod
+    def _error_reason(response: requests.Response) -> Optional[str]:
+        try:
+            errors = response.json().get('error', {}).get('errors', [])
+            return errors[0].get('reason') if errors else None
+        except (ValueError, AttributeError):
+            return None
+    
+    async def _playlist_pages(self, semaphore: asyncio.Semaphore, playlist_id: str) -> AsyncIterator[List[Dict]]:
+        """Yield playlistItems pages in order (the page token chain is inherently sequential)"""
+        page_token = None
+        while True:
+            params = {'part': 'snippet,contentDetails', 'playlistId': playlist_id, 'maxResults': PAGE_SIZE}
+            if page_token:
+                params['pageToken'] = page_token
+            page = await self._api_get(semaphore, 'playlistItems', params)
+            yield page.get('items', [])
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+    
+    async def _video_details(self, semaphore: asyncio.Semaphore, video_ids: List[str]) -> Dict[str, Dict]:
+        """Fetch durations for up to PAGE_SIZE videos in one call"""
+        if not video_ids:
+            return {}
+        data = await self._api_get(semaphore, 'videos', {'part': 'contentDetails', 'id': ','.join(video_ids)})
+        return {item['id']: item for item in data.get('items', [])}
+    
+    def _songs_from_page(self, start_index: int, items: List[Dict], details: Dict[str, Dict]) -> List[Song]:
+        """Build a page of Songs, categorizing the whole page in one batch"""
+        songs = [self._song_from_item(start_index + i, item, details) for i, item in enumerate(items, 1)]
+        songs = [song for song in songs if song]
+        for song, (mood, _) in zip(songs, self.categorize_songs((song.title, song.artist) for song in songs)):
+            song.mood = mood
+        return songs
+    
+    def _song_from_item(self, index: int, item: Dict, details: Dict[str, Dict]) -> Optional[Song]:
+        """Build a Song from a playlistItems entry, skipping deleted/private videos (mood set per page)"""
+        snippet = item.get('snippet', {})
+        video_id = item.get('contentDetails', {}).get('videoId') or snippet.get('resourceId', {}).get('videoId')
+        title = snippet.get('title', '')
+        if not video_id or title in ('Deleted video', 'Private video'):
+            return None
+        
+        # YouTube Music auto-generated channels are named "<Artist> - Topic"
+        artist = snippet.get('videoOwnerChannelTitle') or snippet.get('channelTitle') or 'Unknown Artist'
+        if artist.endswith(' - Topic'):
+            artist = artist[:-len(' - Topic')]
+        
+        duration_seconds = parse_iso_duration(details.get(video_id, {}).get('contentDetails', {}).get('duration', ''))
+        thumbnails = snippet.get('thumbnails', {})
+        thumbnail = next((thumbnails[size]['url'] for size in ('maxres', 'high', 'medium', 'default') if size in thumbnails),
+                         f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg")
+        
+        return Song(
+            id=f"yt_playlist_{index}",
+            title=title,
+            artist=artist,
+            mood='',
+            duration=self.format_duration(duration_seconds),
+            youtube_url=f"https://youtube.com/watch?v={video_id}",
+            thumbnail=thumbnail
+        )
+    
+    async def stream_playlist_songs(self, playlist_url: str) -> AsyncIterator[Song]:
+        """
+        Yield songs in playlist order as soon as each page is complete
+        
+        Video details for a page are fetched while the next page is being
+        listed; at most ``concurrency`` requests are in flight.
+        """
+        playlist_id = self.extract_playlist_id(playlist_url)
+        if not playlist_id:
+            raise PlaylistFetchError(f"Could not extract playlist ID from URL: {playlist_url}")
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending: List = []  # (items, details task) in page order
+        index = 0
+        
+        async def drain(keep: int):
+            # Emit finished pages in order; only wait when too many are queued
+            nonlocal index
+            while pending and (pending[0][1].done() or len(pending) > keep):
+                items, task = pending.pop(0)
+                details = await task
+                for song in self._songs_from_page(index, items, details):
+                    yield song
+                index += len(items)
+        
+        try:
+            async for items in self._playlist_pages(semaphore, playlist_id):
+                video_ids = [item.get('contentDetails', {}).get('videoId') for item in items]
+                task = asyncio.create_task(self._video_details(semaphore, [v for v in video_ids if v]))
+                pending.append((items, task))
+                async for song in drain(self.concurrency):
+                    yield song
+            async for song in drain(0):
+                yield song
+        finally:
+            for _, task in pending:
+                task.cancel()
+    
+    async def _extract_to_writer(self, playlist_url: str, writer: Optional['SongStreamWriter']) -> List[Song]:
+        songs = []
+        start = time.time()
+        async for song in self.stream_playlist_songs(playlist_url):
+            songs.append(song)
+            if writer:
+                writer.write(song)
+            if len(songs) % 500 == 0:
+                print(f"   ... {len(songs)} songs ({len(songs) / (time.time() - start):.0f}/s)")
+        return songs
+    
+    def extract_playlist_songs(self, playlist_url: str, writer: Optional['SongStreamWriter'] = None) -> List[Song]:
         """
         Extract songs from YouTube Music playlist
-        Note: This is a simplified version that would need actual YouTube API integration
-        For now, we'll create sample data based on the playlist URL provided
+        
+        Uses the YouTube Data API when an API key is configured; otherwise
+        falls back to sample data so the rest of the pipeline can be tried.
+        Songs are passed to ``writer`` as they arrive.
         """
         playlist_id = self.extract_playlist_id(playlist_url)
         if not playlist_id:
@@ -94,8 +325,18 @@ class YouTubeMusicPlaylistExtractor:
         
         print(f"🎵 Processing playlist ID: {playlist_id}")
         
-        # In a real implementation, you would use YouTube API to get actual playlist data
-        # For now, we'll create sample songs that represent what might be in the playlist
+        if self.api_key:
+            return asyncio.run(self._extract_to_writer(playlist_url, writer))
+        
+        print("⚠️  No YOUTUBE_API_KEY set, using sample songs")
+        songs = self._sample_playlist_songs()
+        if writer:
+            for song in songs:
+                writer.write(song)
+        return songs
+    
+    def _sample_playlist_songs(self) -> List[Song]:
+        """Sample songs representing what might be in the playlist"""
         sample_songs = [
             {
                 "title": "Lofi Hip Hop Study Mix",
@@ -190,51 +431,127 @@ class YouTubeMusicPlaylistExtractor:
         
         return songs
     
+    def song_to_dict(self, song: Song) -> Dict[str, str]:
+        """Convert a song to the frontend/songs.json shape"""
+        return {
+            "id": song.id,
+            "title": song.title,
+            "artist": song.artist,
+            "mood": song.mood,
+            "duration": song.duration,
+            "youtubeUrl": song.youtube_url,
+            "thumbnail": song.thumbnail
+        }
+    
     def songs_to_json(self, songs: List[Song]) -> str:
         """Convert songs to JSON format for frontend"""
-        songs_dict = []
-        for song in songs:
-            songs_dict.append({
-                "id": song.id,
-                "title": song.title,
-                "artist": song.artist,
-                "mood": song.mood,
-                "duration": song.duration,
-                "youtubeUrl": song.youtube_url,
-                "thumbnail": song.thumbnail
-            })
-        
+        songs_dict = [self.song_to_dict(song) for song in songs]
         return json.dumps(songs_dict, indent=2)
     
+    def songs_to_catalog(self, songs: List[Song], path: str) -> Dict[str, int]:
+        """Write songs to a memory-mapped catalog for the backends (see song_catalog.py)"""
+        return write_catalog([self.song_to_dict(song) for song in songs], path)
+    
+    def typescript_entry(self, song: Song) -> str:
+        """One Song object literal for Songs.tsx"""
+        quote = lambda value: json.dumps(value, ensure_ascii=False)
+        return f"""  {{
+    id: {quote(song.id)},
+    title: {quote(song.title)},
+    artist: {quote(song.artist)},
+    mood: {quote(song.mood)},
+    duration: {quote(song.duration)},
+    youtubeUrl: {quote(song.youtube_url)},
+    thumbnail: {quote(song.thumbnail)}
+  }},\n"""
+    
     def generate_typescript_code(self, songs: List[Song]) -> str:
         """Generate TypeScript code to add to Songs.tsx"""
         songs_array = "const newSongs: Song[] = [\n"
         
         for song in songs:
-            songs_array += f"""  {{
-    id: "{song.id}",
-    title: "{song.title}",
-    artist: "{song.artist}",
-    mood: "{song.mood}",
-    duration: "{song.duration}",
-    youtubeUrl: "{song.youtube_url}",
-    thumbnail: "{song.thumbnail}"
-  }},\n"""
+            songs_array += self.typescript_entry(song)
         
         songs_array += "];\n"
         return songs_array
 
+class SongStreamWriter:
+    """
+    Streams songs to the JSON and TypeScript outputs as they are extracted
+    
+    The files are valid (and identical to songs_to_json /
+    generate_typescript_code output) once the writer is closed.
+    """
+    
+    TS_HEADER = ("// Generated songs from YouTube Music playlist\n"
+                 "// Add these to your existing songs array in Songs.tsx\n\n")
+    
+    def __init__(self, extractor: YouTubeMusicPlaylistExtractor, json_path: Optional[str] = None,
+                 ts_path: Optional[str] = None):
+        self.extractor = extractor
+        self.count = 0
+        self.json_file: Optional[TextIO] = open(json_path, 'w') if json_path else None
+        self.ts_file: Optional[TextIO] = open(ts_path, 'w') if ts_path else None
+        if self.json_file:
+            self.json_file.write("[")
+        if self.ts_file:
+            self.ts_file.write(self.TS_HEADER + "const newSongs: Song[] = [\n")
+    
+    def write(self, song: Song):
+        if self.json_file:
+            entry = textwrap.indent(json.dumps(self.extractor.song_to_dict(song), indent=2), '  ')
+            self.json_file.write((",\n" if self.count else "\n") + entry)
+            self.json_file.flush()
+        if self.ts_file:
+            self.ts_file.write(self.extractor.typescript_entry(song))
+            self.ts_file.flush()
+        self.count += 1
+    
+    def close(self):
+        if self.json_file:
+            self.json_file.write("\n]" if self.count else "]")
+            self.json_file.close()
+            self.json_file = None
+        if self.ts_file:
+            self.ts_file.write("];\n")
+            self.ts_file.close()
+            self.ts_file = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
 def main():
     """Main extraction function"""
     # The playlist URL provided by the user
-    playlist_url = "https://music.youtube.com/playlist?list=PLbVJJTMnIGGPn96j5DyRfQRxSBf91tfcl&si=A7t579ZUGCYozYam"
+    default_playlist = "https://music.youtube.com/playlist?list=PLbVJJTMnIGGPn96j5DyRfQRxSBf91tfcl&si=A7t579ZUGCYozYam"
+    
+    parser = argparse.ArgumentParser(description="Extract songs from a YouTube Music playlist")
+    parser.add_argument("playlist_url", nargs="?", default=default_playlist, help="Playlist URL")
+    parser.add_argument("--api-key", help="YouTube Data API key (default: $YOUTUBE_API_KEY)")
+    parser.add_argument("--api-base", default=YOUTUBE_API_BASE, help="API root (e.g. a local stub server)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum in-flight API requests")
+    parser.add_argument("--json-output", default="playlist_songs.json", help="JSON output path")
+    parser.add_argument("--ts-output", default="playlist_songs.ts", help="TypeScript output path")
+    args = parser.parse_args()
+    playlist_url = args.playlist_url
     
     print("🎵 YouTube Music Playlist Extractor")
     print("=" * 50)
     print(f"📋 Processing playlist: {playlist_url}")
     
-    extractor = YouTubeMusicPlaylistExtractor()
-    songs = extractor.extract_playlist_songs(playlist_url)
+    extractor = YouTubeMusicPlaylistExtractor(api_key=args.api_key, api_base=args.api_base,
+                                              concurrency=args.concurrency)
+    
+    # Songs are written to both outputs as they arrive
+    try:
+        with SongStreamWriter(extractor, args.json_output, args.ts_output) as writer:
+            songs = extractor.extract_playlist_songs(playlist_url, writer)
+    except PlaylistFetchError as e:
+        print(f"❌ Extraction failed: {e}")
+        return
     
     if not songs:
         print("❌ No songs extracted")
@@ -252,27 +569,14 @@ def main():
     
     for mood, mood_songs in mood_groups.items():
         print(f"\n{mood} ({len(mood_songs)} songs):")
-        for song in mood_songs:
+        for song in mood_songs[:20]:
             print(f"  • {song.title} by {song.artist} ({song.duration})")
-    
-    # Save data for integration
-    print(f"\n💾 Saving data...")
-    
-    # Save as JSON
-    json_data = extractor.songs_to_json(songs)
-    with open("playlist_songs.json", "w") as f:
-        f.write(json_data)
-    
-    # Save as TypeScript code
-    ts_code = extractor.generate_typescript_code(songs)
-    with open("playlist_songs.ts", "w") as f:
-        f.write("// Generated songs from YouTube Music playlist\n")
-        f.write("// Add these to your existing songs array in Songs.tsx\n\n")
-        f.write(ts_code)
+        if len(mood_songs) > 20:
+            print(f"  ... and {len(mood_songs) - 20} more")
     
     print("✅ Data saved to:")
-    print("  • playlist_songs.json (JSON format)")
-    print("  • playlist_songs.ts (TypeScript code)")
+    print(f"  • {args.json_output} (JSON format)")
+    print(f"  • {args.ts_output} (TypeScript code)")
     print("\n🚀 Ready to integrate with Songs page!")
 
 if __name__ == "__main__":
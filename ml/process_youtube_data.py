@@ -8,9 +8,90 @@ import json
 import os
 import re
 import random
-from typing import List, Dict, Tuple
+import hashlib
+import sqlite3
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
 import argparse
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+
+from near_dedup import NearDuplicateFilter, print_stats as print_near_dup_stats
+from text_sanitizer import humor_sanitizer
+
+# Records handed to a worker at once in streaming mode
+DEFAULT_CHUNK_SIZE = 256
+DEFAULT_SEED = 42
+
+# Per-process processor used by the streaming workers
+_worker_processor = None
+
+def _init_worker(model_type: str):
+    global _worker_processor
+    _worker_processor = YouTubeHumorProcessor(model_type)
+
+def _process_chunk(task: Tuple[int, List[str], int]) -> List[Dict]:
+    """Pairs for one chunk of texts; the rng depends only on (seed, chunk index)"""
+    index, texts, seed = task
+    rng = random.Random(f"{seed}:{index}")
+    pairs = []
+    for text in texts:
+        pairs.extend(_worker_processor.generate_conversation_pairs(text, rng))
+    return pairs
+
+def iter_youtube_texts(input_file: str) -> Iterator[str]:
+    """Non-empty ``text`` fields of a YouTube JSONL file, one line at a time"""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                item = json.loads(line.strip())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(item, dict) and item.get('text'):
+                yield item['text']
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+class DigestSet:
+    """
+    Set of response digests kept in a private temporary SQLite file
+
+    SQLite holds at most ``cache_kb`` of pages in memory and spills the rest
+    to a file it deletes on close, so de-duplication memory stays flat
+    however many unique responses the corpus has.
+    """
+
+    def __init__(self, cache_kb: int = 4096):
+        # An empty filename is a temporary on-disk database
+        self.db = sqlite3.connect('')
+        self.db.execute(f'PRAGMA cache_size = -{cache_kb}')
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('CREATE TABLE seen (digest BLOB PRIMARY KEY) WITHOUT ROWID')
+        self.size = 0
+
+    def add(self, digest: bytes) -> bool:
+        """Add ``digest``; True if it was not in the set yet"""
+        added = self.db.execute('INSERT OR IGNORE INTO seen VALUES (?)', (digest,)).rowcount == 1
+        self.size += added
+        return added
+
+    def close(self):
+        self.db.close()
+
+
+def iter_chunks(items: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 class YouTubeHumorProcessor:
     def __init__(self, model_type: str = "mistral"):
@@ -50,39 +131,17 @@ class YouTubeHumorProcessor:
             "Teach me something cool",
             "I want to understand reality"
         ]
+        self.sanitizer = humor_sanitizer(self.sarcastic_starters)
         
     def clean_text(self, text: str) -> str:
-        """Clean and normalize text content"""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        # Remove repetitive sarcastic prefixes
-        for starter in self.sarcastic_starters:
-            if text.lower().startswith(starter.lower()):
-                text = text[len(starter):].strip()
-                break
-        
-        # Clean up excessive profanity while keeping the sarcastic tone
-        replacements = {
-            r'\bfuck ass\b': '',
-            r'\bfuck\b': 'freakin',
-            r'\bdumbass\b': 'dummy',
-            r'\bstupid ass\b': 'silly',
-            r'\bshit\b': 'stuff',
-            r'\bass\b': '',
-        }
-        
-        for pattern, replacement in replacements.items():
-            text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-        
-        # Clean up extra spaces
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        # Ensure it ends with punctuation
-        if text and not text[-1] in '.!?':
-            text += '.'
-        
-        return text
+        """
+        Clean and normalize text content
+        
+        Collapses whitespace, drops one leading sarcastic starter, tones down
+        excessive profanity while keeping the sarcastic tone and makes sure the
+        text ends with punctuation, all in one pass (see text_sanitizer).
+        """
+        return self.sanitizer.clean(text)
     
     def extract_knowledge_facts(self, text: str) -> List[str]:
         """Extract factual content from YouTube transcripts"""
@@ -103,8 +162,9 @@ class YouTubeHumorProcessor:
         
         return facts
     
-    def generate_conversation_pairs(self, youtube_text: str) -> List[Dict]:
-        """Generate conversation pairs from YouTube humor content"""
+    def generate_conversation_pairs(self, youtube_text: str, rng: Optional[random.Random] = None) -> List[Dict]:
+        """Generate conversation pairs from YouTube humor content (``rng`` picks the triggers)"""
+        rng = rng or random
         pairs = []
         
         # Clean the text first
@@ -119,7 +179,7 @@ class YouTubeHumorProcessor:
         # Generate multiple conversation scenarios
         scenarios = [
             {
-                "user_input": random.choice(self.conversation_triggers),
+                "user_input": rng.choice(self.conversation_triggers),
                 "bot_response": cleaned_text,
                 "context": "general_sarcasm"
             }
@@ -135,7 +195,7 @@ class YouTubeHumorProcessor:
             ]
             
             scenarios.append({
-                "user_input": random.choice(fact_triggers),
+                "user_input": rng.choice(fact_triggers),
                 "bot_response": cleaned_text,
                 "context": "educational_sarcasm"
             })
@@ -218,13 +278,21 @@ class YouTubeHumorProcessor:
         
         return examples
     
-    def process_youtube_dataset(self, input_file: str, output_file: str = None) -> str:
+    def process_youtube_dataset(self, input_file: str, output_file: str = None, streaming: bool = False,
+                                workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                seed: int = DEFAULT_SEED, near_dup_threshold: Optional[float] = None) -> str:
         """
         Process YouTube humor dataset and convert to training format
         
         Args:
             input_file: Path to YouTube humor JSONL file
             output_file: Output file path (optional)
+            streaming: Process in chunks on a process pool, writing as it goes
+            workers: Worker processes for streaming mode (defaults to the CPU count; 1 runs inline)
+            chunk_size: Records per chunk in streaming mode
+            seed: Base seed for the per-chunk random generators in streaming mode
+            near_dup_threshold: Drop responses at least this similar (MinHash Jaccard)
+                to an earlier one instead of exact-prefix matches
             
         Returns:
             Path to processed output file
@@ -233,6 +301,10 @@ class YouTubeHumorProcessor:
             base_name = os.path.splitext(os.path.basename(input_file))[0]
             output_file = f"processed_{base_name}_{self.model_type}.jsonl"
         
+        if streaming:
+            return self.process_youtube_dataset_streaming(input_file, output_file, workers, chunk_size, seed,
+                                                          near_dup_threshold)
+        
         print(f"Processing YouTube dataset: {input_file}")
         print(f"Model type: {self.model_type}")
         
@@ -265,15 +337,25 @@ class YouTubeHumorProcessor:
         # Remove duplicates based on response content
         unique_pairs = []
         seen_responses = set()
+        near_dedup = NearDuplicateFilter(near_dup_threshold) if near_dup_threshold else None
         
         for pair in all_training_pairs:
             response = pair.get('output') or pair.get('completion', '')
+            if len(response.strip()) <= 20:
+                continue
+            if near_dedup is not None:
+                unique_pairs.append(pair)
+                continue
             response_key = response.strip().lower()[:100]  # Use first 100 chars as key
             
-            if response_key not in seen_responses and len(response.strip()) > 20:
+            if response_key not in seen_responses:
                 seen_responses.add(response_key)
                 unique_pairs.append(pair)
         
+        if near_dedup is not None:
+            unique_pairs = list(near_dedup.filter(unique_pairs, key=lambda pair: pair.get('output') or pair.get('completion', '')))
+            print_near_dup_stats(near_dedup.stats())
+        
         print(f"Generated {len(unique_pairs)} unique training pairs")
         
         # Save processed data
@@ -288,22 +370,122 @@ class YouTubeHumorProcessor:
         
         return output_file
     
-    def print_dataset_stats(self, dataset: List[Dict]):
+    def _chunk_results(self, chunks: Iterator[List[str]], workers: int, seed: int) -> Iterator[List[Dict]]:
+        """Pairs per chunk, in input order, with at most ``2 * workers`` chunks in flight"""
+        tasks = ((index, texts, seed) for index, texts in enumerate(chunks))
+        if workers <= 1:
+            _init_worker(self.model_type)
+            for task in tasks:
+                yield _process_chunk(task)
+            return
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.model_type,)) as pool:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.submit(_process_chunk, task))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    
+    def process_youtube_dataset_streaming(self, input_file: str, output_file: str,
+                                          workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                          seed: int = DEFAULT_SEED,
+                                          near_dup_threshold: Optional[float] = None) -> str:
+        """
+        Streaming version of process_youtube_dataset
+        
+        Records are read lazily, cleaned and turned into pairs chunk by chunk
+        on a process pool, and unique pairs are written as soon as their chunk
+        comes back. Chunks are written in input order and each chunk's rng is
+        seeded from (seed, chunk index), so the output is identical for any
+        number of workers. Memory is bounded by the chunks in flight: the
+        8-byte digest per unique response used for de-duplication lives in a
+        temporary on-disk DigestSet.
+        
+        With ``near_dup_threshold`` responses go through a NearDuplicateFilter
+        instead, which also catches segments differing by a few edits; it keeps
+        a MinHash signature per kept response in memory, so that mode grows
+        with the number of unique responses.
+        """
+        workers = workers or os.cpu_count() or 1
+        print(f"Processing YouTube dataset: {input_file} (streaming, {workers} workers, chunks of {chunk_size})")
+        print(f"Model type: {self.model_type}")
+        
+        seen_responses = DigestSet()
+        near_dedup = NearDuplicateFilter(near_dup_threshold) if near_dup_threshold else None
+        records = 0
+        
+        def counted(texts: Iterable[str]) -> Iterator[str]:
+            nonlocal records
+            for text in texts:
+                records += 1
+                yield text
+        
+        def response_of(pair: Dict) -> str:
+            return pair.get('output') or pair.get('completion', '')
+        
+        def unique(pairs: Iterable[Dict]) -> Iterator[Dict]:
+            for pair in pairs:
+                response = response_of(pair)
+                if len(response.strip()) <= 20:
+                    continue
+                if near_dedup is not None:
+                    yield pair
+                    continue
+                response_key = response.strip().lower()[:100]  # Use first 100 chars as key
+                digest = hashlib.blake2b(response_key.encode('utf-8'), digest_size=8).digest()
+                if seen_responses.add(digest):
+                    yield pair
+        
+        written = 0
+        try:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                # Add high-quality hand-crafted examples first
+                high_quality_examples = self.add_high_quality_examples()
+                print(f"Added {len(high_quality_examples)} high-quality examples")
+                
+                chunks = iter_chunks(counted(iter_youtube_texts(input_file)), chunk_size)
+                results = chain([high_quality_examples], self._chunk_results(chunks, workers, seed))
+                pairs = (pair for chunk in results for pair in unique(chunk))
+                if near_dedup is not None:
+                    pairs = near_dedup.filter(pairs, key=response_of)
+                for pair in pairs:
+                    f.write(json.dumps(pair, ensure_ascii=False) + '\n')
+                    written += 1
+        finally:
+            seen_responses.close()
+        
+        print(f"Loaded {records} YouTube text entries")
+        if near_dedup is not None:
+            print_near_dup_stats(near_dedup.stats())
+        print(f"Generated {written} unique training pairs")
+        print(f"Processed dataset saved to: {output_file}")
+        
+        # Statistics are computed from the written file, one line at a time
+        self.print_dataset_stats(iter_jsonl(output_file))
+        
+        return output_file
+    
+    def print_dataset_stats(self, dataset: Iterable[Dict]):
         """Print dataset statistics"""
         context_counts = defaultdict(int)
         avg_response_length = 0
+        total = 0
         
         for item in dataset:
+            total += 1
             context = item.get('context', 'unknown')
             context_counts[context] += 1
             
             response = item.get('output') or item.get('completion', '')
             avg_response_length += len(response.split())
         
-        avg_response_length = avg_response_length / len(dataset) if dataset else 0
+        avg_response_length = avg_response_length / total if total else 0
         
         print("\n--- Dataset Statistics ---")
-        print(f"Total training pairs: {len(dataset)}")
+        print(f"Total training pairs: {total}")
         print(f"Average response length: {avg_response_length:.1f} words")
         print("\nContext distribution:")
         for context, count in context_counts.items():
@@ -314,11 +496,10 @@ class YouTubeHumorProcessor:
         print(f"\nValidating dataset: {dataset_file}")
         
         try:
-            with open(dataset_file, 'r', encoding='utf-8') as f:
-                items = [json.loads(line) for line in f]
-            
             valid_items = 0
-            for item in items:
+            total_items = 0
+            for item in iter_jsonl(dataset_file):
+                total_items += 1
                 if self.model_type == "mistral":
                     if all(key in item for key in ['instruction', 'input', 'output']):
                         valid_items += 1
@@ -326,8 +507,8 @@ class YouTubeHumorProcessor:
                     if all(key in item for key in ['prompt', 'completion']):
                         valid_items += 1
             
-            print(f"Validation result: {valid_items}/{len(items)} valid items")
-            return valid_items == len(items)
+            print(f"Validation result: {valid_items}/{total_items} valid items")
+            return valid_items == total_items
             
         except Exception as e:
             print(f"Validation error: {e}")
@@ -339,6 +520,13 @@ def main():
     parser.add_argument("--output", "-o", help="Output file path")
     parser.add_argument("--model", "-m", choices=["mistral", "falcon", "llama2"], 
                        default="mistral", help="Model type to format data for")
+    parser.add_argument("--streaming", action="store_true",
+                       help="Process in chunks on a process pool, de-duplicating on disk")
+    parser.add_argument("--workers", type=int, help="Worker processes for --streaming (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Records per chunk")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed for the per-chunk random generators")
+    parser.add_argument("--near-dup-threshold", type=float,
+                       help="Drop responses this similar to an earlier one (e.g. 0.8)")
     
     args = parser.parse_args()
     
@@ -347,7 +535,9 @@ def main():
         return
     
     processor = YouTubeHumorProcessor(args.model)
-    output_file = processor.process_youtube_dataset(args.input_file, args.output)
+    output_file = processor.process_youtube_dataset(args.input_file, args.output, streaming=args.streaming,
+                                                    workers=args.workers, chunk_size=args.chunk_size,
+                                                    seed=args.seed, near_dup_threshold=args.near_dup_threshold)
     
     # Validate the output
     if processor.validate_dataset(output_file):
@@ -12,10 +12,18 @@ from transformers import AutoTokenizer, AutoModelForCausalLM
 from pathlib import Path
 import argparse
 import time
+from keyword_classifier import KeywordClassifier
 
 class ProductionSarcasticBot:
     """Production-ready sarcastic chatbot with fine-tuned model"""
     
+    MOOD_CLASSIFIER = KeywordClassifier({
+        'greeting': ['hello', 'hi', 'hey', 'what\'s up', 'good morning', 'good evening'],
+        'sad': ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset', 'feel bad'],
+        'happy': ['happy', 'excited', 'great', 'awesome', 'fantastic', 'good'],
+        'angry': ['angry', 'mad', 'furious', 'hate*', 'annoyed', 'pissed', 'frustrated']
+    }, default='default')
+    
     def __init__(self, model_path="./sarcastic_model_final"):
         self.model_path = model_path
         self.model = None
@@ -88,20 +96,7 @@ class ProductionSarcasticBot:
     
     def detect_mood(self, message):
         """Detect user's mood from message"""
-        message_lower = message.lower()
-        
-        mood_keywords = {
-            'greeting': ['hello', 'hi', 'hey', 'what\'s up', 'good morning', 'good evening'],
-            'sad': ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset', 'feel bad'],
-            'happy': ['happy', 'excited', 'great', 'awesome', 'fantastic', 'good'],
-            'angry': ['angry', 'mad', 'furious', 'hate', 'annoyed', 'pissed', 'frustrated']
-        }
-        
-        for mood, keywords in mood_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                return mood
-                
-        return 'default'
+        return self.MOOD_CLASSIFIER.classify(message)
     
     def generate_response(self, user_message, max_length=100, temperature=0.8):
         """Generate sarcastic response"""
@@ -14,6 +14,7 @@ import random
 import json
 import uvicorn
 from typing import List, Optional, Dict, Any
+from keyword_classifier import KeywordClassifier
 
 # Request/Response models
 class ChatRequest(BaseModel):
@@ -35,6 +36,15 @@ class ChatResponse(BaseModel):
 class FineTunedSarcasticBot:
     """Production-ready fine-tuned sarcastic chatbot"""
     
+    MOOD_CLASSIFIER = KeywordClassifier({
+        'greeting': ['hello', 'hi', 'hey', 'what\'s up', 'good morning', 'good evening', 'howdy'],
+        'sad': ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset', 'feel bad', 'miserable'],
+        'happy': ['happy', 'excited', 'great', 'awesome', 'fantastic', 'good', 'wonderful', 'amazing'],
+        'angry': ['angry', 'mad', 'furious', 'hate*', 'annoyed', 'pissed', 'frustrated', 'rage'],
+        'bored': ['bored', 'boring', 'nothing to do', 'dull', 'tired', 'sleepy'],
+        'help': ['help*', 'advice', 'what should i do', 'can you help', 'need help', 'assist*']
+    }, default='default')
+    
     def __init__(self, model_path="./sarcastic_model_final"):
         self.model_path = model_path
         self.model = None
@@ -121,22 +131,7 @@ class FineTunedSarcasticBot:
     
     def detect_mood(self, message):
         """Detect user's mood from message"""
-        message_lower = message.lower()
-        
-        mood_keywords = {
-            'greeting': ['hello', 'hi', 'hey', 'what\'s up', 'good morning', 'good evening', 'howdy'],
-            'sad': ['sad', 'depressed', 'down', 'unhappy', 'crying', 'upset', 'feel bad', 'miserable'],
-            'happy': ['happy', 'excited', 'great', 'awesome', 'fantastic', 'good', 'wonderful', 'amazing'],
-            'angry': ['angry', 'mad', 'furious', 'hate', 'annoyed', 'pissed', 'frustrated', 'rage'],
-            'bored': ['bored', 'boring', 'nothing to do', 'dull', 'tired', 'sleepy'],
-            'help': ['help', 'advice', 'what should i do', 'can you help', 'need help', 'assist']
-        }
-        
-        for mood, keywords in mood_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                return mood
-                
-        return 'default'
+        return self.MOOD_CLASSIFIER.classify(message)
     
     def generate_response(self, message, temperature=0.8, max_length=100):
         """Generate sarcastic response using fine-tuned model"""
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Sequence Packing for Mr. Sarcastic
+Packs short tokenized chat pairs into fixed-size blocks so a training step is
+spent on real tokens instead of one short pair plus padding
+"""
+
+import argparse
+import bisect
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from length_bucketing import LENGTH_COLUMN
+
+DEFAULT_BLOCK_SIZE = 512
+# Examples packed together per map call; larger windows fill blocks better
+PACK_WINDOW = 10000
+IGNORE_INDEX = -100
+# Attention implementations that accept a custom 4D attention mask, per
+# architecture (transformers 4.40); GPT-2/DialoGPT reads only 2D masks
+BLOCK_DIAGONAL_ATTENTION = {
+    'llama': ('eager', 'sdpa'),
+    'gemma': ('eager', 'sdpa'),
+    'mistral': ('eager',),
+    'falcon': ('eager',),
+}
+
+
+def supports_block_diagonal_attention(model) -> bool:
+    """True if ``model`` can be trained on packed blocks with a per-example (block-diagonal) attention mask"""
+    config = model.config
+    return getattr(config, '_attn_implementation', 'eager') in BLOCK_DIAGONAL_ATTENTION.get(config.model_type, ())
+
+
+def pack_lengths(lengths: Sequence[int], block_size: int) -> List[List[int]]:
+    """
+    Group example indices into blocks of at most ``block_size`` tokens
+
+    Best-fit decreasing: examples are placed longest first into the block
+    with the least room that still fits them (found by bisecting a sorted
+    list of free space), or into a new block. Examples longer than a block
+    get a block of their own and are truncated when packed.
+    """
+    blocks: List[List[int]] = []
+    free: List[tuple] = []  # (free tokens, block index), sorted
+    for index in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        length = min(lengths[index], block_size)
+        slot = bisect.bisect_left(free, (length, -1))
+        if slot < len(free):
+            room, block = free.pop(slot)
+        else:
+            room, block = block_size, len(blocks)
+            blocks.append([])
+        blocks[block].append(index)
+        if room - length > 0:
+            bisect.insort(free, (room - length, block))
+    return blocks
+
+
+def pack_examples(examples: Dict[str, List], block_size: int = DEFAULT_BLOCK_SIZE,
+                  eos_token_id: Optional[int] = None, reset_positions: bool = False) -> Dict[str, List]:
+    """
+    Batched ``dataset.map`` function turning tokenized examples into packed blocks
+
+    Each block is its examples' ``input_ids`` back to back (an EOS is
+    appended to any example that does not already end with one) with the
+    label of each example's first token set to -100, so no example is
+    trained to follow the previous one. With ``reset_positions`` the
+    ``position_ids`` restart at 0 for every example; this is only
+    consistent together with ``PackedCollator(block_diagonal=True)``,
+    which keeps attention inside each example. Otherwise positions run
+    through the block and examples see the previous ones as EOS-separated
+    context (plain packing).
+    """
+    sequences = []
+    for ids in examples['input_ids']:
+        ids = list(ids)
+        if eos_token_id is not None and (not ids or ids[-1] != eos_token_id):
+            ids.append(eos_token_id)
+        sequences.append(ids[:block_size])
+
+    packed = {'input_ids': [], 'position_ids': [], 'labels': [], LENGTH_COLUMN: []}
+    for block in pack_lengths([len(ids) for ids in sequences], block_size):
+        input_ids, position_ids, labels = [], [], []
+        for index in block:
+            ids = sequences[index]
+            input_ids.extend(ids)
+            position_ids.extend(range(len(ids)) if reset_positions else
+                                range(len(input_ids) - len(ids), len(input_ids)))
+            labels.append(IGNORE_INDEX)
+            labels.extend(ids[1:])
+        packed['input_ids'].append(input_ids)
+        packed['position_ids'].append(position_ids)
+        packed['labels'].append(labels)
+        packed[LENGTH_COLUMN].append(len(input_ids))
+    return packed
+
+
+def pack_dataset(dataset, block_size: int = DEFAULT_BLOCK_SIZE, eos_token_id: Optional[int] = None,
+                 window: int = PACK_WINDOW, reset_positions: bool = False, cache_file_name: Optional[str] = None):
+    """
+    Pack a tokenized ``datasets.Dataset`` (needs ``input_ids``) into blocks
+
+    The blocks are kept in memory unless ``cache_file_name`` says where to
+    write them; ``datasets`` would otherwise drop a ``cache-*.arrow`` file
+    next to the input's Arrow files (e.g. inside a tokenization cache entry).
+    """
+    return dataset.map(
+        pack_examples,
+        batched=True,
+        batch_size=window,
+        remove_columns=dataset.column_names,
+        keep_in_memory=cache_file_name is None,
+        cache_file_name=cache_file_name,
+        fn_kwargs={'block_size': block_size, 'eos_token_id': eos_token_id, 'reset_positions': reset_positions}
+    )
+
+
+class PackedCollator:
+    """
+    Pads packed blocks to the longest in the batch
+
+    ``DataCollatorForLanguageModeling`` would rebuild the labels from the
+    ids and drop the boundary masks, and does not pad ``position_ids``.
+    With ``block_diagonal`` the attention mask is 4D (batch, 1, seq, seq):
+    causal within each example (examples start where ``position_ids`` is
+    0) and zero across examples and padding, so a packed block trains like
+    its examples one by one. Only for models where
+    ``supports_block_diagonal_attention`` is true.
+    """
+
+    def __init__(self, pad_token_id: int, pad_to_multiple_of: Optional[int] = 8, block_diagonal: bool = False):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.block_diagonal = block_diagonal
+
+    def __call__(self, features: List[Dict]) -> Dict:
+        import torch
+
+        width = max(len(feature['input_ids']) for feature in features)
+        if self.pad_to_multiple_of:
+            width = -(-width // self.pad_to_multiple_of) * self.pad_to_multiple_of
+
+        batch = {
+            'input_ids': torch.full((len(features), width), self.pad_token_id, dtype=torch.long),
+            'attention_mask': torch.zeros((len(features), width), dtype=torch.long),
+            'position_ids': torch.zeros((len(features), width), dtype=torch.long),
+            'labels': torch.full((len(features), width), IGNORE_INDEX, dtype=torch.long),
+        }
+        for row, feature in enumerate(features):
+            size = len(feature['input_ids'])
+            batch['input_ids'][row, :size] = torch.as_tensor(feature['input_ids'])
+            batch['attention_mask'][row, :size] = 1
+            batch['position_ids'][row, :size] = torch.as_tensor(feature['position_ids'])
+            batch['labels'][row, :size] = torch.as_tensor(feature['labels'])
+
+        if self.block_diagonal:
+            real = batch['attention_mask'].bool()
+            segments = torch.cumsum(batch['position_ids'] == 0, dim=1)
+            same_example = segments[:, :, None] == segments[:, None, :]
+            causal = torch.ones((width, width), dtype=torch.bool).tril()
+            batch['attention_mask'] = (same_example & causal & real[:, :, None] & real[:, None, :])[:, None].long()
+        return batch
+
+
+def packing_report(lengths: Sequence[int], block_size: int = DEFAULT_BLOCK_SIZE,
+                   window: int = PACK_WINDOW) -> Dict:
+    """Rows and padding before and after packing (blocks counted as full ``block_size`` rows)"""
+    lengths = np.minimum(np.asarray(lengths, dtype=np.int64), block_size)
+    blocks = 0
+    for start in range(0, len(lengths), window):
+        blocks += len(pack_lengths(lengths[start:start + window].tolist(), block_size))
+    tokens = int(lengths.sum())
+    return {
+        'examples': len(lengths),
+        'blocks': blocks,
+        'block_size': block_size,
+        'tokens': tokens,
+        'examples_per_block': len(lengths) / blocks if blocks else 0.0,
+        'efficiency': tokens / (blocks * block_size) if blocks else 0.0,
+        'unpacked_efficiency': tokens / (len(lengths) * block_size) if len(lengths) else 0.0
+    }
+
+
+def format_packing_report(report: Dict) -> str:
+    return (f"{report['examples']} examples -> {report['blocks']} blocks of {report['block_size']} tokens "
+            f"({report['examples_per_block']:.1f} per block), efficiency {report['efficiency']:.1%} "
+            f"vs {report['unpacked_efficiency']:.1%} unpacked")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report how well a tokenized dataset packs into blocks")
+    parser.add_argument("dataset", help="Tokenized dataset directory (save_to_disk / tokenization cache entry data)")
+    parser.add_argument("--block-size", type=int, nargs="+", default=[DEFAULT_BLOCK_SIZE], help="Block sizes")
+    args = parser.parse_args()
+
+    from datasets import load_from_disk
+    from length_bucketing import dataset_lengths
+
+    lengths = dataset_lengths(load_from_disk(args.dataset))
+    for block_size in args.block_size:
+        print(f"📦 {format_packing_report(packing_report(lengths, block_size))}")
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Compact Song Catalog for Mr. Sarcastic
+Columnar, memory-mapped playlist format with interned moods and artists, so
+huge playlists load in milliseconds and are shared between worker processes
+through the page cache instead of being copied into every process
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, List, Optional
+
+MAGIC = b'MRSCAT01'
+VERSION = 2
+
+# Per-song string columns stored in the blob, in row-major order
+STRING_FIELDS = ('id', 'title', 'duration', 'youtubeUrl', 'thumbnail')
+
+SECTIONS = ('string_offsets', 'artist_ids', 'mood_ids', 'mood_ranges',
+            'name_offsets', 'id_table', 'strings', 'names')
+
+# magic, version, songs, moods, artists, content digest (blake2b-128 of the sections)
+_HEADER = struct.Struct('<8sIIII16s')
+_SECTION = struct.Struct('<QQ')
+_EMPTY = 0xFFFFFFFF
+
+
+def _id_hash(song_id: bytes) -> int:
+    return zlib.crc32(song_id)
+
+
+def _table_size(n_songs: int) -> int:
+    size = 8
+    while size < n_songs * 2:
+        size *= 2
+    return size
+
+
+def _uint32_bytes(values: Iterable[int]) -> bytes:
+    column = array('I', values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def write_catalog(songs: List[Dict], path: str) -> Dict[str, int]:
+    """
+    Write songs (songs.json dicts) to a catalog file
+
+    Rows are grouped by mood so every mood is one contiguous range. The file
+    is written to a temporary path and renamed, so processes that already
+    mapped the old catalog keep a consistent view. The header carries a
+    digest of the content, which readers use to tell a rewrite of the same
+    songs from a real change without hashing the file.
+    """
+    moods = sorted({song.get('mood', '') for song in songs})
+    mood_ids = {mood: i for i, mood in enumerate(moods)}
+    rows = sorted(range(len(songs)), key=lambda i: mood_ids[songs[i].get('mood', '')])
+
+    artists: Dict[str, int] = {}
+    strings = bytearray()
+    string_offsets = [0]
+    artist_column = []
+    mood_column = []
+    mood_ranges = [0] * (len(moods) + 1)
+
+    for row in rows:
+        song = songs[row]
+        for field in STRING_FIELDS:
+            strings += str(song.get(field, '')).encode('utf-8')
+            string_offsets.append(len(strings))
+        artist_column.append(artists.setdefault(song.get('artist', ''), len(artists)))
+        mood_id = mood_ids[song.get('mood', '')]
+        mood_column.append(mood_id)
+        mood_ranges[mood_id + 1] += 1
+
+    for i in range(len(moods)):
+        mood_ranges[i + 1] += mood_ranges[i]
+
+    if len(strings) > _EMPTY:
+        raise ValueError("catalog strings exceed the 4 GB offset limit")
+
+    names = bytearray()
+    name_offsets = [0]
+    for name in moods + list(artists):
+        names += name.encode('utf-8')
+        name_offsets.append(len(names))
+
+    # Open-addressing table from song id to row, linear probing
+    table = [_EMPTY] * _table_size(len(rows))
+    mask = len(table) - 1
+    for position, row in enumerate(rows):
+        song_id = str(songs[row].get('id', '')).encode('utf-8')
+        slot = _id_hash(song_id) & mask
+        while table[slot] != _EMPTY:
+            slot = (slot + 1) & mask
+        table[slot] = position
+
+    payloads = {
+        'string_offsets': _uint32_bytes(string_offsets),
+        'artist_ids': _uint32_bytes(artist_column),
+        'mood_ids': _uint32_bytes(mood_column),
+        'mood_ranges': _uint32_bytes(mood_ranges),
+        'name_offsets': _uint32_bytes(name_offsets),
+        'id_table': _uint32_bytes(table),
+        'strings': bytes(strings),
+        'names': bytes(names),
+    }
+
+    position = _HEADER.size + _SECTION.size * len(SECTIONS)
+    layout = []
+    for name in SECTIONS:
+        position = (position + 7) & ~7
+        layout.append((position, len(payloads[name])))
+        position += len(payloads[name])
+
+    digest = hashlib.blake2b(digest_size=16)
+    for name in SECTIONS:
+        digest.update(struct.pack('<Q', len(payloads[name])))
+        digest.update(payloads[name])
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(rows), len(moods), len(artists), digest.digest()))
+        for offset, length in layout:
+            f.write(_SECTION.pack(offset, length))
+        for name, (offset, _) in zip(SECTIONS, layout):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(payloads[name])
+    os.replace(tmp_path, path)
+
+    return {"songs": len(rows), "moods": len(moods), "artists": len(artists), "bytes": position}
+
+
+def convert_json(json_path: str, catalog_path: Optional[str] = None) -> str:
+    """Convert a songs.json file into a catalog next to it"""
+    catalog_path = catalog_path or os.path.splitext(json_path)[0] + '.cat'
+    with open(json_path, 'r', encoding='utf-8') as f:
+        songs = json.load(f)
+    stats = write_catalog(songs, catalog_path)
+    print(f"✅ Wrote {stats['songs']} songs ({stats['moods']} moods, {stats['artists']} artists, "
+          f"{stats['bytes'] / 1024:.1f} KB) to {catalog_path}")
+    return catalog_path
+
+
+class SongCatalog(Sequence):
+    """
+    Read-only, memory-mapped song catalog
+
+    Behaves like the list of song dicts loaded from songs.json (rows are
+    materialised on access), with O(1) ``get(song_id)`` and ``by_mood(mood)``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < _HEADER.size or self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a song catalog")
+        magic, version, self._n_songs, n_moods, n_artists, digest = _HEADER.unpack_from(self._mmap, 0)
+        if version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is a version {version} song catalog; re-run song_catalog.py to "
+                             f"write version {VERSION}")
+        # Content digest from the header, identical for identical songs
+        self.digest = digest.hex()
+
+        self._views = []
+        sections = {}
+        for i, name in enumerate(SECTIONS):
+            sections[name] = _SECTION.unpack_from(self._mmap, _HEADER.size + i * _SECTION.size)
+
+        def column(name):
+            offset, length = sections[name]
+            if sys.byteorder == 'little':
+                view = memoryview(self._mmap)[offset:offset + length].cast('I')
+                self._views.append(view)
+                return view
+            values = array('I', self._mmap[offset:offset + length])
+            values.byteswap()
+            return values
+
+        def blob(name):
+            offset, length = sections[name]
+            return offset, offset + length
+
+        self._string_offsets = column('string_offsets')
+        self._artist_ids = column('artist_ids')
+        self._mood_ids = column('mood_ids')
+        self._mood_ranges = column('mood_ranges')
+        self._id_table = column('id_table')
+        self._strings_start, _ = blob('strings')
+
+        # Interned names are few; decode them once
+        name_offsets = column('name_offsets')
+        names_start, _ = blob('names')
+        names = [self._mmap[names_start + name_offsets[i]:names_start + name_offsets[i + 1]].decode('utf-8')
+                 for i in range(n_moods + n_artists)]
+        self.moods: List[str] = names[:n_moods]
+        self.artists: List[str] = names[n_moods:]
+        self._mood_index = {mood: i for i, mood in enumerate(self.moods)}
+
+    @classmethod
+    def open(cls, path: str) -> 'SongCatalog':
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self._n_songs
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self._n_songs))]
+        if row < 0:
+            row += self._n_songs
+        if not 0 <= row < self._n_songs:
+            raise IndexError("song index out of range")
+
+        k = row * len(STRING_FIELDS)
+        offsets = self._string_offsets
+        start = self._strings_start
+        raw = self._mmap[start + offsets[k]:start + offsets[k + len(STRING_FIELDS)]]
+        base = offsets[k]
+        fields = [raw[offsets[k + i] - base:offsets[k + i + 1] - base].decode('utf-8')
+                  for i in range(len(STRING_FIELDS))]
+
+        return {
+            'id': fields[0],
+            'title': fields[1],
+            'artist': self.artists[self._artist_ids[row]],
+            'mood': self.moods[self._mood_ids[row]],
+            'duration': fields[2],
+            'youtubeUrl': fields[3],
+            'thumbnail': fields[4]
+        }
+
+    def column(self, field: str) -> List[str]:
+        """One string field (see STRING_FIELDS) of every row, without materialising the rows"""
+        index = STRING_FIELDS.index(field)
+        width = len(STRING_FIELDS)
+        offsets = self._string_offsets
+        data = self._mmap
+        start = self._strings_start
+        return [data[start + offsets[k]:start + offsets[k + 1]].decode('utf-8')
+                for k in range(index, self._n_songs * width, width)]
+
+    def artist_ids(self) -> Sequence:
+        """Interned artist id of every row (indexes ``artists``)"""
+        return self._artist_ids
+
+    def mood_ids(self) -> Sequence:
+        """Interned mood id of every row (indexes ``moods``)"""
+        return self._mood_ids
+
+    def mood_of(self, row: int) -> str:
+        return self.moods[self._mood_ids[row]]
+
+    def artist_of(self, row: int) -> str:
+        return self.artists[self._artist_ids[row]]
+
+    def find(self, song_id: str) -> int:
+        """Row of a song id, or -1"""
+        key = song_id.encode('utf-8')
+        table = self._id_table
+        mask = len(table) - 1
+        slot = _id_hash(key) & mask
+        while True:
+            row = table[slot]
+            if row == _EMPTY:
+                return -1
+            if self._mmap[self._strings_start + self._string_offsets[row * len(STRING_FIELDS)]:
+                          self._strings_start + self._string_offsets[row * len(STRING_FIELDS) + 1]] == key:
+                return row
+            slot = (slot + 1) & mask
+
+    def get(self, song_id: str) -> Optional[Dict[str, str]]:
+        row = self.find(song_id)
+        return self[row] if row >= 0 else None
+
+    def by_mood(self, mood: str) -> 'RowRange':
+        """All songs of one mood as a lazy sequence (empty if unknown)"""
+        mood_id = self._mood_index.get(mood)
+        if mood_id is None:
+            return RowRange(self, 0, 0)
+        return RowRange(self, self._mood_ranges[mood_id], self._mood_ranges[mood_id + 1])
+
+    def mood_counts(self) -> Dict[str, int]:
+        return {mood: self._mood_ranges[i + 1] - self._mood_ranges[i] for i, mood in enumerate(self.moods)}
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RowRange(Sequence):
+    """Contiguous run of catalog rows, materialised on access"""
+
+    def __init__(self, catalog: SongCatalog, start: int, stop: int):
+        self.catalog = catalog
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("song index out of range")
+        return self.catalog[self.start + i]
+
+
+class ChainedSequence(Sequence):
+    """Read-only concatenation of sequences without copying them"""
+
+    def __init__(self, parts: List[Sequence]):
+        self.parts = [part for part in parts if len(part)]
+        self.ends = []
+        total = 0
+        for part in self.parts:
+            total += len(part)
+            self.ends.append(total)
+
+    def __len__(self) -> int:
+        return self.ends[-1] if self.ends else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("song index out of range")
+        begin = 0
+        for part, end in zip(self.parts, self.ends):
+            if i < end:
+                return part[i - begin]
+            begin = end
+
+
+def benchmark(json_path: str, catalog_path: str):
+    """Compare load time and lookups of songs.json and the catalog"""
+    start = time.perf_counter()
+    with open(json_path, 'r', encoding='utf-8') as f:
+        songs = json.load(f)
+    json_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    catalog = SongCatalog.open(catalog_path)
+    catalog_ms = (time.perf_counter() - start) * 1000
+
+    ids = [songs[i]['id'] for i in range(0, len(songs), max(1, len(songs) // 1000))]
+    start = time.perf_counter()
+    for song_id in ids:
+        catalog.get(song_id)
+    get_us = (time.perf_counter() - start) / len(ids) * 1e6
+
+    print(f"📊 {len(songs)} songs")
+    print(f"   songs.json load: {json_ms:10.1f} ms")
+    print(f"   catalog open:    {catalog_ms:10.1f} ms")
+    print(f"   get(song_id):    {get_us:10.1f} µs")
+    print(f"   moods: {catalog.mood_counts()}")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert songs.json to a memory-mapped song catalog")
+    parser.add_argument("json_file", help="Path to songs.json")
+    parser.add_argument("--output", "-o", help="Catalog path (default: <json_file>.cat)")
+    parser.add_argument("--benchmark", action="store_true", help="Compare load times after converting")
+    args = parser.parse_args()
+
+    output_path = convert_json(args.json_file, args.output)
+    if args.benchmark:
+        benchmark(args.json_file, output_path)
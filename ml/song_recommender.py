@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Song Recommender for Mr. Sarcastic
+Ranks catalog songs against a chat message using hashed TF-IDF vectors over
+title, artist and mood tags. The song matrix is built once per catalog and
+each query scores only the songs its posting lists can put in the top k
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from keyword_classifier import MOOD_KEYWORDS
+from song_catalog import SongCatalog
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Request phrasing that says nothing about which song is wanted
+STOPWORDS = frozenset([
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'by', 'with', 'about', 'like',
+    'i', "i'm", 'im', 'me', 'my', 'you', 'your', 'we', 'it', 'is', 'am', 'are', 'be', 'so', 'just',
+    'play', 'song', 'songs', 'music', 'track', 'tracks', 'some', 'something', 'any', 'recommend',
+    'suggest', 'give', 'want', 'need', 'feel', 'feeling', 'mood', 'please', 'can', 'could'
+])
+
+# Extra words describing song moods that have no entry in MOOD_KEYWORDS
+SONG_MOOD_KEYWORDS = {
+    'relaxed': MOOD_KEYWORDS['chill'],
+    'focus': ['focus', 'study', 'studying', 'concentrate', 'work', 'coding', 'reading']
+}
+
+
+def mood_tags(mood: str) -> List[str]:
+    """Words a message might use for a song mood ('Sad' -> sad, depressed, ...)"""
+    mood = mood.lower()
+    return [mood] + MOOD_KEYWORDS.get(mood, SONG_MOOD_KEYWORDS.get(mood, []))
+
+
+class SongRecommender:
+    """
+    Top-k song search over a precomputed sparse TF-IDF matrix
+
+    Songs are tokenized into hashed word features (title, artist and the
+    tags of their mood), weighted by sublinear TF-IDF and L2-normalised. The
+    matrix is stored column-major (per feature: sorted song rows and
+    weights), so scoring a message only touches the columns of the words it
+    contains. Top-k is pruned with each column's best weight (MaxScore):
+    the words whose bounds together cannot lift a song past the current
+    k-th score never add candidates, they are only looked up for songs
+    found through the other words, and ``argpartition`` runs over those
+    candidates instead of the catalog. Catalogs are tokenized from their
+    columns (each artist and mood once). Results are cached per normalised
+    message in a bounded LRU.
+    """
+
+    def __init__(self, songs: Sequence[Dict], n_features: int = 2 ** 18, cache_size: int = 4096):
+        self.n_features = n_features
+        self.cache_size = cache_size
+        self.songs = songs
+        self.n_songs = len(songs)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache: 'OrderedDict[Tuple[str, int], List[Tuple[int, float]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        start = time.perf_counter()
+        self._build(songs)
+        self.build_ms = (time.perf_counter() - start) * 1000
+
+    def _hash(self, token: str) -> int:
+        return zlib.crc32(token.encode('utf-8')) % self.n_features
+
+    def _features(self, text: str) -> List[int]:
+        return [self._hash(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+    def _feature_rows(self, songs: Sequence[Dict]) -> List[List[int]]:
+        """Hashed words of every song; artists and moods are tokenized once each"""
+        def tags(mood):
+            return self._features(' '.join(mood_tags(mood))) if mood else []
+
+        if isinstance(songs, SongCatalog):
+            artists = [self._features(artist) for artist in songs.artists]
+            moods = [tags(mood) for mood in songs.moods]
+            return [self._features(title) + artists[artist] + moods[mood]
+                    for title, artist, mood in zip(songs.column('title'), songs.artist_ids(), songs.mood_ids())]
+
+        artists: Dict[str, List[int]] = {}
+        moods: Dict[str, List[int]] = {}
+        rows = []
+        for song in songs:
+            artist = song.get('artist', '')
+            mood = song.get('mood') or ''
+            if artist not in artists:
+                artists[artist] = self._features(artist)
+            if mood not in moods:
+                moods[mood] = tags(mood)
+            rows.append(self._features(song.get('title', '')) + artists[artist] + moods[mood])
+        return rows
+
+    def _build(self, songs: Sequence[Dict]):
+        rows = self._feature_rows(songs)
+
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        features = np.fromiter((f for row in rows for f in row), dtype=np.int64, count=int(lengths.sum()))
+        song_rows = np.repeat(np.arange(len(rows), dtype=np.int64), lengths)
+
+        # Merge repeated words within a song into term frequencies; keys sort
+        # by feature first, which is the column-major order we store
+        keys, tf = np.unique(features * max(len(rows), 1) + song_rows, return_counts=True)
+        features = keys // max(len(rows), 1)
+        song_rows = keys % max(len(rows), 1)
+
+        df = np.bincount(features, minlength=self.n_features)
+        self.idf = (np.log((1 + len(rows)) / (1 + df)) + 1).astype(np.float32)
+        self.df = df
+
+        weights = (1 + np.log(tf)) * self.idf[features]
+        norms = np.sqrt(np.bincount(song_rows, weights=weights * weights, minlength=len(rows)))
+        weights /= np.maximum(norms[song_rows], 1e-12)
+
+        self.col_starts = np.zeros(self.n_features + 1, dtype=np.int64)
+        np.cumsum(df, out=self.col_starts[1:])
+        self.col_rows = song_rows.astype(np.int32)
+        self.col_weights = weights.astype(np.float32)
+        # Best weight per column: the most a word can add to any song's score
+        self.col_max = np.zeros(self.n_features, dtype=np.float32)
+        used = np.flatnonzero(df)
+        if len(used):
+            self.col_max[used] = np.maximum.reduceat(self.col_weights, self.col_starts[used])
+
+        # Mood-tag matches tie across thousands of songs; a fixed jitter far
+        # below any real score difference spreads them over the catalog and
+        # keeps argpartition from degrading on equal keys
+        self._tiebreak = np.random.default_rng(len(rows)).random(len(rows)) * 1e-6
+
+    def query_vector(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalised (features, weights) of a message, keeping only words some song has"""
+        features, tf = np.unique(np.array(self._features(text), dtype=np.int64), return_counts=True)
+        known = self.df[features] > 0
+        features, tf = features[known], tf[known]
+        weights = (1 + np.log(tf)) * self.idf[features]
+        norm = np.sqrt(np.dot(weights, weights))
+        return features, (weights / norm if norm > 0 else weights).astype(np.float32)
+
+    def scores(self, text: str) -> np.ndarray:
+        """Cosine similarity of the message with every song (dense, for inspection)"""
+        features, weights = self.query_vector(text)
+        if not len(features):
+            return np.zeros(self.n_songs, dtype=np.float64)
+
+        starts = self.col_starts[features]
+        ends = self.col_starts[features + 1]
+        rows = np.concatenate([self.col_rows[s:e] for s, e in zip(starts, ends)])
+        contributions = np.concatenate([self.col_weights[s:e] * w for s, e, w in zip(starts, ends, weights)])
+        return np.bincount(rows, weights=contributions, minlength=self.n_songs)
+
+    def _candidates(self, features: np.ndarray, weights: np.ndarray, leading: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted rows of the songs in the first ``leading`` columns, with their exact scores"""
+        starts = self.col_starts[features]
+        ends = self.col_starts[features + 1]
+        if leading == 1:
+            rows = self.col_rows[starts[0]:ends[0]]
+            scores = self.col_weights[starts[0]:ends[0]] * np.float64(weights[0])
+            scored = 1
+        elif (ends[:leading] - starts[:leading]).sum() * 16 < self.n_songs:
+            # Few rows: merge them and look every word up below
+            rows = np.unique(np.concatenate([self.col_rows[start:end] for start, end in zip(starts[:leading], ends[:leading])]))
+            scores = np.zeros(len(rows), dtype=np.float64)
+            scored = 0
+        else:
+            dense = np.zeros(self.n_songs, dtype=np.float64)
+            for start, end, weight in zip(starts[:leading], ends[:leading], weights[:leading]):
+                # Rows are unique within a column, so plain fancy-index adds are safe
+                dense[self.col_rows[start:end]] += self.col_weights[start:end] * np.float64(weight)
+            rows = np.flatnonzero(dense).astype(np.int32)
+            scores = dense[rows]
+            scored = leading
+
+        # The remaining words only add to songs that are already candidates
+        for start, end, weight in zip(starts[scored:], ends[scored:], weights[scored:]):
+            column = self.col_rows[start:end]
+            positions = np.minimum(np.searchsorted(column, rows), len(column) - 1)
+            hit = column[positions] == rows
+            scores[hit] += self.col_weights[start + positions[hit]] * np.float64(weight)
+        return rows, scores
+
+    def _top_k(self, text: str, k: int) -> List[Tuple[int, float]]:
+        features, weights = self.query_vector(text)
+        if k <= 0 or not len(features):
+            return []
+
+        # Words by upper bound, best first. The leading words that already
+        # cover k songs give a first k-th score; every trailing word whose
+        # bounds sum below it (tiebreak included) cannot add a new song to
+        # the top k
+        bounds = weights * self.col_max[features]
+        by_bound = np.argsort(-bounds, kind='stable')
+        features, weights, bounds = features[by_bound], weights[by_bound], bounds[by_bound]
+        sizes = self.col_starts[features + 1] - self.col_starts[features]
+        leading = min(len(features), int(np.searchsorted(np.cumsum(sizes), k)) + 1)
+
+        rows, scores = self._candidates(features, weights, leading)
+        essential = len(features)
+        if len(rows) >= k:
+            threshold = np.partition(scores, len(rows) - k)[len(rows) - k]
+            tail = np.cumsum(bounds[::-1])[::-1]
+            essential = int(np.count_nonzero(tail + 1e-6 >= threshold))
+        if essential > leading:
+            rows, scores = self._candidates(features, weights, essential)
+
+        ranked = scores + self._tiebreak[rows]
+        top = np.argpartition(ranked, -k)[-k:] if k < len(rows) else np.arange(len(rows))
+        order = top[np.argsort(-ranked[top])]
+        return [(int(rows[i]), float(scores[i])) for i in order if scores[i] > 0]
+
+    def top_k(self, text: str, k: int = 3) -> List[Tuple[int, float]]:
+        """Best ``(row, score)`` pairs for a message, highest first (songs with score 0 are dropped)"""
+        key = (' '.join(_TOKEN_RE.findall(text.lower())), k)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return list(cached)
+
+        result = self._top_k(text, k)
+        with self._lock:
+            self.cache_misses += 1
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(result)
+
+    def recommend(self, text: str, k: int = 3, min_score: float = 0.0) -> List[Dict]:
+        """Songs for a message, best match first"""
+        return [self.songs[row] for row, score in self.top_k(text, k) if score >= min_score]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "songs": self.n_songs,
+            "build_ms": round(self.build_ms, 1),
+            "cached_queries": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses
+        }
+
+
+def synthetic_catalog(size: int, seed: int = 42) -> List[Dict]:
+    """Songs shaped like backend/data/songs.json with a realistic title vocabulary"""
+    rng = random.Random(seed)
+    words = ['love', 'night', 'heart', 'fire', 'rain', 'summer', 'blue', 'dream', 'city', 'light',
+             'girl', 'road', 'home', 'forever', 'baby', 'tonight', 'golden', 'wild', 'stars', 'ocean',
+             'dance', 'party', 'tears', 'broken', 'alone', 'sunshine', 'rage', 'slow', 'storm', 'gold']
+    moods = ['Happy', 'Sad', 'Angry', 'Chill', 'Relaxed', 'Energetic', 'Focus']
+    artists = [f"{rng.choice(words).title()} {rng.choice(['Band', 'Kid', 'Project', 'Sounds'])} {i}"
+               for i in range(5000)]
+    return [
+        {
+            'id': f"song_{i}",
+            'title': ' '.join(rng.choice(words) for _ in range(rng.randint(1, 4))).title() + f" {i}",
+            'artist': rng.choice(artists),
+            'mood': rng.choice(moods),
+            'duration': f"{rng.randint(2, 6)}:{rng.randint(0, 59):02d}",
+            'youtubeUrl': f"https://youtube.com/watch?v=synthetic{i}",
+            'thumbnail': f"https://i.ytimg.com/vi/synthetic{i}/hqdefault.jpg"
+        }
+        for i in range(size)
+    ]
+
+
+def benchmark(size: int = 100000, queries: int = 500):
+    """Time matrix build, uncached and cached top-k on a synthetic catalog"""
+    songs = synthetic_catalog(size)
+    recommender = SongRecommender(songs)
+    rng = random.Random(7)
+    messages = [
+        rng.choice(["play some", "i'm feeling", "recommend", "any songs about", "something like"])
+        + f" {rng.choice(['sad', 'happy', 'chill', 'furious', 'rain', 'summer love', 'broken heart', 'workout'])}"
+        + f" {rng.choice(['', 'music', 'songs', 'by ' + rng.choice(songs)['artist']])}"
+        + f" {i}"
+        for i in range(queries)
+    ]
+
+    timings = []
+    for message in messages:
+        start = time.perf_counter()
+        recommender.top_k(message, 3)
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for message in messages:
+        recommender.top_k(message, 3)
+    cached = (time.perf_counter() - start) / len(messages)
+
+    timings.sort()
+    print(f"🎵 {size} songs, {queries} messages")
+    print(f"   Matrix build:   {recommender.build_ms:8.1f} ms ({len(recommender.col_rows)} non-zeros)")
+    print(f"   Top-3 (mean):   {sum(timings) / len(timings) * 1e6:8.1f} µs")
+    print(f"   Top-3 (p99):    {timings[int(len(timings) * 0.99) - 1] * 1e6:8.1f} µs")
+    print(f"   Top-3 (cached): {cached * 1e6:8.1f} µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend songs for a message")
+    parser.add_argument("message", nargs='?', help="Message to find songs for")
+    parser.add_argument("--songs", default=None, help="songs.json to search")
+    parser.add_argument("-k", type=int, default=5, help="Number of songs")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Benchmark on N synthetic songs")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    elif args.message and args.songs:
+        with open(args.songs, 'r', encoding='utf-8') as f:
+            recommender = SongRecommender(json.load(f))
+        for row, score in recommender.top_k(args.message, args.k):
+            song = recommender.songs[row]
+            print(f"{score:.3f}  {song['title']} - {song['artist']} ({song['mood']})")
+    else:
+        parser.print_help()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Text Sanitizer for Mr. Sarcastic
+Compiles prefix stripping, replacement rules and whitespace cleanup into one
+regex alternation applied in a single pass with a replacement callback
+"""
+
+import argparse
+import json
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Profanity toned down in training responses (word-bounded, case-insensitive)
+PROFANITY_RULES = [
+    (r'\bfuck ass\b', ''),
+    (r'\bfuck\b', 'freakin'),
+    (r'\bdumbass\b', 'dummy'),
+    (r'\bstupid ass\b', 'silly'),
+    (r'\bshit\b', 'stuff'),
+    (r'\bass\b', ''),
+]
+
+# Repetitive sarcastic prefixes in the YouTube data
+RESPONSE_PREFIXES = [
+    "Oh wow, let me explain this sarcastically:",
+    "Here's the deal with this shit:",
+    "You know what's funny about this?",
+    "Let me break this down for you:"
+]
+
+# Timestamps and [Music]/[Applause]-style annotations in raw transcripts. The old
+# cleaner removed [m:ss], bare m:ss and the known annotations before any other
+# [...], so those units can neither open nor close a bracketed span.
+_TRANSCRIPT_UNITS = r'\[\d+:\d+\]|\[(?:Music|Applause|Laughter)\]'
+TRANSCRIPT_RULES = [
+    (_TRANSCRIPT_UNITS, ''),
+    (r'\d+:\d+', ''),
+    (rf'\[(?:{_TRANSCRIPT_UNITS}|(?!{_TRANSCRIPT_UNITS})[^\n])*?\]', ''),
+]
+
+
+class TextSanitizer:
+    """
+    Single-pass text cleanup
+
+    All replacement rules are compiled into one alternation; ``re.sub``
+    walks the text once and a callback returns each rule's replacement.
+    Rules are tried in list order at each position, like the sequential
+    ``re.sub`` calls they replace. Leading prefixes are only compared with
+    the start of the text (``str.startswith``, or one anchored match when
+    ignoring case), so they cost nothing on the rest of it.
+    Whitespace is collapsed with ``str.split``, which uses the same
+    whitespace as ``\s`` but runs at C speed.
+
+    collapse_first: collapse whitespace before the prefixes and rules, so
+        spaces in them match any whitespace run
+    collapse_whitespace: collapse whitespace runs to one space and strip
+        the result (otherwise the text is only stripped before the rules)
+    prefixes: literal starters removed from the beginning of the text (the
+        first one that matches, or with ``strip_all_prefixes`` each one in
+        list order), along with the whitespace after them
+    ensure_punctuation: append '.' unless the text ends with . ! or ?
+    max_length: truncate the result to this many characters
+    literal: rules are plain strings rather than regexes; they are applied
+        with chained ``str.replace`` calls in list order, which beats a
+        regex pass with a Python callback for a handful of short strings.
+        With ``ignore_case`` they are compiled into one alternation without
+        groups and replacements are looked up by the lower-cased match
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, str]] = (), prefixes: Sequence[str] = (),
+                 ignore_case: bool = False, collapse_first: bool = False, collapse_whitespace: bool = True,
+                 strip_all_prefixes: bool = False, ensure_punctuation: bool = False,
+                 max_length: Optional[int] = None, literal: bool = False):
+        self.collapse_first = collapse_first
+        self.collapse_whitespace = collapse_whitespace
+        self.ensure_punctuation = ensure_punctuation
+        self.max_length = max_length
+        flags = re.IGNORECASE if ignore_case else 0
+
+        self.prefixes = tuple(prefixes)
+        self.strip_all_prefixes = strip_all_prefixes
+        self.prefix_pattern = None
+        if prefixes and ignore_case:
+            escaped = [re.escape(prefix) for prefix in prefixes]
+            if strip_all_prefixes:
+                prefix_pattern = ''.join(f"(?:{prefix}\\s*)?" for prefix in escaped)
+            else:
+                prefix_pattern = f"(?:{'|'.join(escaped)})\\s*"
+            self.prefix_pattern = re.compile(prefix_pattern, flags)
+
+        self.literal = literal
+        self.ignore_case = ignore_case
+        # Case-sensitive literal rules skip the regex entirely
+        self.literal_rules = tuple(rules) if literal and not ignore_case else None
+        if literal:
+            self.replacements: Dict[str, str] = {self._key(pattern): replacement for pattern, replacement in rules}
+            branches = '|'.join(re.escape(pattern) for pattern, _ in rules)
+        else:
+            self.replacements = {f"r{i}": replacement for i, (_, replacement) in enumerate(rules)}
+            branches = '|'.join(f"(?P<r{i}>{pattern})" for i, (pattern, _) in enumerate(rules))
+        self.pattern = re.compile(branches, flags) if rules and self.literal_rules is None else None
+
+    def _key(self, matched: str) -> str:
+        return matched.lower() if self.ignore_case else matched
+
+    def _replace(self, match: re.Match) -> str:
+        if self.literal:
+            return self.replacements[self._key(match.group())]
+        return self.replacements[match.lastgroup]
+
+    def _strip_prefixes(self, text: str) -> str:
+        if self.prefix_pattern is not None:
+            match = self.prefix_pattern.match(text)
+            return text[match.end():] if match else text
+        for prefix in self.prefixes:
+            if text.startswith(prefix):
+                text = text[len(prefix):].lstrip()
+                if not self.strip_all_prefixes:
+                    break
+        return text
+
+    def clean(self, text: str) -> str:
+        text = ' '.join(text.split()) if self.collapse_first else text.strip()
+
+        if self.prefixes:
+            text = self._strip_prefixes(text)
+
+        if self.literal_rules is not None:
+            for old, new in self.literal_rules:
+                text = text.replace(old, new)
+        elif self.pattern is not None:
+            text = self.pattern.sub(self._replace, text)
+        if self.collapse_whitespace:
+            text = ' '.join(text.split())
+
+        if self.ensure_punctuation and text and text[-1] not in '.!?':
+            text += '.'
+        if self.max_length is not None:
+            text = text[:self.max_length]
+        return text
+
+    def clean_batch(self, texts: Iterable[str]) -> List[str]:
+        """Clean many texts; repeated texts are only cleaned once"""
+        cleaned: Dict[str, str] = {}
+        results = []
+        for text in texts:
+            result = cleaned.get(text)
+            if result is None:
+                result = cleaned[text] = self.clean(text)
+            results.append(result)
+        return results
+
+
+def humor_sanitizer(starters: Sequence[str]) -> TextSanitizer:
+    """YouTubeHumorProcessor.clean_text: drop one starter, tone down profanity, end with punctuation"""
+    return TextSanitizer(PROFANITY_RULES, prefixes=starters, ignore_case=True, collapse_first=True,
+                         ensure_punctuation=True)
+
+
+def transcript_sanitizer() -> TextSanitizer:
+    """Raw transcript cleanup: drop timestamps and bracketed annotations, collapse whitespace"""
+    return TextSanitizer(TRANSCRIPT_RULES)
+
+
+def response_sanitizer() -> TextSanitizer:
+    """Training responses: strip the repeated prefixes and the worst profanity, cap at 200 characters"""
+    rules = [('fuck ass', ''), ('dumbass', 'dummy'), ('stupid ass', 'silly')]
+    return TextSanitizer(rules, prefixes=RESPONSE_PREFIXES, collapse_whitespace=False,
+                         strip_all_prefixes=True, max_length=200, literal=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean texts with the humor sanitizer")
+    parser.add_argument("input_file", help="JSONL file with a text field")
+    parser.add_argument("--field", default="text", help="Field to clean")
+    args = parser.parse_args()
+
+    from process_youtube_data import YouTubeHumorProcessor
+
+    sanitizer = humor_sanitizer(YouTubeHumorProcessor().sarcastic_starters)
+    with open(args.input_file, 'r', encoding='utf-8') as f:
+        texts = [json.loads(line).get(args.field, '') for line in f if line.strip()]
+    for text in sanitizer.clean_batch(texts):
+        print(text)
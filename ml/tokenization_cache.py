@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Tokenization Cache for Mr. Sarcastic
+On-disk store for tokenized training datasets, keyed by fingerprints of the
+tokenizer, prompt template, max_length and data file contents, so training and
+evaluation runs only tokenize a dataset once
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(ML_DIR, 'tokenized_cache')
+
+# Bump when the layout or the way tokenized datasets are built changes
+CACHE_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 20
+# Shard directories list their files in this index (see dataset_shards.py)
+SHARD_INDEX_FILE = 'index.json'
+# File name the tokenize callback's dataset.map writes inside an entry being built
+MAP_CACHE_FILE = 'map-cache.arrow'
+
+
+def render_prompts(examples: Dict[str, List], template: str, **extra) -> List[str]:
+    """Format ``template`` once per row of a batched ``dataset.map`` input"""
+    columns = list(examples.keys())
+    return [template.format(**dict(zip(columns, values)), **extra) for values in zip(*examples.values())]
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """
+    SHA-256 of everything that changes what a tokenizer produces
+
+    Fast tokenizers are hashed through their serialized backend (vocabulary,
+    merges, normalizer, pre-tokenizer, added tokens) minus the truncation and
+    padding state that transformers rewrites on every call; slow tokenizers
+    through their vocabulary. The special tokens (including a pad token set at
+    load time) and padding/truncation sides are added on top.
+    """
+    digest = hashlib.sha256()
+    backend = getattr(tokenizer, 'backend_tokenizer', None)
+    if backend is not None:
+        state = json.loads(backend.to_str())
+        state.pop('truncation', None)
+        state.pop('padding', None)
+        digest.update(json.dumps(state, sort_keys=True).encode('utf-8'))
+    else:
+        digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode('utf-8'))
+
+    config = {
+        'class': type(tokenizer).__name__,
+        'special_tokens': tokenizer.special_tokens_map,
+        'padding_side': getattr(tokenizer, 'padding_side', None),
+        'truncation_side': getattr(tokenizer, 'truncation_side', None),
+        'model_max_length': getattr(tokenizer, 'model_max_length', None),
+    }
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TokenizationCache:
+    """
+    Tokenized datasets stored under ``entries/<key>/``
+
+    The key is a SHA-256 over the data fingerprint, tokenizer fingerprint,
+    prompt template, ``max_length`` and any other tokenizer arguments, so a
+    change to any of them is a miss rather than a stale hit. Entries are
+    written with ``Dataset.save_to_disk`` into a temp directory and renamed
+    into place, and loaded memory-mapped with ``load_from_disk``. Data files
+    are hashed by content; digests are remembered in ``fingerprints.json``
+    by (size, mtime) so an unchanged file is not re-read on every run.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR):
+        self.root = root
+        self.entries_dir = os.path.join(root, 'entries')
+        self.fingerprints_path = os.path.join(root, 'fingerprints.json')
+        os.makedirs(self.entries_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._fingerprints: Dict[str, Dict] = {}
+        if os.path.exists(self.fingerprints_path):
+            try:
+                with open(self.fingerprints_path, 'r', encoding='utf-8') as f:
+                    self._fingerprints = json.load(f)
+            except (OSError, ValueError):
+                self._fingerprints = {}
+
+    def _save_fingerprints(self):
+        tmp_path = f"{self.fingerprints_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._fingerprints, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.fingerprints_path)
+
+    def _file_fingerprint(self, path: str) -> str:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self._fingerprints.get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['digest']
+        digest = _hash_file(path)
+        with self._lock:
+            self._fingerprints[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+            self._save_fingerprints()
+        return digest
+
+    def data_fingerprint(self, data_path: str) -> str:
+        """
+        Content hash of a data file or a data directory
+
+        A shard directory is hashed through its ``index.json`` and the shard
+        files it lists, so anything else written there (e.g. ``cache-*.arrow``
+        files from ``datasets``) does not change the fingerprint. Other
+        directories hash every file except those ``cache-*.arrow`` files.
+        """
+        if not os.path.isdir(data_path):
+            return self._file_fingerprint(data_path)
+        index_path = os.path.join(data_path, SHARD_INDEX_FILE)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                files = [SHARD_INDEX_FILE] + [shard['file'] for shard in json.load(f)['shards']]
+        except (OSError, ValueError, KeyError, TypeError):
+            files = []
+            for dirpath, dirnames, filenames in os.walk(data_path):
+                dirnames.sort()
+                files += [os.path.relpath(os.path.join(dirpath, name), data_path) for name in sorted(filenames)
+                          if not (name.startswith('cache-') and name.endswith('.arrow'))]
+        digest = hashlib.sha256()
+        for name in files:
+            digest.update(name.encode('utf-8'))
+            digest.update(self._file_fingerprint(os.path.join(data_path, name)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def key(self, data_path: str, tokenizer, template: str, max_length: int, **tokenizer_kwargs) -> str:
+        parts = self._key_parts(data_path, tokenizer, template, max_length, tokenizer_kwargs)
+        return self._digest(parts)
+
+    def _key_parts(self, data_path: str, tokenizer, template: str, max_length: int,
+                   tokenizer_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'version': CACHE_VERSION,
+            'data': self.data_fingerprint(data_path),
+            'tokenizer': tokenizer_fingerprint(tokenizer),
+            'template': template,
+            'max_length': max_length,
+            'tokenizer_kwargs': tokenizer_kwargs,
+        }
+
+    @staticmethod
+    def _digest(parts: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.entries_dir, key)
+
+    def _read_meta(self, key: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self._entry_dir(key), 'meta.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, entry_dir: str, meta: Dict):
+        tmp_path = os.path.join(entry_dir, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(entry_dir, 'meta.json'))
+
+    def load(self, key: str):
+        """The cached tokenized dataset for ``key`` (memory-mapped), or None"""
+        meta = self._read_meta(key)
+        if meta is None:
+            return None
+        from datasets import load_from_disk
+
+        try:
+            dataset = load_from_disk(os.path.join(self._entry_dir(key), 'data'))
+        except (OSError, ValueError):
+            return None
+        meta['last_used'] = round(time.time())
+        self._write_meta(self._entry_dir(key), meta)
+        return dataset
+
+    def _tmp_dir(self, key: str) -> str:
+        return f"{self._entry_dir(key)}.{os.getpid()}.tmp"
+
+    def store(self, key: str, dataset, data_path: str, parts: Optional[Dict[str, Any]] = None):
+        """Save a tokenized dataset under ``key`` (atomic), dropping entries built from older versions of the data"""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = self._tmp_dir(key)
+        os.makedirs(tmp_dir, exist_ok=True)
+        dataset.save_to_disk(os.path.join(tmp_dir, 'data'))
+        # The map output the dataset was read from is now copied into data/
+        try:
+            os.remove(os.path.join(tmp_dir, MAP_CACHE_FILE))
+        except OSError:
+            pass
+
+        now = round(time.time())
+        self._write_meta(tmp_dir, {
+            'key': key,
+            'data_path': os.path.abspath(data_path),
+            'rows': len(dataset),
+            'columns': dataset.column_names,
+            'parts': parts or {},
+            'created_at': now,
+            'last_used': now
+        })
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+        # Entries built from an older version of the same data file can never hit again
+        if parts:
+            for entry in self.entries():
+                if (entry['key'] != key and entry.get('data_path') == os.path.abspath(data_path)
+                        and entry.get('parts', {}).get('data') != parts['data']):
+                    shutil.rmtree(self._entry_dir(entry['key']), ignore_errors=True)
+
+    def get_or_tokenize(self, data_path: str, tokenizer, template: str, max_length: int,
+                        tokenize: Callable[[str], Any], **tokenizer_kwargs):
+        """
+        Tokenized dataset for these inputs, from the cache or from ``tokenize()``
+
+        ``tokenize(cache_file_name)`` loads and tokenizes the data; it is only
+        called on a miss and its result is stored before being returned. It
+        should pass ``cache_file_name`` to ``dataset.map`` so the mapped
+        output is written inside the entry being built (and removed once
+        stored) rather than next to the source data. ``tokenizer_kwargs``
+        are the other arguments that shape the output (padding, truncation,
+        ...) and only go into the key.
+        """
+        parts = self._key_parts(data_path, tokenizer, template, max_length, tokenizer_kwargs)
+        key = self._digest(parts)
+
+        dataset = self.load(key)
+        with self._lock:
+            if dataset is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if dataset is not None:
+            return dataset
+
+        tmp_dir = self._tmp_dir(key)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        dataset = tokenize(os.path.join(tmp_dir, MAP_CACHE_FILE))
+        self.store(key, dataset, data_path, parts)
+        # Reload so callers always get the memory-mapped copy
+        return self.load(key) or dataset
+
+    def entries(self) -> List[Dict]:
+        """Metadata of every entry plus its size on disk, most recently used first"""
+        entries = []
+        for key in os.listdir(self.entries_dir):
+            if key.endswith('.tmp'):
+                continue
+            meta = self._read_meta(key)
+            if meta is None:
+                continue
+            meta['bytes'] = _dir_size(self._entry_dir(key))
+            entries.append(meta)
+        return sorted(entries, key=lambda entry: entry.get('last_used', 0), reverse=True)
+
+    def invalidate(self, data_path: Optional[str] = None, key: Optional[str] = None) -> int:
+        """
+        Remove entries built from ``data_path``, the entry ``key``, or (with
+        neither) everything; returns the number of entries removed
+        """
+        data_path = os.path.abspath(data_path) if data_path else None
+        removed = 0
+        for name in os.listdir(self.entries_dir):
+            entry_dir = self._entry_dir(name)
+            if name.endswith('.tmp'):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            if key is not None and name != key:
+                continue
+            if data_path is not None and (self._read_meta(name) or {}).get('data_path') != data_path:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            removed += 1
+
+        with self._lock:
+            if data_path is not None:
+                self._fingerprints = {path: info for path, info in self._fingerprints.items()
+                                      if path != data_path and not path.startswith(data_path + os.sep)}
+            elif key is None:
+                self._fingerprints = {}
+            self._save_fingerprints()
+        return removed
+
+    def size_bytes(self) -> int:
+        return _dir_size(self.entries_dir)
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self.entries()
+        with self._lock:
+            return {
+                'entries': len(entries),
+                'rows': sum(entry.get('rows', 0) for entry in entries),
+                'bytes': sum(entry['bytes'] for entry in entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the tokenization cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Tokenization cache directory")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--invalidate", metavar="DATA_PATH", help="Remove entries built from this data file")
+    group.add_argument("--remove", metavar="KEY", help="Remove one entry")
+    group.add_argument("--clear", action="store_true", help="Remove every entry")
+    args = parser.parse_args()
+
+    cache = TokenizationCache(args.cache_dir)
+    if args.invalidate or args.remove or args.clear:
+        removed = cache.invalidate(data_path=args.invalidate, key=args.remove)
+        print(f"🗑️  Removed {removed} entries")
+
+    for entry in cache.entries():
+        used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.get('last_used', 0)))
+        print(f"   {entry['key'][:12]}  {entry.get('rows', 0):>9} rows  {_format_bytes(entry['bytes']):>10}  "
+              f"max_length={entry.get('parts', {}).get('max_length')}  last used {used}  {entry.get('data_path')}")
+    stats = cache.stats()
+    print(f"📦 {stats['entries']} entries, {stats['rows']} rows, {_format_bytes(stats['bytes'])}")
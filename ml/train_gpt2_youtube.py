@@ -12,6 +12,8 @@ from transformers import GPT2Tokenizer, GPT2LMHeadModel, TextDataset, DataCollat
 from transformers import TrainingArguments, Trainer
 import logging
 
+from training_metrics import TrainingMetricsCallback
+
 # Suppress excessive logging
 logging.getLogger("transformers").setLevel(logging.WARNING)
 
@@ -113,6 +115,7 @@ class SimpleYouTubeTrainer:
             args=training_args,
             data_collator=data_collator,
             train_dataset=train_dataset,
+            callbacks=[TrainingMetricsCallback()],
         )
 
         print(f"🎯 Training for {epochs} epochs...")
@@ -19,6 +19,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from enhanced_model_service import EnhancedSarcasticModel
 from process_youtube_data import YouTubeHumorProcessor
+from training_metrics import METRICS_FILE
 
 # Set up logging
 logging.basicConfig(
@@ -126,7 +127,8 @@ class SarcasticChatbotTrainer:
             processor = YouTubeHumorProcessor(model_type)
             processed_file = processor.process_youtube_dataset(
                 youtube_file,
-                f"processed_training_data_{self.model_key}_{int(time.time())}.jsonl"
+                f"processed_training_data_{self.model_key}_{int(time.time())}.jsonl",
+                streaming=True
             )
             
             # Validate processed data
@@ -192,6 +194,7 @@ class SarcasticChatbotTrainer:
                 json.dump(self.training_config, f, indent=2)
             
             logger.info(f"Fine-tuned model saved to: {final_model_dir}")
+            logger.info(f"Training metrics: {os.path.join(final_model_dir, METRICS_FILE)}")
             return final_model_dir
             
         except Exception as e:
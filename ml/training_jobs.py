@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Training Jobs for Mr. Sarcastic
+Runs fine-tuning as a background job in its own process so the service keeps
+answering chats while it trains: job ids, live progress (step, loss, ETA),
+cancellation, and an atomic switch to the new model when a job succeeds
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from transformers import TrainerCallback
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+# One directory per job (job.json, progress.json, train.log, model/) plus current_model.json
+DEFAULT_JOBS_DIR = os.path.join(ML_DIR, 'training_jobs')
+CURRENT_MODEL_FILE = 'current_model.json'
+# Minimum seconds between progress writes (log steps and the last step are always written)
+PROGRESS_INTERVAL = 1.0
+CANCEL_GRACE_SECONDS = 10
+
+ACTIVE_STATES = ('queued', 'running')
+
+
+def _write_json(path: str, data: Dict):
+    """Write JSON through a temporary file so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class JobProgress:
+    """Progress of a running job, written by the training process to ``<job_dir>/progress.json``"""
+
+    def __init__(self, job_dir: str):
+        self.path = os.path.join(job_dir, 'progress.json')
+        self.data: Dict = {}
+        self.last_write = 0.0
+
+    def update(self, force: bool = True, **fields):
+        self.data.update(fields)
+        now = time.time()
+        if force or now - self.last_write >= PROGRESS_INTERVAL:
+            _write_json(self.path, self.data)
+            self.last_write = now
+
+    def callback(self) -> TrainerCallback:
+        """Trainer callback reporting step, loss and ETA"""
+        return _ProgressCallback(self)
+
+
+class _ProgressCallback(TrainerCallback):
+    def __init__(self, progress: JobProgress):
+        self.progress = progress
+        self.start = time.time()
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start = time.time()
+        self.progress.update(phase='training', step=0, max_steps=state.max_steps)
+
+    def on_step_end(self, args, state, control, **kwargs):
+        elapsed = time.time() - self.start
+        step, max_steps = state.global_step, state.max_steps
+        eta = elapsed / step * (max_steps - step) if step else None
+        self.progress.update(force=step >= max_steps, step=step, max_steps=max_steps, epoch=state.epoch,
+                             train_seconds=elapsed, eta_seconds=eta)
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs and 'loss' in logs:
+            self.progress.update(loss=logs['loss'], learning_rate=logs.get('learning_rate'))
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.progress.update(phase='saving', eta_seconds=0)
+
+
+def _run_job(job_dir: str, target: Callable, kwargs: Dict):
+    """Entry point of the training process: runs ``target(progress, output_dir, **kwargs)``"""
+    # Redirect at the descriptor level so handlers created at import time are captured too
+    log = open(os.path.join(job_dir, 'train.log'), 'a', encoding='utf-8', buffering=1)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log.fileno(), 1)
+    os.dup2(log.fileno(), 2)
+
+    progress = JobProgress(job_dir)
+    progress.update(state='running', phase='starting', pid=os.getpid())
+    try:
+        model_path = target(progress, os.path.join(job_dir, 'model'), **kwargs)
+    except Exception as e:
+        traceback.print_exc()
+        progress.update(state='failed', error=str(e))
+        sys.exit(1)
+    progress.update(state='succeeded', phase='done', model_path=model_path)
+
+
+class TrainingJobManager:
+    """
+    Background training jobs, one at a time, each in a separate process
+
+    ``submit`` starts ``target(progress, output_dir, **kwargs)`` in a new
+    (spawned) process; ``target`` must be a module-level function and
+    should pass ``progress.callback()`` to its ``Trainer`` and save the
+    model to ``output_dir``. A watcher thread waits for the process: on
+    success ``current_model.json`` is replaced atomically and
+    ``on_model_ready(path)`` is called, so requests already being served
+    keep the old model and the next ones get the new one. Cancelling
+    terminates the process and deletes the partial model.
+    """
+
+    def __init__(self, jobs_dir: str = DEFAULT_JOBS_DIR, on_model_ready: Optional[Callable[[str], None]] = None):
+        self.jobs_dir = jobs_dir
+        self.on_model_ready = on_model_ready
+        self.jobs: Dict[str, Dict] = {}
+        self.processes: Dict[str, multiprocessing.Process] = {}
+        self.lock = threading.Lock()
+        self.context = multiprocessing.get_context('spawn')
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    @property
+    def current_model_path(self) -> Optional[str]:
+        """Model produced by the latest successful job (survives restarts)"""
+        path = _read_json(os.path.join(self.jobs_dir, CURRENT_MODEL_FILE)).get('model_path')
+        return path if path and os.path.isdir(path) else None
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _save(self, job: Dict):
+        _write_json(os.path.join(self._job_dir(job['job_id']), 'job.json'), job)
+
+    def active_job(self) -> Optional[str]:
+        with self.lock:
+            for job_id, job in self.jobs.items():
+                if job['state'] in ACTIVE_STATES:
+                    return job_id
+        return None
+
+    def submit(self, target: Callable, description: str = "", **kwargs) -> str:
+        """Start a job and return its id (RuntimeError if another job is still running)"""
+        with self.lock:
+            running = [job_id for job_id, job in self.jobs.items() if job['state'] in ACTIVE_STATES]
+            if running:
+                raise RuntimeError(f"Training job {running[0]} is still running")
+
+            job_id = uuid.uuid4().hex[:12]
+            job_dir = self._job_dir(job_id)
+            os.makedirs(job_dir)
+            job = {
+                'job_id': job_id,
+                'description': description,
+                'state': 'queued',
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'model_path': None,
+                'error': None,
+                'job_dir': job_dir,
+            }
+            process = self.context.Process(target=_run_job, args=(job_dir, target, kwargs),
+                                           name=f"training-{job_id}", daemon=True)
+            process.start()
+            job.update(state='running', started_at=time.time(), pid=process.pid)
+            self.jobs[job_id] = job
+            self.processes[job_id] = process
+            self._save(job)
+
+        threading.Thread(target=self._watch, args=(job_id,), name=f"training-watch-{job_id}", daemon=True).start()
+        return job_id
+
+    def _watch(self, job_id: str):
+        process = self.processes[job_id]
+        process.join()
+        progress = _read_json(os.path.join(self._job_dir(job_id), 'progress.json'))
+
+        with self.lock:
+            job = self.jobs[job_id]
+            del self.processes[job_id]
+            if job['state'] == 'cancelled':
+                return
+            job['finished_at'] = time.time()
+            if process.exitcode == 0 and progress.get('state') == 'succeeded':
+                job.update(state='succeeded', model_path=progress['model_path'])
+                _write_json(os.path.join(self.jobs_dir, CURRENT_MODEL_FILE),
+                            {'job_id': job_id, 'model_path': job['model_path'], 'updated_at': job['finished_at']})
+            else:
+                job.update(state='failed', error=progress.get('error') or f"Training process exited with code {process.exitcode}")
+            self._save(job)
+
+        if job['state'] == 'succeeded' and self.on_model_ready:
+            self.on_model_ready(job['model_path'])
+
+    def cancel(self, job_id: str) -> bool:
+        """Stop a running job; False if it is not running"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            process = self.processes.get(job_id)
+            if not job or job['state'] not in ACTIVE_STATES or process is None:
+                return False
+            job.update(state='cancelled', finished_at=time.time())
+            self._save(job)
+
+        process.terminate()
+        process.join(CANCEL_GRACE_SECONDS)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        shutil.rmtree(os.path.join(self._job_dir(job_id), 'model'), ignore_errors=True)
+        return True
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """Job record merged with its live progress (None for unknown ids)"""
+        with self.lock:
+            job = dict(self.jobs[job_id]) if job_id in self.jobs else None
+        if job is None:
+            job = _read_json(os.path.join(self._job_dir(job_id), 'job.json')) if job_id.isalnum() else {}
+            if not job:
+                return None
+            if job['state'] in ACTIVE_STATES:
+                # Started by an earlier run of the service
+                job['state'] = 'interrupted'
+
+        progress = _read_json(os.path.join(self._job_dir(job_id), 'progress.json'))
+        for name in ('phase', 'step', 'max_steps', 'epoch', 'loss', 'learning_rate', 'train_seconds', 'eta_seconds'):
+            job[name] = progress.get(name)
+        if job['state'] != 'running':
+            job['eta_seconds'] = None
+        job['elapsed_seconds'] = (job['finished_at'] or time.time()) - job['started_at'] if job['started_at'] else None
+        return job
+
+    def list_jobs(self) -> List[Dict]:
+        job_ids = sorted(name for name in os.listdir(self.jobs_dir) if os.path.isdir(self._job_dir(name)))
+        jobs = [self.status(job_id) for job_id in job_ids]
+        return sorted((job for job in jobs if job), key=lambda job: job['created_at'])
+
+
+def format_job(job: Dict) -> str:
+    line = f"{job['job_id']} {job['state']}"
+    if job.get('max_steps'):
+        line += f" step {job['step'] or 0}/{job['max_steps']}"
+    if job.get('loss') is not None:
+        line += f" loss {job['loss']:.4f}"
+    if job.get('eta_seconds'):
+        line += f" ETA {job['eta_seconds']:.0f}s"
+    if job.get('error'):
+        line += f" ({job['error']})"
+    return line
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List training jobs and the model currently served")
+    parser.add_argument("--jobs-dir", default=DEFAULT_JOBS_DIR, help="Training jobs directory")
+    args = parser.parse_args()
+
+    manager = TrainingJobManager(args.jobs_dir)
+    print(f"🧠 Current model: {manager.current_model_path or 'none'}")
+    for job in manager.list_jobs():
+        print(f"   {format_job(job)}")
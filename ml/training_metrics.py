@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Training Metrics for Mr. Sarcastic
+Trainer callback recording throughput and memory per logging step (tokens/sec,
+samples/sec, step time, data-loader wait, peak RSS, padding ratio) to a JSONL
+file in the output directory, with a summary table at the end of training
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import torch
+from transformers import TrainerCallback
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_FILE = "training_metrics.jsonl"
+IGNORE_INDEX = -100
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process so far, in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def batch_tokens(input_ids, attention_mask=None, labels=None) -> Dict[str, int]:
+    """Samples, real tokens and padded positions of one collated batch"""
+    if attention_mask is not None and attention_mask.dim() == 4:
+        # Block-diagonal packing masks: a real token attends at least to itself
+        real = int(attention_mask[:, 0].amax(dim=-1).sum())
+    elif attention_mask is not None:
+        real = int(attention_mask.sum())
+    elif labels is not None:
+        real = int((labels != IGNORE_INDEX).sum())
+    else:
+        real = input_ids.numel()
+    return {"samples": input_ids.shape[0], "tokens": real, "positions": input_ids.numel()}
+
+
+class TrainingMetricsCallback(TrainerCallback):
+    """
+    Throughput, data-loader wait and memory of a ``Trainer`` run
+
+    Batches are counted by a forward pre-hook on the model, so every
+    collator and dataset type is covered. Data-loader wait is the time from
+    the end of one micro-batch (or a log/save) to the next training forward
+    pass: fetching, collating and moving the batch to the device. Each
+    logging step appends the metrics of the steps since the previous one
+    to ``metrics_file`` (default: ``<output_dir>/training_metrics.jsonl``).
+    """
+
+    def __init__(self, metrics_file: Optional[str] = None, print_summary: bool = True):
+        self.metrics_file = metrics_file
+        self.print_summary = print_summary
+        self.records: List[Dict] = []
+        self._hook = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window = {"steps": 0, "samples": 0, "tokens": 0, "positions": 0, "data_wait": 0.0}
+        self.window_start = time.time()
+        self.last_batch_end = self.window_start
+
+    def _mark(self, *args, **kwargs):
+        self.last_batch_end = time.time()
+
+    def _count_batch(self, module, args, kwargs):
+        if not module.training:
+            return
+        self.window["data_wait"] += time.time() - self.last_batch_end
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        if input_ids is not None:
+            for name, value in batch_tokens(input_ids, kwargs.get("attention_mask"), kwargs.get("labels")).items():
+                self.window[name] += value
+
+    def _flush(self, state, logs: Optional[Dict] = None):
+        window = self.window
+        if not window["steps"]:
+            return
+        elapsed = time.time() - self.window_start
+        logs = logs or {}
+        record = {
+            "step": state.global_step,
+            "epoch": state.epoch,
+            "loss": logs.get("loss"),
+            "learning_rate": logs.get("learning_rate"),
+            **window,
+            "elapsed": elapsed,
+            "step_time": elapsed / window["steps"],
+            "tokens_per_sec": window["tokens"] / elapsed if elapsed else 0.0,
+            "samples_per_sec": window["samples"] / elapsed if elapsed else 0.0,
+            "data_wait_fraction": window["data_wait"] / elapsed if elapsed else 0.0,
+            "padding_ratio": 1 - window["tokens"] / window["positions"] if window["positions"] else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if torch.cuda.is_available():
+            record["peak_gpu_mb"] = torch.cuda.max_memory_allocated() / 2**20
+        self.records.append(record)
+
+        if state.is_world_process_zero:
+            with open(self.metrics_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        self._reset_window()
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        if self.metrics_file is None:
+            self.metrics_file = os.path.join(args.output_dir, METRICS_FILE)
+        if state.is_world_process_zero:
+            os.makedirs(os.path.dirname(os.path.abspath(self.metrics_file)), exist_ok=True)
+            open(self.metrics_file, 'w').close()
+        self.records = []
+        if model is not None:
+            self._hook = model.register_forward_pre_hook(self._count_batch, with_kwargs=True)
+        self._reset_window()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.window["steps"] += 1
+        self._mark()
+
+    on_substep_end = _mark
+    on_evaluate = _mark
+    on_save = _mark
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        self._flush(state, logs)
+        self._mark()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self._flush(state)
+        if self._hook is not None:
+            self._hook.remove()
+            self._hook = None
+        if self.print_summary and state.is_world_process_zero and self.records:
+            print(f"\n📊 Training metrics ({self.metrics_file})")
+            print(format_metrics_table(self.records))
+
+
+def load_metrics(path: str) -> List[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records: List[Dict]) -> Dict:
+    """Totals over a run's logged windows"""
+    totals = {name: sum(record[name] for record in records)
+              for name in ("steps", "samples", "tokens", "positions", "data_wait", "elapsed")}
+    elapsed = totals["elapsed"]
+    rss = [record["peak_rss_mb"] for record in records if record.get("peak_rss_mb") is not None]
+    gpu = [record["peak_gpu_mb"] for record in records if record.get("peak_gpu_mb") is not None]
+    losses = [record["loss"] for record in records if record.get("loss") is not None]
+    return {
+        **totals,
+        "step": records[-1]["step"] if records else 0,
+        "loss": losses[-1] if losses else None,
+        "step_time": elapsed / totals["steps"] if totals["steps"] else 0.0,
+        "tokens_per_sec": totals["tokens"] / elapsed if elapsed else 0.0,
+        "samples_per_sec": totals["samples"] / elapsed if elapsed else 0.0,
+        "data_wait_fraction": totals["data_wait"] / elapsed if elapsed else 0.0,
+        "padding_ratio": 1 - totals["tokens"] / totals["positions"] if totals["positions"] else 0.0,
+        "peak_rss_mb": max(rss) if rss else None,
+        "peak_gpu_mb": max(gpu) if gpu else None,
+    }
+
+
+def _row(label: str, record: Dict) -> str:
+    loss = f"{record['loss']:.4f}" if record.get("loss") is not None else "-"
+    rss = f"{record['peak_rss_mb']:.0f}" if record.get("peak_rss_mb") is not None else "-"
+    return (f"{label:>10} {loss:>8} {record['tokens_per_sec']:>10.1f} {record['samples_per_sec']:>10.2f} "
+            f"{record['step_time']:>8.3f} {record['data_wait_fraction']:>7.1%} {record['padding_ratio']:>7.1%} {rss:>9}")
+
+
+def format_metrics_table(records: List[Dict], labels: Optional[List[str]] = None) -> str:
+    """One row per record (labelled by step unless ``labels`` are given) plus a total for a single run"""
+    header = (f"{'step':>10} {'loss':>8} {'tokens/s':>10} {'samples/s':>10} "
+              f"{'step s':>8} {'wait':>7} {'padding':>7} {'RSS MB':>9}")
+    lines = [header, "-" * len(header)]
+    for index, record in enumerate(records):
+        lines.append(_row(labels[index] if labels else str(record["step"]), record))
+    if not labels and records:
+        lines.append("-" * len(header))
+        lines.append(_row("total", summarize(records)))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or compare training metrics files")
+    parser.add_argument("files", nargs="+", help="training_metrics.jsonl files (several: one summary row each)")
+    args = parser.parse_args()
+
+    if len(args.files) == 1:
+        print(format_metrics_table(load_metrics(args.files[0])))
+    else:
+        summaries = [summarize(load_metrics(path)) for path in args.files]
+        labels = [str(index + 1) for index in range(len(args.files))]
+        print(format_metrics_table(summaries, labels))
+        for label, path in zip(labels, args.files):
+            print(f"   {label}: {path}")
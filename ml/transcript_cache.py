@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Transcript Cache for Mr. Sarcastic
+Content-addressed on-disk store for YouTube transcript snippets and video
+metadata, so re-running the data pipeline does not re-download anything
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(ML_DIR, 'transcript_cache')
+
+# use: serve cached entries, download and store misses
+# only: never touch the network; misses return None
+# refresh: always download and overwrite (cached entry kept if the download fails)
+CACHE_MODES = ('use', 'only', 'refresh')
+# How long "this video has no transcript" is remembered before asking again
+DEFAULT_MISSING_TTL_DAYS = 7
+
+
+class TranscriptCache:
+    """
+    Transcripts keyed by (video_id, language) and metadata keyed by video_id
+
+    Payloads are gzip-compressed JSON stored under ``objects/`` by the
+    SHA-256 of their content, so identical payloads share one file and a
+    file never changes once written. ``index.jsonl`` is an append-only log
+    mapping keys to digests (the last line for a key wins); ``compact()``
+    rewrites it with one line per key. Writes are atomic (temp file +
+    rename), so an interrupted run never leaves a truncated entry.
+
+    Videos without a transcript are remembered as negative entries
+    (``missing:<video_id>`` lines with an expiry instead of a digest) for
+    ``missing_ttl`` seconds, so re-runs do not spend requests on them;
+    ``refresh`` mode ignores them.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, mode: str = 'use',
+                 missing_ttl: float = DEFAULT_MISSING_TTL_DAYS * 86400):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}; expected one of {CACHE_MODES}")
+        self.root = root
+        self.mode = mode
+        self.missing_ttl = missing_ttl
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.jsonl')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.missing_hits = 0
+        self._lock = threading.Lock()
+        self._index: Dict[str, str] = {}
+        # missing:<video_id> -> time the negative entry expires
+        self._missing: Dict[str, float] = {}
+        self._load_index()
+
+    @staticmethod
+    def transcript_key(video_id: str, language: str) -> str:
+        return f"transcript:{video_id}:{language}"
+
+    @staticmethod
+    def info_key(video_id: str) -> str:
+        return f"info:{video_id}"
+
+    @staticmethod
+    def missing_key(video_id: str) -> str:
+        return f"missing:{video_id}"
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line from an interrupted append
+                if entry.get('until'):
+                    self._missing[entry['key']] = entry['until']
+                elif entry.get('digest'):
+                    self._index[entry['key']] = entry['digest']
+                else:
+                    self._index.pop(entry['key'], None)
+                    self._missing.pop(entry['key'], None)
+        now = time.time()
+        self._missing = {key: until for key, until in self._missing.items() if until > now}
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], f"{digest[2:]}.json.gz")
+
+    def _read(self, key: str) -> Optional[Any]:
+        digest = self._index.get(key)
+        if digest is None:
+            return None
+        try:
+            with gzip.open(self._object_path(digest), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key: str, payload: Any):
+        data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            # mtime=0 keeps the compressed bytes a pure function of the content
+            with open(tmp_path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._index.get(key) != digest:
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'digest': digest, 'stored_at': round(time.time())}) + '\n')
+                self._index[key] = digest
+            self.stores += 1
+
+    def get_transcript(self, video_id: str, language: str) -> Optional[List[Dict]]:
+        return self._read(self.transcript_key(video_id, language))
+
+    def put_transcript(self, video_id: str, language: str, snippets: List[Dict]):
+        self._write(self.transcript_key(video_id, language), snippets)
+
+    def is_missing(self, video_id: str) -> bool:
+        """True while a negative entry for ``video_id`` has not expired"""
+        with self._lock:
+            return self._missing.get(self.missing_key(video_id), 0) > time.time()
+
+    def _set_missing(self, video_id: str, missing: bool):
+        key = self.missing_key(video_id)
+        with self._lock:
+            if not missing and key not in self._missing:
+                return
+            entry = {'key': key}
+            if missing:
+                entry['until'] = round(time.time() + self.missing_ttl)
+                self._missing[key] = entry['until']
+            else:
+                del self._missing[key]
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def get_info(self, video_id: str) -> Optional[Dict]:
+        return self._read(self.info_key(video_id))
+
+    def put_info(self, video_id: str, info: Dict):
+        self._write(self.info_key(video_id), info)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def transcript(self, video_id: str, languages: Sequence[str],
+                   download: Callable[[], Optional[Tuple[str, List[Dict]]]]) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        ``(language, snippets)`` for the first cached language, else from ``download``
+
+        ``download`` returns ``(language, snippets)``, or None when the
+        video has no transcript, and is only called when the cache mode
+        allows network access. A None from ``download`` is stored as a
+        negative entry; until it expires the video is answered with None
+        without calling ``download`` (except in ``refresh`` mode).
+        """
+        cached = None
+        for language in languages:
+            snippets = self.get_transcript(video_id, language)
+            if snippets is not None:
+                cached = (language, snippets)
+                break
+
+        if self.mode != 'refresh':
+            if cached is None and self.is_missing(video_id):
+                with self._lock:
+                    self.missing_hits += 1
+                return None
+            self._count(cached is not None)
+            if cached is not None or self.mode == 'only':
+                return cached
+
+        downloaded = download()
+        if downloaded is None:
+            if cached is None:
+                self._set_missing(video_id, True)
+            return cached
+        language, snippets = downloaded
+        self.put_transcript(video_id, language, snippets)
+        self._set_missing(video_id, False)
+        return language, snippets
+
+    def info(self, video_id: str, download: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """Video metadata from the cache, else from ``download`` (same modes as ``transcript``)"""
+        cached = self.get_info(video_id)
+        if self.mode != 'refresh':
+            self._count(cached is not None)
+            if cached is not None or self.mode == 'only':
+                return cached
+
+        downloaded = download()
+        if not downloaded:
+            return cached
+        self.put_info(video_id, downloaded)
+        return downloaded
+
+    def compact(self) -> int:
+        """Rewrite the index with one line per live key (expired negative entries dropped); returns the number of keys"""
+        with self._lock:
+            now = time.time()
+            self._missing = {key: until for key, until in self._missing.items() if until > now}
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key, digest in sorted(self._index.items()):
+                    f.write(json.dumps({'key': key, 'digest': digest}) + '\n')
+                for key, until in sorted(self._missing.items()):
+                    f.write(json.dumps({'key': key, 'until': until}) + '\n')
+            os.replace(tmp_path, self.index_path)
+            return len(self._index)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            transcripts = sum(1 for key in self._index if key.startswith('transcript:'))
+            return {
+                'mode': self.mode,
+                'transcripts': transcripts,
+                'videos_with_info': len(self._index) - transcripts,
+                'missing': sum(1 for until in self._missing.values() if until > time.time()),
+                'hits': self.hits,
+                'missing_hits': self.missing_hits,
+                'misses': self.misses,
+                'stores': self.stores
+            }
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser):
+    """--cache-dir / --cache-only / --refresh-cache / --missing-ttl-days for the pipeline scripts"""
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Transcript cache directory")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--cache-only", action="store_true", help="Only use cached transcripts (no network)")
+    group.add_argument("--refresh-cache", action="store_true", help="Re-download and overwrite cached transcripts")
+    parser.add_argument("--missing-ttl-days", type=float, default=DEFAULT_MISSING_TTL_DAYS,
+                        help="Days to remember that a video has no transcript before asking again")
+
+
+def cache_from_args(args: argparse.Namespace) -> TranscriptCache:
+    mode = 'only' if args.cache_only else 'refresh' if args.refresh_cache else 'use'
+    return TranscriptCache(args.cache_dir, mode, missing_ttl=args.missing_ttl_days * 86400)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or compact the transcript cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Transcript cache directory")
+    parser.add_argument("--compact", action="store_true", help="Rewrite the index with one line per key")
+    args = parser.parse_args()
+
+    cache = TranscriptCache(args.cache_dir)
+    if args.compact:
+        print(f"🗜️  Compacted index to {cache.compact()} keys")
+    print(f"📦 {json.dumps(cache.stats())}")
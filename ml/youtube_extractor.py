@@ -6,15 +6,50 @@ Extracts transcripts from YouTube videos and processes them for training
 import os
 import json
 import re
-from typing import List, Dict, Optional
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from youtube_transcript_api import YouTubeTranscriptApi, NoTranscriptFound
 from pytube import YouTube
 import requests
 from urllib.parse import urlparse, parse_qs
+from transcript_cache import TranscriptCache
+from dataset_manifest import DatasetManifest
+from fetch_scheduler import (FetchScheduler, RetryBudgetExhausted, RetryQueue, is_retryable, is_unavailable,
+                             shared_scheduler)
+from text_sanitizer import transcript_sanitizer
+
+STAGES = ('transcript', 'metadata', 'processing')
+TRANSCRIPT_SANITIZER = transcript_sanitizer()
 
 class YouTubeTranscriptExtractor:
-    def __init__(self):
+    def __init__(self, transcript_provider: Optional[Callable[[str], Optional[str]]] = None,
+                 info_provider: Optional[Callable[[str], Dict]] = None, workers: int = 1,
+                 cache: Optional[TranscriptCache] = None, scheduler: Optional[FetchScheduler] = None):
+        """
+        Args:
+            transcript_provider: video_id -> transcript text (defaults to get_transcript)
+            info_provider: video_id -> metadata dict (defaults to get_video_info)
+            workers: videos fetched at once by process_video_list
+            cache: consulted by get_transcript/get_video_info before any download
+            scheduler: rate limit and retries for every outbound call (process-wide one by default)
+        """
         self.processed_videos = []
+        self.cache = cache
+        self.scheduler = scheduler or shared_scheduler()
+        # Custom providers are treated as outbound calls too
+        if transcript_provider is not None:
+            self.transcript_provider = lambda video_id: self.scheduler.call(video_id, transcript_provider, video_id)
+        else:
+            self.transcript_provider = self.get_transcript
+        if info_provider is not None:
+            self.info_provider = lambda video_id: self.scheduler.call(video_id, info_provider, video_id)
+        else:
+            self.info_provider = self.get_video_info
+        self.workers = max(1, workers)
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self._stats_lock = threading.Lock()
         
     def extract_video_id(self, url: str) -> Optional[str]:
         """Extract video ID from various YouTube URL formats"""
@@ -31,49 +66,80 @@ class YouTubeTranscriptExtractor:
         
         return None
 
-    def get_transcript(self, video_id: str, languages=['en', 'en-US']) -> Optional[str]:
-        """Get transcript for a YouTube video"""
+    def _download_transcript(self, video_id: str, languages: List[str]) -> Optional[Tuple[str, List[Dict]]]:
+        """Download ``(language, snippets)`` in the first available preferred language (None if there is none)"""
         try:
             transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-            
-            # Try to get transcript in preferred languages
-            for lang in languages:
-                try:
-                    transcript = transcript_list.find_transcript([lang])
-                    transcript_data = transcript.fetch()
-                    
-                    # Combine all text
-                    full_text = ' '.join([item['text'] for item in transcript_data])
-                    return full_text.strip()
-                except:
-                    continue
-                    
-            # Try auto-generated transcript as fallback
+        except Exception as e:
+            if is_unavailable(e):
+                return None
+            raise
+        
+        # Try to get transcript in preferred languages
+        for lang in languages:
             try:
-                transcript = transcript_list.find_generated_transcript(['en'])
-                transcript_data = transcript.fetch()
-                full_text = ' '.join([item['text'] for item in transcript_data])
-                return full_text.strip()
-            except:
+                transcript = transcript_list.find_transcript([lang])
+                return transcript.language_code, [dict(item) for item in transcript.fetch()]
+            except Exception as e:
+                # Throttling is not "language unavailable"; let the scheduler retry it
+                if is_retryable(e):
+                    raise
+                continue
+                
+        # Try auto-generated transcript as fallback
+        try:
+            transcript = transcript_list.find_generated_transcript(['en'])
+            return transcript.language_code, [dict(item) for item in transcript.fetch()]
+        except Exception as e:
+            if is_unavailable(e):
                 return None
+            raise
+
+    def get_transcript(self, video_id: str, languages=['en', 'en-US']) -> Optional[str]:
+        """Get transcript for a YouTube video (from the cache when one is configured)"""
+        try:
+            def download():
+                return self.scheduler.call(video_id, self._download_transcript, video_id, languages)
+            
+            if self.cache is not None:
+                found = self.cache.transcript(video_id, list(languages) + ['en'], download)
+            else:
+                found = download()
+            if not found:
+                return None
+            
+            # Combine all text
+            _, transcript_data = found
+            full_text = ' '.join([item['text'] for item in transcript_data])
+            return full_text.strip()
                 
+        except RetryBudgetExhausted:
+            raise
         except NoTranscriptFound:
             return None
         except Exception as e:
             print(f"Error getting transcript for {video_id}: {str(e)}")
             return None
 
+    def _download_video_info(self, video_id: str) -> Dict:
+        yt = YouTube(f"https://www.youtube.com/watch?v={video_id}")
+        return {
+            'title': yt.title,
+            'description': yt.description,
+            'length': yt.length,
+            'views': yt.views,
+            'channel': yt.author
+        }
+
     def get_video_info(self, video_id: str) -> Dict:
-        """Get video metadata"""
+        """Get video metadata (from the cache when one is configured)"""
+        def download():
+            return self.scheduler.call(video_id, self._download_video_info, video_id)
+        
         try:
-            yt = YouTube(f"https://www.youtube.com/watch?v={video_id}")
-            return {
-                'title': yt.title,
-                'description': yt.description,
-                'length': yt.length,
-                'views': yt.views,
-                'channel': yt.author
-            }
+            if self.cache is not None:
+                return self.cache.info(video_id, download) or {}
+            return download()
         except Exception as e:
             print(f"Error getting video info for {video_id}: {str(e)}")
             return {}
@@ -83,21 +149,8 @@ class YouTubeTranscriptExtractor:
         if not text:
             return ""
             
-        # Remove timestamps and formatting
-        text = re.sub(r'\[\d+:\d+\]', '', text)
-        text = re.sub(r'\d+:\d+', '', text)
-        
-        # Fix common transcript issues
-        text = text.replace('[Music]', '')
-        text = text.replace('[Applause]', '')
-        text = text.replace('[Laughter]', '')
-        text = re.sub(r'\[.*?\]', '', text)
-        
-        # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
-        
-        return text
+        # Timestamps, [Music]/[Applause]-style annotations and extra whitespace, in one pass
+        return TRANSCRIPT_SANITIZER.clean(text)
 
     def split_into_segments(self, text: str, max_length: int = 200) -> List[str]:
         """Split long transcript into meaningful segments"""
@@ -173,83 +226,188 @@ class YouTubeTranscriptExtractor:
                     
         return training_pairs
 
-    def process_video(self, url: str) -> List[Dict]:
-        """Process a single YouTube video and return training data"""
+    def _timed(self, stage: str, func: Callable, *args) -> Any:
+        """Run one stage and add its duration to stage_seconds"""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.stage_seconds[stage] += elapsed
+
+    def _process(self, url: str, info_pool: Optional[ThreadPoolExecutor] = None) -> Tuple[List[Dict], Optional[Dict]]:
+        """Training pairs and summary entry for one video (metadata fetched alongside the transcript when a pool is given)"""
         video_id = self.extract_video_id(url)
         if not video_id:
             print(f"❌ Could not extract video ID from: {url}")
-            return []
+            return [], None
             
         print(f"🎬 Processing video: {video_id}")
         
+        info_future: Optional[Future] = None
+        if info_pool is not None:
+            info_future = info_pool.submit(self._timed, 'metadata', self.info_provider, video_id)
+        
         # Get transcript
-        transcript = self.get_transcript(video_id)
+        transcript = self._timed('transcript', self.transcript_provider, video_id)
         if not transcript:
+            if info_future is not None:
+                info_future.cancel()
             print(f"❌ No transcript available for video: {video_id}")
-            return []
+            return [], None
             
         # Get video info
-        video_info = self.get_video_info(video_id)
+        if info_future is not None:
+            video_info = dict(info_future.result() or {})
+        else:
+            video_info = dict(self._timed('metadata', self.info_provider, video_id) or {})
         video_info['video_id'] = video_id
         
-        print(f"📝 Got transcript: {len(transcript)} characters")
+        print(f"📝 Got transcript for {video_id}: {len(transcript)} characters")
         print(f"🎥 Title: {video_info.get('title', 'Unknown')}")
         
+        start = time.perf_counter()
         # Clean and process transcript
         clean_text = self.clean_transcript(transcript)
         segments = self.split_into_segments(clean_text)
         
-        print(f"✂️  Split into {len(segments)} segments")
-        
         # Create training pairs
         training_pairs = self.create_training_pairs(segments, video_info)
+        with self._stats_lock:
+            self.stage_seconds['processing'] += time.perf_counter() - start
         
-        print(f"📚 Created {len(training_pairs)} training pairs")
+        print(f"📚 {video_id}: {len(segments)} segments, {len(training_pairs)} training pairs")
         
-        self.processed_videos.append({
+        return training_pairs, {
             'url': url,
             'video_id': video_id,
             'title': video_info.get('title', ''),
             'channel': video_info.get('channel', ''),
             'training_pairs': len(training_pairs)
-        })
-        
+        }
+
+    def process_video(self, url: str) -> List[Dict]:
+        """Process a single YouTube video and return training data"""
+        training_pairs, summary = self._process(url)
+        if summary:
+            self.processed_videos.append(summary)
         return training_pairs
 
-    def process_video_list(self, urls: List[str], output_file: str = "youtube_training_data.jsonl") -> str:
-        """Process multiple YouTube videos and create training dataset"""
-        all_training_data = []
+    def process_video_list(self, urls: List[str], output_file: str = "youtube_training_data.jsonl",
+                           workers: Optional[int] = None, incremental: bool = False) -> str:
+        """
+        Process multiple YouTube videos and create training dataset
         
-        print(f"🚀 Processing {len(urls)} YouTube videos...")
+        With more than one worker, up to ``workers`` videos are fetched at
+        once and each video's transcript and metadata requests overlap.
+        Results are written in the order of ``urls`` either way.
+        
+        The output is tracked by a DatasetManifest. With ``incremental=True``
+        only videos missing from the manifest are processed and appended,
+        videos whose URL is gone are tombstoned and their pairs dropped, and
+        the summary is refreshed from the manifest.
+        
+        All downloads go through the fetch scheduler. Videos that run out of
+        retries are listed in ``<output>.retry.json`` and added to the next
+        run's URLs until they succeed.
+        """
+        workers = max(1, workers or self.workers)
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.scheduler.reset_budgets()
+        retry_queue = RetryQueue(RetryQueue.path_for(output_file))
+        
+        manifest = DatasetManifest(output_file)
+        incremental = manifest.prepare(incremental)
+        
+        queued = len(retry_queue)
+        urls = retry_queue.merge(urls, self.extract_video_id, done=manifest.active())
+        if len(retry_queue):
+            print(f"🔁 Retrying {len(retry_queue)} videos queued by earlier runs")
+        if queued > len(retry_queue):
+            print(f"🧹 Cleared {queued - len(retry_queue)} queued videos already in the dataset")
+        pending, removed_ids = manifest.plan(urls, self.extract_video_id)
+        dropped = manifest.tombstone(removed_ids)
+        
+        if incremental:
+            print(f"📒 Incremental build: {len(pending)} new, {len(removed_ids)} removed "
+                  f"({dropped} pairs dropped), {len(manifest.active())} unchanged")
+        print(f"🚀 Processing {len(pending)} YouTube videos with {workers} worker(s)...")
         print("=" * 60)
         
-        for i, url in enumerate(urls, 1):
-            print(f"\n[{i}/{len(urls)}] Processing: {url}")
+        def process(item):
+            i, url = item
+            print(f"\n[{i}/{len(pending)}] Processing: {url}")
             try:
-                training_pairs = self.process_video(url)
-                all_training_data.extend(training_pairs)
+                training_pairs, summary = self._process(url, info_pool)
+            except RetryBudgetExhausted as e:
+                print(f"⏳ Still throttled, queued for the next run: {url}")
+                retry_queue.add(e.video_id, url, e.last_error)
+                return [], None
             except Exception as e:
                 print(f"❌ Error processing {url}: {str(e)}")
-                continue
-                
-        # Save to JSONL file
-        print(f"\n💾 Saving {len(all_training_data)} training pairs to {output_file}")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for pair in all_training_data:
-                f.write(json.dumps(pair) + '\n')
+                training_pairs, summary = [], None
+            if summary is None:
+                # Not a throttling problem (anymore): retrying next run won't help
+                retry_queue.remove(self.extract_video_id(url))
+            return training_pairs, summary
+        
+        start = time.perf_counter()
+        if workers == 1:
+            info_pool = None
+            results = [process(item) for item in enumerate(pending, 1)]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcript') as pool, \
+                    ThreadPoolExecutor(max_workers=workers, thread_name_prefix='metadata') as info_pool:
+                results = list(pool.map(process, enumerate(pending, 1)))
+        wall_seconds = time.perf_counter() - start
+        
+        added_pairs = 0
+        added_videos = 0
+        for training_pairs, summary in results:
+            if summary:
+                manifest.append(summary['video_id'], summary['url'], training_pairs, meta=summary)
+                retry_queue.remove(summary['video_id'])
+                added_pairs += len(training_pairs)
+                added_videos += 1
+        manifest.save()
+        retry_queue.save()
+        
+        print(f"\n💾 Appended {added_pairs} training pairs to {output_file} "
+              f"({manifest.total_records()} total)")
                 
-        # Save processing summary
+        # Save processing summary (rebuilt from the manifest, so it covers earlier runs too)
+        self.processed_videos = [entry['meta'] for entry in manifest.active_in_order()]
         summary_file = output_file.replace('.jsonl', '_summary.json')
+        timing = {
+            'workers': workers,
+            'wall_seconds': round(wall_seconds, 3),
+            **{f"{stage}_seconds": round(seconds, 3) for stage, seconds in self.stage_seconds.items()}
+        }
         summary = {
             'total_videos': len(urls),
             'processed_videos': len(self.processed_videos),
-            'total_training_pairs': len(all_training_data),
+            'total_training_pairs': manifest.total_records(),
+            'build': {
+                'incremental': incremental,
+                'added_videos': added_videos,
+                'removed_videos': len(removed_ids),
+                'dropped_pairs': dropped
+            },
+            'timing': timing,
             'videos': self.processed_videos
         }
+        summary['fetch'] = {**self.scheduler.stats(), 'queued_for_retry': len(retry_queue)}
+        if self.cache is not None:
+            summary['cache'] = self.cache.stats()
         
         with open(summary_file, 'w', encoding='utf-8') as f:
             json.dump(summary, f, indent=2)
             
+        print(f"⏱️  Wall time {wall_seconds:.1f}s; time spent per stage (summed over workers): "
+              + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in self.stage_seconds.items()))
+        if len(retry_queue):
+            print(f"🔁 {len(retry_queue)} throttled videos queued in {retry_queue.path}")
         print(f"📊 Processing summary saved to {summary_file}")
         print("\n✅ YouTube transcript extraction completed!")
         
@@ -257,7 +415,7 @@ class YouTubeTranscriptExtractor:
 
 def main():
     """Example usage"""
-    extractor = YouTubeTranscriptExtractor()
+    extractor = YouTubeTranscriptExtractor(cache=TranscriptCache())
     
     # Example YouTube Shorts URLs (replace with your actual URLs)
     sample_urls = [
@@ -5,6 +5,7 @@ YouTube Fine-tuning Script for Mr. Sarcastic
 import json
 import os
 from youtube_extractor import YouTubeTranscriptExtractor
+from transcript_cache import TranscriptCache
 from fine_tune_falcon import FalconFineTuner
 
 def train_from_youtube_videos():
@@ -31,12 +32,14 @@ def train_from_youtube_videos():
     
     # Step 1: Extract transcripts from YouTube videos
     print("\n📥 Step 1: Extracting YouTube transcripts...")
-    extractor = YouTubeTranscriptExtractor()
+    # Transcripts already downloaded by a previous run are read from disk
+    extractor = YouTubeTranscriptExtractor(cache=TranscriptCache())
     
     try:
         training_file = extractor.process_video_list(
             youtube_urls, 
-            "youtube_humor_training.jsonl"
+            "youtube_humor_training.jsonl",
+            incremental=True
         )
     except Exception as e:
         print(f"❌ Error extracting YouTube content: {str(e)}")